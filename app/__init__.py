@@ -1,39 +1,93 @@
-from flask import Flask, request
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_socketio import SocketIO
+from werkzeug.middleware.proxy_fix import ProxyFix
 import redis
 from config import config
+from app.utils.log import configure_logging
+from app.utils.db import MeteredQueuePool
 
-db = SQLAlchemy()
+# Pools record checkout waits; SQLite in memory still gets a StaticPool
+db = SQLAlchemy(engine_options={'poolclass': MeteredQueuePool})
 migrate = Migrate()
 jwt = JWTManager()
 socketio = SocketIO(cors_allowed_origins="*")
 redis_client = None
 
+def fanout_options(app):
+    """Socket.IO options for a Redis queue that routes room broadcasts by shard"""
+    url = app.config['SOCKETIO_MESSAGE_QUEUE']
+    shards = app.config.get('SOCKETIO_FANOUT_SHARDS', 0)
+    if not url or not shards or not url.startswith(('redis://', 'rediss://')):
+        return {}
+    from app.utils.fanout import ShardedRedisManager
+    return {'client_manager': ShardedRedisManager(url, shards=shards)}
+
 def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     
-    # Debug middleware to log raw request data
-    @app.before_request
-    def log_request_info():
-        print(f"Request Headers: {dict(request.headers)}")
-        print(f"Request Data: {request.get_data(as_text=True)}")
+    # Queue-based logging; request bodies are only logged for opted-in routes
+    configure_logging(app)
     
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
     CORS(app, origins=app.config['CORS_ORIGINS'])
-    socketio.init_app(app, async_mode='eventlet', message_queue=app.config['REDIS_URL'])
+    socketio.init_app(app, async_mode=app.config['SOCKETIO_ASYNC_MODE'], message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'],
+                      **fanout_options(app))
+    
+    # Outermost, so Socket.IO requests see the client address too
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'],
+                                x_proto=app.config['PROXY_FIX_X_FOR'])
     
     # Initialize Redis
     global redis_client
     redis_client = redis.from_url(app.config['REDIS_URL'])
     
+    # Initialize services
+    from app.services.replica import replica
+    replica.init_app(app)
+    from app.services.passwords import passwords
+    passwords.init_app(app)
+    from app.services.sequences import room_sequences
+    room_sequences.init_app(app, redis_client)
+    from app.services.write_behind import write_behind
+    write_behind.init_app(app, redis_client)
+    from app.services.history_cache import history_cache
+    history_cache.init_app(app, redis_client)
+    from app.services.sessions import user_sessions
+    user_sessions.init_app(app, redis_client)
+    from app.services.typing import typing_aggregator
+    typing_aggregator.init_app(app)
+    from app.services.presence import presence
+    presence.init_app(app, redis_client)
+    from app.services.stats import stats_counters
+    stats_counters.init_app(app, redis_client)
+    from app.services.user_cache import user_cache
+    user_cache.init_app(app, redis_client)
+    from app.services.wire import wire
+    wire.init_app(app, redis_client)
+    from app.services.idempotency import idempotency
+    idempotency.init_app(app, redis_client)
+    from app.services.search import search
+    search.init_app(app)
+    from app.services.read_markers import read_markers
+    read_markers.init_app(app, redis_client)
+    from app.services.membership import membership
+    membership.init_app(app, redis_client)
+    from app.services.archive import archiver
+    archiver.init_app(app, redis_client)
+    from app.services.rate_limit import rate_limiter
+    rate_limiter.init_app(app, redis_client)
+    from app.services.metrics import metrics
+    metrics.init_app(app, redis_client)
+    
     # Register blueprints
     from app.routes.auth import auth_bp
     from app.routes.chat import chat_bp
@@ -43,6 +97,10 @@ def create_app(config_name='default'):
     app.register_blueprint(chat_bp, url_prefix='/api/chat')
     app.register_blueprint(api_bp, url_prefix='/api')
     
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+    
     # Register Socket.IO events
     from app.events.chat_events import register_events
     register_events(socketio)
@@ -52,4 +110,9 @@ def create_app(config_name='default'):
     def health_check():
         return {'status': 'healthy', 'service': 'flashchat'}, 200
     
+    # Prometheus metrics for this worker process
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return metrics.scrape()
+    
     return app
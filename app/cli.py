@@ -0,0 +1,70 @@
+import click
+from flask.cli import AppGroup
+
+search_cli = AppGroup('search', help='Manage the message search index.')
+
+
+@search_cli.command('reindex')
+def reindex_command():
+    """Create the search index if needed and rebuild it from all messages."""
+    from app.services.search import search
+    count = search.reindex()
+    click.echo(f'Indexed {count} messages')
+
+
+rooms_cli = AppGroup('rooms', help='Manage chat rooms.')
+
+
+@rooms_cli.command('backfill-members')
+def backfill_members_command():
+    """Make every room's creator its owner member, for rooms created before memberships existed."""
+    from sqlalchemy import select
+    from app import db
+    from app.models.message import Room, RoomMember
+    from app.services.membership import membership
+
+    missing = db.session.execute(
+        select(Room.id, Room.created_by).where(~select(RoomMember.id).where(
+            RoomMember.room_id == Room.id, RoomMember.user_id == Room.created_by).exists())
+    ).all()
+    for room_id, user_id in missing:
+        membership.add(room_id, user_id, role='owner')
+    click.echo(f'Added {len(missing)} room owners')
+
+
+archive_cli = AppGroup('archive', help='Archive and expire old messages.')
+
+
+@archive_cli.command('run')
+@click.option('--room-id', type=int, multiple=True, help='Only these rooms; repeat for several.')
+def archive_run_command(room_id):
+    """Move old messages to the archive and delete expired ones now."""
+    from app.services.archive import archiver
+    result = archiver.run(room_ids=list(room_id) or None)
+    click.echo(f"Archived {result['archived']} messages, purged {result['purged']}")
+
+
+@archive_cli.command('retention')
+@click.argument('room_id', type=int)
+@click.option('--archive-after-days', type=int, help='Days a message stays in the hot table; 0 for the default.')
+@click.option('--retention-days', type=int, help='Days before a message is deleted; 0 for the default.')
+def archive_retention_command(room_id, archive_after_days, retention_days):
+    """Show or change a room's archive and retention settings."""
+    from app import db
+    from app.models.message import Room
+    room = db.session.get(Room, room_id)
+    if room is None:
+        raise click.ClickException(f'Room {room_id} not found')
+    if archive_after_days is not None:
+        room.archive_after_days = archive_after_days or None
+    if retention_days is not None:
+        room.retention_days = retention_days or None
+    db.session.commit()
+    click.echo(f'Room {room.id}: archive after {room.archive_after_days or "default"} days, '
+               f'retention {room.retention_days or "default"} days, archived until {room.archived_until}')
+
+
+def register_commands(app):
+    app.cli.add_command(search_cli)
+    app.cli.add_command(rooms_cli)
+    app.cli.add_command(archive_cli)
@@ -1,15 +1,81 @@
-from flask import request
-from flask_socketio import emit, join_room, leave_room, disconnect
+import functools
+import logging
+from flask import request, current_app
+from flask_socketio import emit, join_room, leave_room, disconnect, rooms
 from flask_jwt_extended import decode_token
-from app import db, redis_client
-from app.models.user import User
+from app import db
 from app.models.message import Message, Room
+from app.services.messages import (after_message_sent, after_messages_sent, persist_message, persist_messages,
+                                   replay_messages, find_message, can_delete, edit_message, delete_message)
+from app.services.idempotency import idempotency
+from app.services.membership import membership
+from app.services.read_markers import read_markers
+from app.services.sequences import room_sequences
+from app.services.sessions import user_sessions
+from app.services.typing import typing_aggregator
+from app.services.presence import presence
+from app.services.rate_limit import rate_limit_event
+from app.services.metrics import metrics
+from app.services.user_cache import user_cache
+from app.services.wire import wire, format_room, COMPACT
 import json
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+def release_db_session(handler):
+    """Return the handler's pooled connection as soon as it finishes.
+    
+    Flask-SocketIO runs each event in a fresh app context, so ``db.session``
+    is already scoped to the green thread handling it and removed at
+    teardown. When a context is already active it is reused instead, and the
+    session would stay checked out, possibly in a failed transaction after
+    an error the handler turned into an ``error`` event.
+    """
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            db.session.remove()
+    return wrapper
+
+def session_user(data):
+    """Rate limit key for per-user limits; None lets the handler reject the sid"""
+    session = user_sessions.get(request.sid)
+    return session.user_id if session else None
+
+def data_room(data):
+    """Rate limit key for per-room limits"""
+    return int(data['room_id'])
+
+def batch_size(data):
+    """Rate limit cost of a send_messages batch"""
+    items = data.get('messages')
+    return max(1, len(items)) if isinstance(items, list) else 1
+
 def register_events(socketio):
     
+    def send_replay(session, last_seqs):
+        """Emit one ``replay`` event with what was missed in each room.
+        
+        ``last_seqs`` maps room IDs to the last sequence number the client
+        has seen. Messages are encoded for the client's wire format.
+        """
+        limit = current_app.config['REPLAY_MAX_MESSAGES']
+        replayed = []
+        for room_id, last_seq in last_seqs.items():
+            messages, has_more = replay_messages(room_id, last_seq, limit)
+            replayed.append({
+                'room_id': int(room_id),
+                'messages': wire.encode_batch(messages, session.wire_format),
+                'has_more': has_more
+            })
+        emit('replay', {'rooms': replayed})
+    
     @socketio.on('connect')
+    @metrics.observe_event
+    @release_db_session
     def handle_connect(auth):
         """Handle client connection"""
         try:
@@ -20,61 +86,67 @@ def register_events(socketio):
             
             token_data = decode_token(auth['token'])
             user_id = token_data['sub']
-            user = User.query.get(user_id)
+            user = user_cache.get(user_id)
             
             if not user:
                 disconnect()
                 return False
             
-            # Store user session
-            redis_client.hset(f'user_session:{request.sid}', mapping={
-                'user_id': user_id,
-                'username': user.username,
-                'display_name': user.display_name
-            })
+            # Store user session with the negotiated broadcast encoding
+            wire_format = wire.negotiate(auth.get('format'))
+            session = user_sessions.create(request.sid, user_id, user.username, user.display_name, wire_format)
             
             # Update user status
-            user.is_online = True
-            db.session.commit()
+            presence.connect(user.id)
             
-            emit('connected', {'message': f'Welcome, {user.display_name}!'})
+            emit('connected', {'message': f'Welcome, {user.display_name}!', 'format': wire_format})
+            
+            # A reconnecting client sends {room_id: last_seq} to rejoin its
+            # rooms and get only the messages it missed
+            resume = auth.get('resume')
+            if resume:
+                last_seqs = {int(room_id): int(last_seq) for room_id, last_seq in resume.items()}
+                found = [room_id for room_id in last_seqs if membership.is_member(room_id, user.id)]
+                for room_id in found:
+                    join_room(str(room_id))
+                    join_room(format_room(room_id, wire_format))
+                    if wire_format == COMPACT:
+                        emit('room_users', {'r': room_id, 'users': wire.room_users(room_id)})
+                send_replay(session, {room_id: last_seqs[room_id] for room_id in found})
             
         except Exception as e:
-            print(f"Connection error: {e}")
+            logger.warning('Connection error: %s', e)
             disconnect()
             return False
     
     @socketio.on('disconnect')
+    @metrics.observe_event
+    @release_db_session
     def handle_disconnect():
         """Handle client disconnection"""
         try:
-            # Get user session
-            session_data = redis_client.hgetall(f'user_session:{request.sid}')
-            if session_data:
-                user_id = session_data.get(b'user_id') or session_data.get('user_id')
-                if user_id:
-                    user = User.query.get(int(user_id))
-                    if user:
-                        user.is_online = False
-                        user.update_last_seen()
-            
             # Clean up session
-            redis_client.delete(f'user_session:{request.sid}')
+            session = user_sessions.remove(request.sid)
+            if session:
+                presence.disconnect(session.user_id)
             
         except Exception as e:
-            print(f"Disconnect error: {e}")
+            logger.warning('Disconnect error: %s', e)
     
     @socketio.on('join_room')
+    @metrics.observe_event
+    @release_db_session
+    @rate_limit_event('join_room', session_user)
     def handle_join_room(data):
         """Handle user joining a room"""
         try:
-            session_data = redis_client.hgetall(f'user_session:{request.sid}')
-            if not session_data:
+            session = user_sessions.get(request.sid)
+            if not session:
                 emit('error', {'message': 'Invalid session'})
                 return
             
             room_id = str(data['room_id'])
-            username = (session_data.get(b'username') or session_data.get('username')).decode() if isinstance(session_data.get(b'username') or session_data.get('username'), bytes) else session_data.get(b'username') or session_data.get('username')
+            username = session.username
             
             # Verify room exists
             room = Room.query.get(int(room_id))
@@ -82,7 +154,16 @@ def register_events(socketio):
                 emit('error', {'message': 'Room not found'})
                 return
             
+            # Public rooms are joined on first use, private ones need an invite
+            if not membership.ensure(room, session.user_id):
+                emit('error', {'message': 'Access denied'})
+                return
+            room_name = room.name
+            # Don't hold a pooled connection across the emits below
+            db.session.close()
+            
             join_room(room_id)
+            join_room(format_room(room_id, session.wire_format))
             
             # Notify room about new user
             emit('user_joined', {
@@ -91,23 +172,33 @@ def register_events(socketio):
                 'timestamp': datetime.utcnow().isoformat()
             }, room=room_id)
             
-            emit('room_joined', {'room_id': room_id, 'room_name': room.name})
+            emit('room_joined', {'room_id': room_id, 'room_name': room_name})
+            if session.wire_format == COMPACT:
+                emit('room_users', {'r': int(room_id), 'users': wire.room_users(room_id)})
+            
+            # Rejoining with a known position replays only the gap
+            if data.get('last_seq') is not None:
+                send_replay(session, {int(room_id): int(data['last_seq'])})
             
         except Exception as e:
             emit('error', {'message': f'Error joining room: {str(e)}'})
     
     @socketio.on('leave_room')
+    @metrics.observe_event
+    @release_db_session
     def handle_leave_room(data):
         """Handle user leaving a room"""
         try:
-            session_data = redis_client.hgetall(f'user_session:{request.sid}')
-            if not session_data:
+            session = user_sessions.get(request.sid)
+            if not session:
                 return
             
             room_id = str(data['room_id'])
-            username = (session_data.get(b'username') or session_data.get('username')).decode() if isinstance(session_data.get(b'username') or session_data.get('username'), bytes) else session_data.get(b'username') or session_data.get('username')
+            username = session.username
             
             leave_room(room_id)
+            leave_room(format_room(room_id, session.wire_format))
+            typing_aggregator.update(room_id, username, False)
             
             # Notify room about user leaving
             emit('user_left', {
@@ -120,15 +211,19 @@ def register_events(socketio):
             emit('error', {'message': f'Error leaving room: {str(e)}'})
     
     @socketio.on('send_message')
+    @metrics.observe_event
+    @release_db_session
+    @rate_limit_event('send_message', session_user)
+    @rate_limit_event('room_send', data_room)
     def handle_message(data):
         """Handle sending a message"""
         try:
-            session_data = redis_client.hgetall(f'user_session:{request.sid}')
-            if not session_data:
+            session = user_sessions.get(request.sid)
+            if not session:
                 emit('error', {'message': 'Invalid session'})
                 return
             
-            user_id = int(session_data.get(b'user_id') or session_data.get('user_id'))
+            user_id = session.user_id
             room_id = data['room_id']
             content = data['content'].strip()
             
@@ -136,39 +231,260 @@ def register_events(socketio):
                 emit('error', {'message': 'Message cannot be empty'})
                 return
             
-            # Create and save message
-            message = Message(
+            if not membership.is_member(room_id, user_id):
+                emit('error', {'message': 'Not a member of this room'})
+                return
+            
+            # With write-behind this only queues the row, so the broadcast
+            # goes out before the next batch is written
+            payload = persist_message(
                 content=content,
                 user_id=user_id,
-                room_id=room_id
+                room_id=room_id,
+                username=session.username,
+                display_name=session.display_name
             )
             
-            db.session.add(message)
-            db.session.commit()
-            
             # Broadcast message to room
-            emit('message', message.to_dict(), room=str(room_id))
+            after_message_sent(payload)
+            wire.broadcast_message(payload, emit)
             
         except Exception as e:
             emit('error', {'message': f'Error sending message: {str(e)}'})
     
+    @socketio.on('send_messages')
+    @metrics.observe_event
+    @release_db_session
+    @rate_limit_event('send_message', session_user, cost=batch_size)
+    @rate_limit_event('room_send', data_room, cost=batch_size)
+    def handle_send_messages(data):
+        """Handle a batch of messages for one room.
+        
+        Each item is ``{'client_id': ..., 'content': ...}`` where client_id is
+        the client's idempotency key. New messages are stored in one
+        transaction and broadcast as one ``messages`` event; the ack maps each
+        client_id to its server ID. Retried client_ids are acknowledged as
+        duplicates without being stored again.
+        """
+        def reject(message):
+            emit('error', {'message': message})
+            return {'error': message}
+        
+        try:
+            session = user_sessions.get(request.sid)
+            if not session:
+                return reject('Invalid session')
+            
+            room_id = int(data['room_id'])
+            items = data.get('messages')
+            max_size = current_app.config['MESSAGE_BATCH_MAX_SIZE']
+            
+            if not isinstance(items, list) or not items:
+                return reject('messages must be a non-empty list')
+            if len(items) > max_size:
+                return reject(f'At most {max_size} messages per batch')
+            
+            # A key repeated within the batch is sent once
+            batch = {}
+            for item in items:
+                if not isinstance(item, dict):
+                    return reject('Each message must be an object')
+                client_id = str(item.get('client_id') or '')
+                content = str(item.get('content') or '').strip()
+                if not client_id or len(client_id) > 64:
+                    return reject('Each message needs a client_id of at most 64 characters')
+                if not content:
+                    return reject('Message cannot be empty')
+                batch.setdefault(client_id, content)
+            
+            if not membership.is_member(room_id, session.user_id):
+                return reject('Not a member of this room')
+            
+            duplicates = idempotency.claim(session.user_id, list(batch))
+            fresh = [client_id for client_id in batch if client_id not in duplicates]
+            message_ids = {}
+            if fresh:
+                try:
+                    payloads = persist_messages(
+                        [batch[client_id] for client_id in fresh],
+                        user_id=session.user_id,
+                        room_id=room_id,
+                        username=session.username,
+                        display_name=session.display_name
+                    )
+                except Exception:
+                    idempotency.release(session.user_id, fresh)
+                    raise
+                message_ids = {client_id: payload['id'] for client_id, payload in zip(fresh, payloads)}
+                idempotency.record(session.user_id, message_ids)
+                after_messages_sent(room_id, payloads)
+                wire.broadcast_messages(room_id, payloads, emit)
+            
+            return {
+                'room_id': room_id,
+                'acks': [{
+                    'client_id': client_id,
+                    'id': message_ids.get(client_id, duplicates.get(client_id)),
+                    'duplicate': client_id in duplicates
+                } for client_id in batch]
+            }
+            
+        except Exception as e:
+            return reject(f'Error sending messages: {str(e)}')
+    
+    @socketio.on('edit_message')
+    @metrics.observe_event
+    @release_db_session
+    @rate_limit_event('send_message', session_user)
+    def handle_edit_message(data):
+        """Edit one of the sender's messages.
+        
+        ``{'message_id', 'content'}``; the room gets a ``message_edited``
+        delta and the ack is the same delta.
+        """
+        def reject(message):
+            emit('error', {'message': message})
+            return {'error': message}
+        
+        try:
+            session = user_sessions.get(request.sid)
+            if not session:
+                return reject('Invalid session')
+            
+            content = str(data['content']).strip()
+            if not content:
+                return reject('Message cannot be empty')
+            
+            message = find_message(int(data['message_id']))
+            if not message or message.deleted_at:
+                return reject('Message not found')
+            if message.user_id != session.user_id or not membership.is_member(message.room_id, session.user_id):
+                return reject('Only the author can edit a message')
+            
+            change = edit_message(message, content)
+            if change is None:
+                return reject('Message was changed by another request')
+            wire.broadcast_change('message_edited', change, emit)
+            return change
+            
+        except Exception as e:
+            return reject(f'Error editing message: {str(e)}')
+    
+    @socketio.on('delete_message')
+    @metrics.observe_event
+    @release_db_session
+    @rate_limit_event('send_message', session_user)
+    def handle_delete_message(data):
+        """Delete a message, leaving a tombstone.
+        
+        ``{'message_id'}``; the room gets a ``message_deleted`` delta and the
+        ack is the same delta.
+        """
+        def reject(message):
+            emit('error', {'message': message})
+            return {'error': message}
+        
+        try:
+            session = user_sessions.get(request.sid)
+            if not session:
+                return reject('Invalid session')
+            
+            message = find_message(int(data['message_id']))
+            if not message or message.deleted_at:
+                return reject('Message not found')
+            if not can_delete(message, session.user_id):
+                return reject('Access denied')
+            
+            change = delete_message(message)
+            if change is None:
+                return reject('Message not found')
+            wire.broadcast_change('message_deleted', change, emit)
+            return change
+            
+        except Exception as e:
+            return reject(f'Error deleting message: {str(e)}')
+    
+    @socketio.on('resume')
+    @metrics.observe_event
+    @release_db_session
+    def handle_resume(data):
+        """Replay missed messages for rooms this socket has joined.
+        
+        Takes ``{'rooms': {room_id: last_seq}}``; used to continue a replay
+        that came back with ``has_more``.
+        """
+        try:
+            session = user_sessions.get(request.sid)
+            if not session:
+                emit('error', {'message': 'Invalid session'})
+                return
+            
+            joined = set(rooms())
+            send_replay(session, {
+                int(room_id): int(last_seq)
+                for room_id, last_seq in data['rooms'].items()
+                if str(room_id) in joined
+            })
+            
+        except Exception as e:
+            emit('error', {'message': f'Error resuming: {str(e)}'})
+    
+    @socketio.on('mark_read')
+    @metrics.observe_event
+    @release_db_session
+    def handle_mark_read(data):
+        """Move the user's read marker in a room up to a message.
+        
+        Takes ``{'room_id', 'message_id', 'seq'}``; ``seq`` is looked up when
+        omitted, and capped at the room's last handed-out seq when given, so
+        a client can't mark messages read before they exist. Markers only
+        move forward and reach the database in batches, so clients may send
+        this freely while scrolling.
+        """
+        try:
+            session = user_sessions.get(request.sid)
+            if not session:
+                emit('error', {'message': 'Invalid session'})
+                return
+            
+            room_id = int(data['room_id'])
+            message_id = int(data['message_id'])
+            if not membership.is_member(room_id, session.user_id):
+                emit('error', {'message': 'Not a member of this room'})
+                return
+            
+            seq = data.get('seq')
+            if seq is None:
+                seq = db.session.query(Message.seq).filter_by(id=message_id, room_id=room_id).scalar()
+                if seq is None:
+                    emit('error', {'message': 'Message not found'})
+                    return
+            else:
+                seq = min(int(seq), room_sequences.current(room_id))
+            
+            advanced = read_markers.mark_read(session.user_id, room_id, int(seq), message_id)
+            return {'room_id': room_id, 'seq': int(seq), 'advanced': advanced}
+            
+        except Exception as e:
+            emit('error', {'message': f'Error marking read: {str(e)}'})
+    
     @socketio.on('typing')
+    @metrics.observe_event
+    @release_db_session
+    @rate_limit_event('typing', session_user)
     def handle_typing(data):
         """Handle typing indicator"""
         try:
-            session_data = redis_client.hgetall(f'user_session:{request.sid}')
-            if not session_data:
+            session = user_sessions.get(request.sid)
+            if not session:
                 return
             
             room_id = str(data['room_id'])
-            username = (session_data.get(b'username') or session_data.get('username')).decode() if isinstance(session_data.get(b'username') or session_data.get('username'), bytes) else session_data.get(b'username') or session_data.get('username')
+            username = session.username
             is_typing = data.get('is_typing', False)
             
-            # Broadcast typing status to room (excluding sender)
-            emit('typing', {
-                'username': username,
-                'is_typing': is_typing
-            }, room=room_id, include_self=False)
+            # Collapsed into one typing_update per room per tick
+            typing_aggregator.update(room_id, username, is_typing)
             
         except Exception as e:
-            print(f"Typing error: {e}")
\ No newline at end of file
+            logger.warning('Typing error: %s', e)
\ No newline at end of file
@@ -1,2 +1,2 @@
 from .user import User
-from .message import Message, Room
\ No newline at end of file
+from .message import Message, Room, RoomMember, ArchivedMessage
@@ -8,9 +8,16 @@ class Room(db.Model):
     is_private = db.Column(db.Boolean, default=False)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Days a message stays in the hot table before it is archived, and days
+    # before it is deleted for good; None uses the app defaults
+    archive_after_days = db.Column(db.Integer)
+    retention_days = db.Column(db.Integer)
+    # Newest timestamp moved to the archive; older cursors read from there
+    archived_until = db.Column(db.DateTime)
     
     # Relationships
     messages = db.relationship('Message', backref='room', lazy='dynamic', cascade='all, delete-orphan')
+    members = db.relationship('RoomMember', backref='room', lazy='dynamic', cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -23,6 +30,31 @@ class Room(db.Model):
             'message_count': self.messages.count()
         }
 
+class RoomMember(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    room_id = db.Column(db.Integer, db.ForeignKey('room.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    role = db.Column(db.String(20), default='member')  # owner, member
+    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_read_seq = db.Column(db.Integer, default=0)  # Last room seq the member has read
+    last_read_message_id = db.Column(db.Integer)
+    
+    __table_args__ = (
+        # Serves "my rooms" in room order and single membership lookups
+        db.UniqueConstraint('user_id', 'room_id', name='uq_room_member_user_room'),
+        db.Index('ix_room_member_room_user', 'room_id', 'user_id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'room_id': self.room_id,
+            'user_id': self.user_id,
+            'role': self.role,
+            'joined_at': self.joined_at.isoformat(),
+            'last_read_seq': self.last_read_seq,
+            'last_read_message_id': self.last_read_message_id
+        }
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -31,6 +63,16 @@ class Message(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     message_type = db.Column(db.String(20), default='text')  # text, image, file, etc.
     edited_at = db.Column(db.DateTime)
+    seq = db.Column(db.Integer)  # Per-room sequence number, see services.sequences
+    # Deleted messages stay as tombstones with no content, keeping their seq
+    deleted_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # Serves history reads and keyset pagination within a room
+        db.Index('ix_message_room_timestamp_id', 'room_id', 'timestamp', 'id'),
+        # Serves missed-message replay after a reconnect
+        db.Index('ix_message_room_seq', 'room_id', 'seq'),
+    )
     
     def to_dict(self):
         return {
@@ -42,5 +84,46 @@ class Message(db.Model):
             'room_id': self.room_id,
             'timestamp': self.timestamp.isoformat(),
             'message_type': self.message_type,
-            'edited_at': self.edited_at.isoformat() if self.edited_at else None
+            'edited_at': self.edited_at.isoformat() if self.edited_at else None,
+            'seq': self.seq,
+            'deleted_at': self.deleted_at.isoformat() if self.deleted_at else None
+        }
+
+class ArchivedMessage(db.Model):
+    """A message moved out of the hot ``message`` table by the archiver"""
+    __tablename__ = 'message_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    room_id = db.Column(db.Integer, db.ForeignKey('room.id'), nullable=False)
+    timestamp = db.Column(db.DateTime)
+    message_type = db.Column(db.String(20), default='text')
+    edited_at = db.Column(db.DateTime)
+    seq = db.Column(db.Integer)
+    deleted_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_message_archive_room_timestamp_id', 'room_id', 'timestamp', 'id'),
+    )
+
+class MessageRevision(db.Model):
+    """Content a message had before one of its edits"""
+    __tablename__ = 'message_revision'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key: revisions follow their message into the archive
+    message_id = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    replaced_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_message_revision_message_id', 'message_id', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'content': self.content,
+            'replaced_at': self.replaced_at.isoformat()
         }
@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from app.services.passwords import passwords
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -18,11 +18,22 @@ class User(db.Model):
     
     def set_password(self, password):
         """Hash and set the password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
     
     def check_password(self, password):
         """Check if provided password matches the hash"""
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+    
+    def upgrade_password(self, password):
+        """Rehash a just-verified password made with an outdated algorithm or cost.
+        
+        Returns True if the hash changed; the caller commits.
+        """
+        password_hash = passwords.upgrade(self.password_hash, password)
+        if password_hash is None:
+            return False
+        self.password_hash = password_hash
+        return True
     
     def to_dict(self):
         """Convert user object to dictionary"""
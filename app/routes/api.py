@@ -1,18 +1,70 @@
-from flask import Blueprint, jsonify
-from app.models.user import User
-from app.models.message import Room
+from flask import Blueprint, request, jsonify
+from app import db, socketio
+from app.services.write_behind import write_behind
+from app.services.typing import typing_aggregator
+from app.services.presence import presence
+from app.services.stats import stats_counters
+from app.services.replica import replica
+from app.services.passwords import passwords
+from app.services.rate_limit import rate_limiter
+from app.utils.auth import jwt_required_with_user
+from app.utils.db import pool_stats
+from app.utils.fanout import ShardedRedisManager
 
 api_bp = Blueprint('api', __name__)
 
 @api_bp.route('/stats', methods=['GET'])
 def get_stats():
     """Get application statistics"""
-    total_users = User.query.count()
-    online_users = User.query.filter_by(is_online=True).count()
-    total_rooms = Room.query.count()
+    totals = stats_counters.totals()
+    manager = socketio.server.manager
+    stats = {
+        'total_users': totals['users'],
+        'online_users': presence.online_count(),
+        'total_rooms': totals['rooms'],
+        'total_messages': totals['messages'],
+        'write_behind': write_behind.stats(),
+        'typing': typing_aggregator.stats(),
+        'passwords': passwords.stats(),
+        'rate_limits': rate_limiter.stats(),
+        'fanout': manager.stats() if isinstance(manager, ShardedRedisManager) else None,
+        'database': {
+            'primary': pool_stats(db.engine),
+            'replica': replica.stats()
+        }
+    }
+    
+    # Optional breakdowns, e.g. /api/stats?rooms=1,2&rate=15
+    room_ids = request.args.get('rooms')
+    if room_ids:
+        try:
+            room_ids = [int(room_id) for room_id in room_ids.split(',')]
+        except ValueError:
+            return jsonify({'error': 'rooms must be a comma separated list of integers'}), 400
+        stats['room_messages'] = {str(room_id): count for room_id, count in stats_counters.room_messages(room_ids).items()}
+    
+    window = request.args.get('rate', type=int)
+    if window:
+        stats['message_rate'] = stats_counters.message_rate(window)
+        if room_ids:
+            stats['room_message_rate'] = {
+                str(room_id): stats_counters.message_rate(window, room_id) for room_id in room_ids
+            }
+    
+    return jsonify(stats), 200
+
+@api_bp.route('/presence', methods=['GET'])
+@jwt_required_with_user
+def get_presence(current_user):
+    """Get online state and last seen time for several users at once"""
+    try:
+        user_ids = [int(user_id) for user_id in request.args.get('user_ids', '').split(',') if user_id]
+    except ValueError:
+        return jsonify({'error': 'user_ids must be a comma separated list of integers'}), 400
+    
+    if len(user_ids) > 500:
+        return jsonify({'error': 'At most 500 user_ids per request'}), 400
     
     return jsonify({
-        'total_users': total_users,
-        'online_users': online_users,
-        'total_rooms': total_rooms
+        'presence': {str(user_id): state for user_id, state in presence.lookup(user_ids).items()}
     }), 200
\ No newline at end of file
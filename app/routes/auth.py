@@ -4,10 +4,16 @@ from app import db
 from app.models.user import User
 from app.utils.validators import validate_email, validate_password, validate_json
 from app.utils.auth import jwt_required_with_user
+from app.services.sessions import user_sessions
+from app.services.presence import presence
+from app.services.rate_limit import rate_limit
+from app.services.stats import stats_counters
+from app.services.user_cache import user_cache
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit('register')
 @validate_json('username', 'email', 'password', 'display_name')
 def register():
     data = request.get_json()
@@ -38,6 +44,7 @@ def register():
     
     db.session.add(user)
     db.session.commit()
+    stats_counters.record_user()
     
     # Create access token
     access_token = create_access_token(identity=user.id)
@@ -49,6 +56,7 @@ def register():
     }), 201
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login')
 @validate_json('username', 'password')
 def login():
     data = request.get_json()
@@ -62,9 +70,12 @@ def login():
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
     
-    # Update user status
-    user.is_online = True
-    user.update_last_seen()
+    # Move hashes made with older settings to the current ones
+    if user.upgrade_password(data['password']):
+        db.session.commit()
+    
+    # Online state follows socket connections; only record activity here
+    presence.touch(user.id)
     
     # Create access token
     access_token = create_access_token(identity=user.id)
@@ -79,21 +90,17 @@ def login():
 @jwt_required()
 def logout():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if user:
-        user.is_online = False
-        user.update_last_seen()
+    presence.touch(current_user_id)
     
     return jsonify({'message': 'Logout successful'}), 200
 
 @auth_bp.route('/profile', methods=['GET'])
-@jwt_required_with_user
+@jwt_required_with_user(load_model=True)
 def get_profile(current_user):
     return jsonify({'user': current_user.to_dict()}), 200
 
 @auth_bp.route('/profile', methods=['PUT'])
-@jwt_required_with_user
+@jwt_required_with_user(load_model=True)
 def update_profile(current_user):
     data = request.get_json()
     
@@ -113,6 +120,11 @@ def update_profile(current_user):
     
     db.session.commit()
     
+    # Keep cached users and connected sockets showing the new name
+    user_cache.invalidate(current_user.id)
+    if 'display_name' in data:
+        user_sessions.update_user(current_user.id, display_name=current_user.display_name)
+    
     return jsonify({
         'message': 'Profile updated successfully',
         'user': current_user.to_dict()
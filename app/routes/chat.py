@@ -1,20 +1,84 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required
-from app import db
-from app.models.message import Room, Message
+from app import db, socketio
+from app.models.message import Room, Message, ArchivedMessage, MessageRevision
 from app.models.user import User
+from app.services.history_cache import history_cache
+from app.services.messages import (after_message_sent, can_delete, delete_message, edit_message, find_message,
+                                   persist_message)
+from app.services.stats import stats_counters
+from app.services.search import search
+from app.services.membership import membership
+from app.services.read_markers import read_markers
+from app.services.replica import replica
+from app.services.rate_limit import rate_limit
+from app.services.wire import wire
 from app.utils.auth import jwt_required_with_user
 from app.utils.validators import validate_json
+from app.utils.pagination import keyset_page, cursors_for, encode_cursor, decode_cursor
+from app.utils.serializers import (message_columns, serialize_messages, serialize_rooms,
+                                   member_room_rows, room_row_to_dict)
 
 chat_bp = Blueprint('chat', __name__)
 
 @chat_bp.route('/rooms', methods=['GET'])
 @jwt_required_with_user
 def get_rooms(current_user):
-    """Get all available chat rooms"""
-    rooms = Room.query.filter_by(is_private=False).all()
+    """Get public chat rooms, paged by room ID with ``after``"""
+    after = request.args.get('after', 0, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 100)
+    
+    rooms = serialize_rooms(Room.query.filter(Room.is_private.is_(False), Room.id > after)
+                            .order_by(Room.id).limit(per_page + 1))
+    has_more = len(rooms) > per_page
+    rooms = rooms[:per_page]
     return jsonify({
-        'rooms': [room.to_dict() for room in rooms]
+        'rooms': rooms,
+        'pagination': {
+            'per_page': per_page,
+            'has_more': has_more,
+            'next_after': rooms[-1]['id'] if has_more else None
+        }
+    }), 200
+
+@chat_bp.route('/rooms/mine', methods=['GET'])
+@jwt_required_with_user
+def get_my_rooms(current_user):
+    """Get the rooms the current user belongs to, with unread counts.
+    
+    Room IDs come from the cached membership set, message and unread
+    counts from Redis, so a page costs one SQL query.
+    """
+    after = request.args.get('after', 0, type=int)
+    per_page = min(request.args.get('per_page', 50, type=int), 100)
+    
+    room_ids, has_more = membership.room_ids_for(current_user.id, after, per_page)
+    rows = member_room_rows(current_user.id, room_ids)
+    counts = stats_counters.room_messages(room_ids)
+    unread = read_markers.unread_counts(current_user.id)
+    
+    rooms = [{
+        **room_row_to_dict(row, counts.get(row.id, 0)),
+        'role': row.role,
+        'unread_count': unread.get(row.id, 0)
+    } for row in rows]
+    return jsonify({
+        'rooms': rooms,
+        'pagination': {
+            'per_page': per_page,
+            'has_more': has_more,
+            'next_after': room_ids[-1] if has_more else None
+        }
+    }), 200
+
+@chat_bp.route('/unread', methods=['GET'])
+@jwt_required_with_user
+def get_unread_counts(current_user):
+    """Get unread message counts for every room of the current user"""
+    unread = read_markers.unread_counts(current_user.id)
+    return jsonify({
+        'unread': {str(room_id): count for room_id, count in unread.items()},
+        'total': sum(unread.values())
     }), 200
 
 @chat_bp.route('/rooms', methods=['POST'])
@@ -37,6 +101,8 @@ def create_room(current_user):
     
     db.session.add(room)
     db.session.commit()
+    stats_counters.record_room()
+    membership.add(room.id, current_user.id, role='owner')
     
     return jsonify({
         'message': 'Room created successfully',
@@ -48,46 +114,279 @@ def create_room(current_user):
 def get_room_messages(current_user, room_id):
     """Get messages for a specific room"""
     room = Room.query.get_or_404(room_id)
+    if not _can_read(room, current_user):
+        return jsonify({'error': 'Access denied'}), 403
     
     # Pagination
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
+    before = request.args.get('before')
+    after = request.args.get('after')
+    
+    # Cursor mode walks the (room_id, timestamp, id) index instead of OFFSET
+    if before or after:
+        return _get_room_messages_by_cursor(room, per_page, before, after)
     
-    messages = Message.query.filter_by(room_id=room_id)\
+    # Newest page is served from the Redis ring when it is warm
+    if page == 1:
+        cached = history_cache.get_page(room_id, per_page)
+        if cached is not None:
+            items, total = cached
+            pages = (total + per_page - 1) // per_page if per_page > 0 else 0
+            return jsonify({
+                'messages': items,
+                'pagination': {
+                    'page': page,
+                    'per_page': per_page,
+                    'total': total,
+                    'pages': pages,
+                    'has_next': pages > 1,
+                    'has_prev': False,
+                    'cursors': cursors_for(items)
+                }
+            }), 200
+    
+    # Page 1 warms the ring, so it reads the primary; older pages don't
+    # change and can come from the replica
+    reader = db.session if page == 1 else replica.session()
+    messages = message_columns(reader.query(Message).filter_by(room_id=room_id))\
         .order_by(Message.timestamp.desc())\
         .paginate(page=page, per_page=per_page, error_out=False)
     
+    if page == 1:
+        history_cache.warm(room_id)
+    
+    items = serialize_messages(reversed(messages.items))
     return jsonify({
-        'messages': [msg.to_dict() for msg in reversed(messages.items)],
+        'messages': items,
         'pagination': {
             'page': page,
             'per_page': per_page,
             'total': messages.total,
             'pages': messages.pages,
             'has_next': messages.has_next,
-            'has_prev': messages.has_prev
+            'has_prev': messages.has_prev,
+            'cursors': cursors_for(items)
+        }
+    }), 200
+
+def _get_room_messages_by_cursor(room, per_page, before, after):
+    """Get a page of messages relative to a before/after cursor.
+    
+    Reads the hot table and only continues into the archive when the
+    cursor walks past the oldest hot message.
+    """
+    if before and after:
+        return jsonify({'error': 'Use either before or after, not both'}), 400
+    
+    room_id = room.id
+    # Paging back in time tolerates replica lag, paging forward wants the
+    # newest rows
+    reader = db.session if after else replica.session()
+    hot = message_columns(reader.query(Message).filter_by(room_id=room_id))
+    archive = message_columns(reader.query(ArchivedMessage).filter_by(room_id=room_id), model=ArchivedMessage)
+    try:
+        if after and room.archived_until and decode_cursor(after)[0] <= room.archived_until:
+            rows, has_more = keyset_page(archive, per_page, after=after, model=ArchivedMessage)
+            if not has_more and len(rows) < per_page:
+                cursor = encode_cursor(rows[-1].timestamp, rows[-1].id) if rows else after
+                newer, has_more = keyset_page(hot, per_page - len(rows), after=cursor)
+                rows += newer
+        else:
+            rows, has_more = keyset_page(hot, per_page, before=before, after=after)
+            if not after and not has_more and room.archived_until:
+                if len(rows) < per_page:
+                    cursor = encode_cursor(rows[0].timestamp, rows[0].id) if rows else before
+                    older, has_more = keyset_page(archive, per_page - len(rows), before=cursor,
+                                                  model=ArchivedMessage)
+                    rows = older + rows
+                else:
+                    has_more = True
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    items = serialize_messages(rows)
+    pagination = {
+        'per_page': per_page,
+        'has_more': has_more,
+        'cursors': cursors_for(items)
+    }
+    
+    # The total needs a COUNT over the room, so it is only computed on request
+    if request.args.get('include_total', 'false').lower() == 'true':
+        pagination['total'] = reader.query(Message).filter_by(room_id=room_id).count()
+        if room.archived_until:
+            pagination['total'] += reader.query(ArchivedMessage).filter_by(room_id=room_id).count()
+    
+    return jsonify({
+        'messages': items,
+        'pagination': pagination
+    }), 200
+
+@chat_bp.route('/rooms/<int:room_id>/search', methods=['GET'])
+@jwt_required_with_user
+def search_room_messages(current_user, room_id):
+    """Full-text search over a room's messages, newest matches first.
+    
+    Pages are walked with the ``before`` cursor of the previous page.
+    Archived messages are not searched; ``archived_until`` tells clients
+    where the searched history ends.
+    """
+    room = Room.query.get_or_404(room_id)
+    if not _can_read(room, current_user):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    q = request.args.get('q', '').strip()
+    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    if not q:
+        return jsonify({'error': 'Missing search query'}), 400
+    if len(q) > current_app.config['SEARCH_MAX_QUERY_LENGTH']:
+        return jsonify({'error': 'Search query is too long'}), 400
+    
+    matches = search.search(q, room_id)
+    if matches is None:
+        return jsonify({'error': 'Search query has no searchable words'}), 400
+    
+    try:
+        rows, has_more = keyset_page(message_columns(matches), limit=per_page,
+                                     before=request.args.get('before'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    items = serialize_messages(rows)
+    return jsonify({
+        'query': q,
+        'messages': items,
+        'archived_until': room.archived_until.isoformat() if room.archived_until else None,
+        'pagination': {
+            'per_page': per_page,
+            'has_more': has_more,
+            'cursors': cursors_for(items)
         }
     }), 200
 
+def _can_read(room, user):
+    """Public rooms are readable by everyone, private ones by their members"""
+    return not room.is_private or membership.is_member(room.id, user.id)
+
+@chat_bp.route('/rooms/<int:room_id>/members', methods=['POST'])
+@jwt_required_with_user
+@validate_json('user_id')
+def add_room_member(current_user, room_id):
+    """Add a user to a room; private rooms only take members from their creator"""
+    room = Room.query.get_or_404(room_id)
+    if room.is_private and room.created_by != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    user_id = request.get_json()['user_id']
+    if not db.session.get(User, user_id):
+        return jsonify({'error': 'User not found'}), 404
+    if not membership.add(room_id, user_id):
+        return jsonify({'error': 'User is already a member'}), 409
+    
+    return jsonify({'message': 'Member added successfully'}), 201
+
+@chat_bp.route('/rooms/<int:room_id>/members/<int:user_id>', methods=['DELETE'])
+@jwt_required_with_user
+def remove_room_member(current_user, room_id, user_id):
+    """Remove a member; members can leave, the creator can remove anyone"""
+    room = Room.query.get_or_404(room_id)
+    if user_id != current_user.id and room.created_by != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    if not membership.remove(room_id, user_id):
+        return jsonify({'error': 'User is not a member'}), 404
+    
+    return jsonify({'message': 'Member removed successfully'}), 200
+
 @chat_bp.route('/rooms/<int:room_id>/messages', methods=['POST'])
 @jwt_required_with_user
+@rate_limit('send_message', key=lambda current_user, room_id: current_user.id)
+@rate_limit('room_send', key=lambda current_user, room_id: room_id)
 @validate_json('content')
 def send_message(current_user, room_id):
     """Send a message to a room"""
     room = Room.query.get_or_404(room_id)
+    if not membership.ensure(room, current_user.id):
+        return jsonify({'error': 'Access denied'}), 403
     data = request.get_json()
     
-    message = Message(
+    payload = persist_message(
         content=data['content'],
         user_id=current_user.id,
         room_id=room_id,
+        username=current_user.username,
+        display_name=current_user.display_name,
         message_type=data.get('message_type', 'text')
     )
-    
-    db.session.add(message)
-    db.session.commit()
+    after_message_sent(payload)
     
     return jsonify({
         'message': 'Message sent successfully',
-        'data': message.to_dict()
-    }), 201
\ No newline at end of file
+        'data': payload
+    }), 201
+
+@chat_bp.route('/rooms/<int:room_id>/messages/<int:message_id>', methods=['PATCH'])
+@jwt_required_with_user
+@rate_limit('send_message', key=lambda current_user, room_id, message_id: current_user.id)
+@validate_json('content')
+def edit_room_message(current_user, room_id, message_id):
+    """Edit one of your messages; the room gets a ``message_edited`` delta"""
+    content = str(request.get_json()['content']).strip()
+    if not content:
+        return jsonify({'error': 'Message cannot be empty'}), 400
+    
+    message = find_message(message_id)
+    if not message or message.room_id != room_id or message.deleted_at:
+        return jsonify({'error': 'Message not found'}), 404
+    if message.user_id != current_user.id or not membership.is_member(room_id, current_user.id):
+        return jsonify({'error': 'Only the author can edit a message'}), 403
+    
+    change = edit_message(message, content)
+    if change is None:
+        return jsonify({'error': 'Message was changed by another request'}), 409
+    wire.broadcast_change('message_edited', change, socketio.emit)
+    
+    return jsonify({
+        'message': 'Message edited successfully',
+        'data': change
+    }), 200
+
+@chat_bp.route('/rooms/<int:room_id>/messages/<int:message_id>', methods=['DELETE'])
+@jwt_required_with_user
+@rate_limit('send_message', key=lambda current_user, room_id, message_id: current_user.id)
+def delete_room_message(current_user, room_id, message_id):
+    """Delete a message, leaving a tombstone; the room gets a ``message_deleted`` delta"""
+    message = find_message(message_id)
+    if not message or message.room_id != room_id or message.deleted_at:
+        return jsonify({'error': 'Message not found'}), 404
+    if not can_delete(message, current_user.id):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    change = delete_message(message)
+    if change is None:
+        return jsonify({'error': 'Message not found'}), 404
+    wire.broadcast_change('message_deleted', change, socketio.emit)
+    
+    return jsonify({
+        'message': 'Message deleted successfully',
+        'data': change
+    }), 200
+
+@chat_bp.route('/rooms/<int:room_id>/messages/<int:message_id>/revisions', methods=['GET'])
+@jwt_required_with_user
+def get_message_revisions(current_user, room_id, message_id):
+    """Earlier contents of an edited message, oldest first"""
+    room = Room.query.get_or_404(room_id)
+    if not _can_read(room, current_user):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    message = find_message(message_id)
+    if not message or message.room_id != room_id or message.deleted_at:
+        return jsonify({'error': 'Message not found'}), 404
+    
+    revisions = MessageRevision.query.filter_by(message_id=message_id)\
+        .order_by(MessageRevision.id).all()
+    return jsonify({
+        'message_id': message_id,
+        'revisions': [revision.to_dict() for revision in revisions]
+    }), 200
@@ -0,0 +1,170 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select, update
+from app import db
+from app.models.message import ArchivedMessage, Message, MessageRevision, Room
+from app.services.history_cache import history_cache
+from app.services.stats import stats_counters
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'archive:lock'
+
+ARCHIVE_COLUMNS = ('id', 'content', 'user_id', 'room_id', 'timestamp', 'message_type', 'edited_at', 'seq',
+                   'deleted_at')
+
+
+class MessageArchiver:
+    """Moves old messages out of the hot ``message`` table.
+
+    Messages older than a room's ``archive_after_days`` are copied to
+    ``message_archive`` and deleted from ``message`` in batches, one
+    transaction per batch, so history reads and counts only touch the
+    recent window. Messages older than ``retention_days`` are deleted from
+    both tables. ``Room.archived_until`` records how far a room has been
+    archived so readers know when a cursor needs the archive. Search only
+    indexes the hot table, so archived messages drop out of search results.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self._running = False
+        self.archived_total = 0
+        self.purged_total = 0
+        self.last_run = None
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('ARCHIVE_ENABLED', False)
+        app.config.setdefault('ARCHIVE_AFTER_DAYS', 90)
+        app.config.setdefault('MESSAGE_RETENTION_DAYS', None)
+        app.config.setdefault('ARCHIVE_BATCH_SIZE', 1000)
+        app.config.setdefault('ARCHIVE_INTERVAL', 3600)
+        self.app = app
+        self.redis = redis_client
+        app.extensions['archive'] = self
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config['ARCHIVE_ENABLED']
+
+    def run(self, now=None, room_ids=None):
+        """Archive and purge every room (or the given ones) once.
+
+        Returns ``{'archived': n, 'purged': n}``.
+        """
+        now = now or datetime.utcnow()
+        archived = purged = 0
+        with self.app.app_context():
+            query = db.session.query(Room.id, Room.archive_after_days, Room.retention_days).order_by(Room.id)
+            if room_ids is not None:
+                query = query.filter(Room.id.in_(room_ids))
+            for room_id, archive_after_days, retention_days in query.all():
+                retention_days = retention_days or self.app.config['MESSAGE_RETENTION_DAYS']
+                if retention_days:
+                    purged += self.purge_room(room_id, now - timedelta(days=retention_days))
+                archive_after_days = archive_after_days or self.app.config['ARCHIVE_AFTER_DAYS']
+                if archive_after_days:
+                    archived += self.archive_room(room_id, now - timedelta(days=archive_after_days))
+            db.session.remove()
+        self.archived_total += archived
+        self.purged_total += purged
+        self.last_run = time.time()
+        return {'archived': archived, 'purged': purged}
+
+    def archive_room(self, room_id, cutoff):
+        """Move a room's messages older than ``cutoff`` to the archive"""
+        batch_size = self.app.config['ARCHIVE_BATCH_SIZE']
+        moved = 0
+        while True:
+            rows = db.session.query(Message.id, Message.timestamp)\
+                .filter(Message.room_id == room_id, Message.timestamp < cutoff)\
+                .order_by(Message.timestamp, Message.id)\
+                .limit(batch_size).all()
+            if not rows:
+                break
+            ids = [row.id for row in rows]
+            columns = [getattr(Message, name) for name in ARCHIVE_COLUMNS]
+            try:
+                db.session.execute(insert(ArchivedMessage).from_select(
+                    list(ARCHIVE_COLUMNS), select(*columns).where(Message.id.in_(ids))))
+                db.session.execute(delete(Message).where(Message.id.in_(ids)))
+                # Batches go oldest first, so the archive is always a prefix
+                # of the room's (timestamp, id) order
+                db.session.execute(update(Room).where(Room.id == room_id)
+                                   .values(archived_until=rows[-1].timestamp))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            moved += len(ids)
+            if len(ids) < batch_size:
+                break
+        if moved:
+            # The ring may hold archived messages and its total is now off
+            history_cache.invalidate(room_id)
+            logger.info('Archived %s messages of room %s', moved, room_id)
+        return moved
+
+    def purge_room(self, room_id, cutoff):
+        """Delete a room's messages older than ``cutoff`` from both tables"""
+        batch_size = self.app.config['ARCHIVE_BATCH_SIZE']
+        purged = counted = 0
+        for model in (ArchivedMessage, Message):
+            while True:
+                rows = db.session.query(model.id, model.deleted_at)\
+                    .filter(model.room_id == room_id, model.timestamp < cutoff)\
+                    .order_by(model.timestamp, model.id)\
+                    .limit(batch_size).all()
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                db.session.execute(delete(model).where(model.id.in_(ids)))
+                db.session.execute(delete(MessageRevision).where(MessageRevision.message_id.in_(ids)))
+                db.session.commit()
+                purged += len(ids)
+                # Tombstones were uncounted when their message was deleted
+                counted += sum(1 for row in rows if row.deleted_at is None)
+        if counted:
+            stats_counters.record_deleted(room_id, counted)
+        if purged:
+            history_cache.invalidate(room_id)
+            logger.info('Purged %s messages of room %s', purged, room_id)
+        return purged
+
+    def start(self):
+        """Start the periodic archive job if enabled and not running yet"""
+        if self._running or not self.enabled:
+            return
+        from app import socketio
+        self._running = True
+        socketio.start_background_task(self._run)
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        return {
+            'enabled': bool(self.enabled),
+            'archived_total': self.archived_total,
+            'purged_total': self.purged_total,
+            'last_run': self.last_run
+        }
+
+    def _run(self):
+        from app import socketio
+        interval = self.app.config['ARCHIVE_INTERVAL']
+        while self._running:
+            try:
+                # Only one node archives per interval
+                if self.redis.set(LOCK_KEY, 1, nx=True, ex=int(interval)):
+                    self.run()
+            except Exception as e:
+                logger.exception('Archive run error: %s', e)
+            socketio.sleep(interval)
+
+
+archiver = MessageArchiver()
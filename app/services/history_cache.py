@@ -0,0 +1,237 @@
+import logging
+import json
+import redis
+from app.models.message import Message
+from app.services.write_behind import write_behind
+from app.utils.serializers import message_columns, message_row_to_dict
+
+logger = logging.getLogger(__name__)
+
+
+class RoomHistoryCache:
+    """Capped per-room ring of recently serialized messages kept in Redis.
+
+    ``room_history:<id>`` is a list of JSON payloads, newest first, trimmed
+    to ``HISTORY_CACHE_SIZE``. ``room_history_meta:<id>`` holds the room's
+    total message count so page 1 can be answered without touching SQL.
+    Every write to a room touches its meta hash, which is how a warm that
+    raced with a send or an edit notices and gives up.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('HISTORY_CACHE_ENABLED', True)
+        app.config.setdefault('HISTORY_CACHE_SIZE', 100)
+        app.config.setdefault('HISTORY_CACHE_TTL', 3600)
+        self.app = app
+        self.redis = redis_client
+        app.extensions['history_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config['HISTORY_CACHE_ENABLED']
+
+    @property
+    def size(self):
+        return self.app.config['HISTORY_CACHE_SIZE']
+
+    @staticmethod
+    def _list_key(room_id):
+        return f'room_history:{room_id}'
+
+    @staticmethod
+    def _meta_key(room_id):
+        return f'room_history_meta:{room_id}'
+
+    def push(self, room_id, payload):
+        """Add a freshly sent message to the room's ring"""
+        self.push_many(room_id, [payload])
+
+    def push_many(self, room_id, payloads):
+        """Add freshly sent messages, oldest first, to the room's ring.
+
+        Only extends a ring that is already warm; the total is always bumped
+        so a partially cached room can never look complete.
+        """
+        if not self.enabled or not payloads:
+            return
+        list_key = self._list_key(room_id)
+        meta_key = self._meta_key(room_id)
+        ttl = self.app.config['HISTORY_CACHE_TTL']
+        try:
+            serialized = [json.dumps(payload) for payload in payloads]
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.hget(meta_key, 'total')
+            pipe.lpushx(list_key, *serialized)
+            pipe.ltrim(list_key, 0, self.size - 1)
+            pipe.hincrby(meta_key, 'total', len(payloads))
+            pipe.expire(list_key, ttl)
+            pipe.expire(meta_key, ttl)
+            previous_total, pushed = pipe.execute()[:2]
+
+            # A warm but empty room has no list yet, so start one
+            if not pushed and previous_total is not None and int(previous_total) == 0:
+                self.redis.rpush(list_key, *reversed(serialized[-self.size:]))
+                self.redis.expire(list_key, ttl)
+        except redis.RedisError as e:
+            logger.warning('History cache push error: %s', e)
+
+    def get_page(self, room_id, per_page):
+        """Return ``(messages, total)`` for the newest page, or None on a miss.
+
+        Messages are returned oldest first, matching the REST response.
+        """
+        if not self.enabled or per_page > self.size:
+            return None
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.lrange(self._list_key(room_id), 0, per_page - 1)
+            pipe.hget(self._meta_key(room_id), 'total')
+            items, total = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('History cache read error: %s', e)
+            return None
+
+        if total is None or len(items) != min(per_page, int(total)):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return [json.loads(item) for item in reversed(items)], int(total)
+
+    def since(self, room_id, last_seq):
+        """Cached messages with a sequence number above ``last_seq``.
+
+        Returns ``(messages, complete)`` with messages oldest first.
+        ``complete`` is True when the ring reaches back to ``last_seq`` (or
+        holds the whole room) and the newer sequence numbers have no gaps,
+        so nothing needs to be read from SQL.
+        """
+        if not self.enabled:
+            return [], False
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.lrange(self._list_key(room_id), 0, -1)
+            pipe.hget(self._meta_key(room_id), 'total')
+            items, total = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('History cache read error: %s', e)
+            return [], False
+
+        messages = [json.loads(item) for item in items]
+        newer = [m for m in messages if m.get('seq') is not None and m['seq'] > last_seq]
+        reaches_back = any(m.get('seq') is not None and m['seq'] <= last_seq for m in messages)
+        whole_room = total is not None and int(total) <= len(messages)
+        newer.sort(key=lambda m: m['seq'])
+        # A message missing from the ring, e.g. one whose push lost a race,
+        # shows up as a gap; let SQL fill it
+        contiguous = all(m['seq'] == last_seq + 1 + offset for offset, m in enumerate(newer))
+        return newer, (reaches_back or whole_room) and contiguous
+
+    def warm(self, room_id):
+        """Load the newest messages of a room and its total from the database.
+
+        Skipped while write-behind still holds messages of the room: they
+        are missing from the database, and a ring built without them would
+        look complete. The meta hash is watched across the queries, so a
+        send or edit that lands in between aborts the warm instead of being
+        left out of a ring that looks complete; the next read warms again.
+        """
+        if not self.enabled or write_behind.has_pending(room_id):
+            return
+        list_key = self._list_key(room_id)
+        meta_key = self._meta_key(room_id)
+        ttl = self.app.config['HISTORY_CACHE_TTL']
+        try:
+            with self.redis.pipeline() as pipe:
+                pipe.watch(meta_key)
+                query = Message.query.filter_by(room_id=room_id)
+                total = query.count()
+                messages = message_columns(query)\
+                    .order_by(Message.timestamp.desc(), Message.id.desc())\
+                    .limit(self.size).all()
+
+                pipe.multi()
+                pipe.delete(list_key)
+                if messages:
+                    pipe.rpush(list_key, *[json.dumps(message_row_to_dict(row)) for row in messages])
+                    pipe.expire(list_key, ttl)
+                pipe.hset(meta_key, 'total', total)
+                pipe.expire(meta_key, ttl)
+                pipe.execute()
+        except redis.WatchError:
+            logger.debug('History cache warm of room %s raced with a write, skipped', room_id)
+        except redis.RedisError as e:
+            logger.warning('History cache warm error: %s', e)
+
+    def update_message(self, room_id, fields, also=None):
+        """Apply changed fields to a cached message after an edit or delete.
+
+        ``fields`` holds the message ``id`` and the fields to overwrite; a
+        full payload replaces the message. ``also(pipe)`` can queue more
+        commands, e.g. counter updates, into the same MULTI so the ring and
+        the counters change in one step.
+        """
+        list_key = self._list_key(room_id)
+        meta_key = self._meta_key(room_id)
+        try:
+            with self.redis.pipeline() as pipe:
+                if self.enabled:
+                    # A concurrent push shifts indices, so WATCH the list and
+                    # fall back to dropping the ring if it changed under us
+                    pipe.watch(list_key)
+                    found = None
+                    for index, item in enumerate(pipe.lrange(list_key, 0, -1)):
+                        message = json.loads(item)
+                        if message['id'] == fields['id']:
+                            message.update(fields)
+                            found = index, message
+                            break
+                    pipe.multi()
+                    if found is not None:
+                        pipe.lset(list_key, found[0], json.dumps(found[1]))
+                    # Even a cold room: a warm in progress must not keep
+                    # the old content
+                    pipe.hincrby(meta_key, 'version', 1)
+                    pipe.expire(meta_key, self.app.config['HISTORY_CACHE_TTL'])
+                else:
+                    pipe.multi()
+                if also is not None:
+                    also(pipe)
+                pipe.execute()
+        except redis.WatchError:
+            self.invalidate(room_id, also)
+        except redis.RedisError as e:
+            logger.warning('History cache update error: %s', e)
+            self.invalidate(room_id)
+
+    def invalidate(self, room_id, also=None):
+        """Drop a room's cached history, e.g. after its messages were archived.
+
+        ``also(pipe)`` queues more commands into the same MULTI.
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.delete(self._list_key(room_id), self._meta_key(room_id))
+            if also is not None:
+                also(pipe)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('History cache invalidate error: %s', e)
+
+    def stats(self):
+        return {
+            'enabled': bool(self.enabled),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+history_cache = RoomHistoryCache()
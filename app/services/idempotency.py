@@ -0,0 +1,77 @@
+import logging
+import redis
+
+logger = logging.getLogger(__name__)
+
+KEY = 'message_key:{user_id}:{client_id}'
+PENDING = b''
+
+
+class IdempotencyKeys:
+    """Client-supplied message keys remembered in Redis for a while.
+
+    A client tags each message it sends with its own key. The first send
+    claims the key and later records the server ID under it; a retry of the
+    same key, e.g. after a reconnect, finds the claim and is answered with
+    that ID instead of being stored again.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self.duplicates = 0
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('MESSAGE_KEY_TTL', 3600)
+        self.app = app
+        self.redis = redis_client
+        app.extensions['idempotency'] = self
+
+    def claim(self, user_id, client_ids):
+        """Claim keys for a user in one round trip.
+
+        Returns ``{client_id: message_id}`` for keys that were already
+        claimed; the ID is None while the first send is still in flight.
+        Every other key now belongs to the caller.
+        """
+        ttl = self.app.config['MESSAGE_KEY_TTL']
+        keys = [KEY.format(user_id=user_id, client_id=client_id) for client_id in client_ids]
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(key, PENDING, nx=True, ex=ttl)
+        claimed = pipe.execute()
+
+        taken = [client_id for client_id, ok in zip(client_ids, claimed) if not ok]
+        if not taken:
+            return {}
+        values = self.redis.mget([key for key, ok in zip(keys, claimed) if not ok])
+        self.duplicates += len(taken)
+        return {client_id: int(value) if value else None for client_id, value in zip(taken, values)}
+
+    def record(self, user_id, message_ids):
+        """Store the server IDs for claimed keys, ``{client_id: message_id}``"""
+        ttl = self.app.config['MESSAGE_KEY_TTL']
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for client_id, message_id in message_ids.items():
+                pipe.set(KEY.format(user_id=user_id, client_id=client_id), message_id, ex=ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('Message key record error: %s', e)
+
+    def release(self, user_id, client_ids):
+        """Give up claims after a failed send so the client can retry"""
+        if not client_ids:
+            return
+        try:
+            self.redis.delete(*[KEY.format(user_id=user_id, client_id=client_id) for client_id in client_ids])
+        except redis.RedisError as e:
+            logger.warning('Message key release error: %s', e)
+
+    def stats(self):
+        return {'duplicates': self.duplicates}
+
+
+idempotency = IdempotencyKeys()
@@ -0,0 +1,215 @@
+import logging
+import redis
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.message import RoomMember
+from app.services.sequences import room_sequences
+from app.services.read_markers import read_markers
+
+logger = logging.getLogger(__name__)
+
+MEMBERS_KEY = 'room_members:{room_id}'
+USER_ROOMS_KEY = 'user_rooms:{user_id}'
+# Bumped on every add and remove; a load watches them across its query
+ROOM_VERSION_KEY = 'room_members_version:{room_id}'
+USER_VERSION_KEY = 'user_rooms_version:{user_id}'
+# Marks a cached set as complete; a set without it was only partly written
+# (e.g. an add racing an expiry) and is reloaded from SQL
+WARM = 'warm'
+
+
+class RoomMembership:
+    """Room membership stored in ``RoomMember`` and cached in Redis.
+
+    ``room_members:<room>`` is a set of user IDs so join and send checks are
+    a single SISMEMBER. ``user_rooms:<user>`` is a sorted set of room IDs
+    scored by room ID, which the "my rooms" listing pages through by score.
+    Both are loaded from SQL on a miss and updated in place on changes.
+    Changes also bump a version key that loads watch across their query,
+    so a load that read SQL before an add or remove committed doesn't
+    write the old members back over it.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('MEMBERSHIP_CACHE_TTL', 3600)
+        self.app = app
+        self.redis = redis_client
+        app.extensions['membership'] = self
+
+    def is_member(self, room_id, user_id):
+        """Whether a user belongs to a room, without SQL when cached"""
+        key = MEMBERS_KEY.format(room_id=int(room_id))
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.sismember(key, int(user_id))
+            pipe.sismember(key, WARM)
+            member, warm = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('Membership read error: %s', e)
+            return self._member_row(room_id, user_id) is not None
+        if warm:
+            self.hits += 1
+            return bool(member)
+        self.misses += 1
+        return int(user_id) in self._load_room(room_id)
+
+    def add(self, room_id, user_id, role='member'):
+        """Make a user a member of a room; returns False if already one.
+
+        New members start with everything sent so far marked as read.
+        """
+        last_seq = room_sequences.current(room_id)
+        member = RoomMember(
+            room_id=int(room_id),
+            user_id=int(user_id),
+            role=role,
+            last_read_seq=last_seq
+        )
+        db.session.add(member)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        self._cache_add(room_id, user_id)
+        read_markers.mark_read(user_id, room_id, last_seq)
+        return True
+
+    def ensure(self, room, user_id):
+        """Check membership, joining public rooms on first use"""
+        if self.is_member(room.id, user_id):
+            return True
+        if room.is_private:
+            return False
+        self.add(room.id, user_id)
+        return True
+
+    def remove(self, room_id, user_id):
+        """Remove a user from a room; returns False if they weren't a member"""
+        deleted = RoomMember.query.filter_by(room_id=int(room_id), user_id=int(user_id)).delete()
+        db.session.commit()
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.srem(MEMBERS_KEY.format(room_id=int(room_id)), int(user_id))
+            pipe.zrem(USER_ROOMS_KEY.format(user_id=int(user_id)), int(room_id))
+            self._bump(pipe, room_id, user_id)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('Membership cache write error: %s', e)
+            self.invalidate(room_id, user_id)
+        read_markers.forget(user_id, room_id)
+        return bool(deleted)
+
+    def room_ids_for(self, user_id, after=0, limit=50):
+        """One page of a user's room IDs above ``after``, in ID order.
+
+        Returns ``(room_ids, has_more)``.
+        """
+        key = USER_ROOMS_KEY.format(user_id=int(user_id))
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zscore(key, WARM)
+            pipe.zrangebyscore(key, f'({int(after)}', '+inf', start=0, num=limit + 1)
+            warm, page = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('Membership read error: %s', e)
+            warm, page = None, []
+        if warm is not None:
+            self.hits += 1
+            room_ids = [int(room_id) for room_id in page]
+        else:
+            self.misses += 1
+            room_ids = [room_id for room_id in self._load_user(user_id) if room_id > int(after)][:limit + 1]
+        return room_ids[:limit], len(room_ids) > limit
+
+    def invalidate(self, room_id=None, user_id=None):
+        """Drop cached sets so they are reloaded from SQL"""
+        keys = []
+        if room_id is not None:
+            keys.append(MEMBERS_KEY.format(room_id=int(room_id)))
+        if user_id is not None:
+            keys.append(USER_ROOMS_KEY.format(user_id=int(user_id)))
+        try:
+            if keys:
+                self.redis.delete(*keys)
+        except redis.RedisError as e:
+            logger.warning('Membership invalidate error: %s', e)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _member_row(self, room_id, user_id):
+        return db.session.query(RoomMember.id)\
+            .filter_by(room_id=int(room_id), user_id=int(user_id)).first()
+
+    def _load_room(self, room_id):
+        key = MEMBERS_KEY.format(room_id=int(room_id))
+        user_ids = None
+        try:
+            with self.redis.pipeline() as pipe:
+                pipe.watch(ROOM_VERSION_KEY.format(room_id=int(room_id)))
+                user_ids = self._room_rows(room_id)
+                pipe.multi()
+                pipe.delete(key)
+                pipe.sadd(key, WARM, *user_ids)
+                pipe.expire(key, self.app.config['MEMBERSHIP_CACHE_TTL'])
+                pipe.execute()
+        except redis.WatchError:
+            logger.debug('Membership load of room %s raced with a change, not cached', room_id)
+        except redis.RedisError as e:
+            logger.warning('Membership cache write error: %s', e)
+        return user_ids if user_ids is not None else self._room_rows(room_id)
+
+    def _load_user(self, user_id):
+        key = USER_ROOMS_KEY.format(user_id=int(user_id))
+        room_ids = None
+        try:
+            with self.redis.pipeline() as pipe:
+                pipe.watch(USER_VERSION_KEY.format(user_id=int(user_id)))
+                room_ids = self._user_rows(user_id)
+                pipe.multi()
+                pipe.delete(key)
+                pipe.zadd(key, {WARM: -1, **{str(room_id): room_id for room_id in room_ids}})
+                pipe.expire(key, self.app.config['MEMBERSHIP_CACHE_TTL'])
+                pipe.execute()
+        except redis.WatchError:
+            logger.debug('Membership load of user %s raced with a change, not cached', user_id)
+        except redis.RedisError as e:
+            logger.warning('Membership cache write error: %s', e)
+        return room_ids if room_ids is not None else self._user_rows(user_id)
+
+    def _room_rows(self, room_id):
+        return {user_id for (user_id,) in db.session.query(RoomMember.user_id)
+                .filter_by(room_id=int(room_id))}
+
+    def _user_rows(self, user_id):
+        return [room_id for (room_id,) in db.session.query(RoomMember.room_id)
+                .filter_by(user_id=int(user_id)).order_by(RoomMember.room_id)]
+
+    def _bump(self, pipe, room_id, user_id):
+        ttl = self.app.config['MEMBERSHIP_CACHE_TTL']
+        for key in (ROOM_VERSION_KEY.format(room_id=int(room_id)), USER_VERSION_KEY.format(user_id=int(user_id))):
+            pipe.incr(key)
+            pipe.expire(key, ttl)
+
+    def _cache_add(self, room_id, user_id):
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.sadd(MEMBERS_KEY.format(room_id=int(room_id)), int(user_id))
+            pipe.zadd(USER_ROOMS_KEY.format(user_id=int(user_id)), {str(int(room_id)): int(room_id)})
+            self._bump(pipe, room_id, user_id)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('Membership cache write error: %s', e)
+            self.invalidate(room_id, user_id)
+
+
+membership = RoomMembership()
@@ -0,0 +1,182 @@
+from datetime import datetime
+from sqlalchemy import delete, update
+from app import db
+from app.models.message import Message, MessageRevision
+from app.utils.serializers import message_columns, serialize_messages
+from app.services.archive import archiver
+from app.services.history_cache import history_cache
+from app.services.read_markers import read_markers
+from app.services.stats import stats_counters
+from app.services.sequences import room_sequences
+from app.services.write_behind import write_behind
+
+
+def after_message_sent(payload):
+    """Update caches and counters for a message that was just sent.
+
+    Called by every send path with the serialized message, whether it was
+    committed directly or queued for write-behind persistence.
+    """
+    history_cache.push(payload['room_id'], payload)
+    stats_counters.record_messages(payload['room_id'])
+    # The sender has read everything up to their own message
+    read_markers.mark_read(payload['user_id'], payload['room_id'], payload['seq'], payload['id'])
+    archiver.start()
+
+
+def after_messages_sent(room_id, payloads):
+    """Batch form of ``after_message_sent`` for messages in one room"""
+    history_cache.push_many(room_id, payloads)
+    stats_counters.record_messages(room_id, len(payloads))
+    last = payloads[-1]
+    read_markers.mark_read(last['user_id'], room_id, last['seq'], last['id'])
+    archiver.start()
+
+
+def replay_messages(room_id, last_seq, limit):
+    """Messages of a room sent after ``last_seq``, oldest first.
+
+    Served from the Redis history ring when it reaches back far enough,
+    otherwise from one indexed query on ``(room_id, seq)`` merged with the
+    ring, which may hold messages write-behind has not flushed yet. Returns
+    ``(messages, has_more)``; with ``has_more`` the client resumes again from
+    the last sequence it received.
+    """
+    cached, complete = history_cache.since(room_id, last_seq)
+    if not complete:
+        rows = message_columns(Message.query.filter(Message.room_id == int(room_id), Message.seq > last_seq))\
+            .order_by(Message.seq, Message.id)\
+            .limit(limit + 1).all()
+        merged = {message['id']: message for message in serialize_messages(rows)}
+        merged.update((message['id'], message) for message in cached)
+        cached = sorted(merged.values(), key=lambda m: (m['seq'], m['id']))
+    return cached[:limit], len(cached) > limit
+
+
+def persist_message(content, user_id, room_id, username, display_name, message_type='text'):
+    """Store one message; returns it in the shape of ``Message.to_dict()``"""
+    return persist_messages([content], user_id, room_id, username, display_name, message_type)[0]
+
+
+def persist_messages(contents, user_id, room_id, username, display_name, message_type='text'):
+    """Store several messages from one user in a single transaction.
+
+    Returns the messages in the shape of ``Message.to_dict()``, in the
+    order of ``contents``, without loading the author back from the
+    database. With write-behind they are queued instead.
+    """
+    if write_behind.enabled:
+        return write_behind.enqueue_many(contents, user_id, room_id, username, display_name, message_type)
+
+    first_seq = room_sequences.reserve(room_id, len(contents))
+    messages = [Message(content=content, user_id=user_id, room_id=int(room_id), message_type=message_type,
+                        seq=first_seq + offset)
+                for offset, content in enumerate(contents)]
+    db.session.add_all(messages)
+    try:
+        # Flush first so IDs and defaults are readable without a refresh
+        # query per row after the commit expires them
+        db.session.flush()
+        payloads = [{
+            'id': message.id,
+            'content': message.content,
+            'user_id': user_id,
+            'username': username,
+            'display_name': display_name,
+            'room_id': message.room_id,
+            'timestamp': message.timestamp.isoformat(),
+            'message_type': message.message_type,
+            'edited_at': None,
+            'seq': message.seq,
+            'deleted_at': None
+        } for message in messages]
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return payloads
+
+
+def find_message(message_id):
+    """A message in the hot table, including one write-behind hasn't stored yet"""
+    message = Message.query.get(message_id)
+    if message is None and write_behind.enabled and write_behind.queue_depth:
+        write_behind.flush()
+        message = Message.query.get(message_id)
+    return message
+
+
+def can_delete(message, user_id):
+    """Authors delete their own messages, room creators any in their room"""
+    return message.user_id == int(user_id) or message.room.created_by == int(user_id)
+
+
+def edit_message(message, content):
+    """Replace a message's content and keep the old content as a revision.
+
+    Returns the delta for the room, the ID plus changed fields, or None if
+    the message was edited or deleted since it was loaded. The ring entry
+    is patched in place. Replay only resends newer messages, so a client
+    that misses the delta sees the edit when it next loads history.
+    """
+    edited_at = datetime.utcnow()
+    try:
+        # Conditional on the content read, so a concurrent edit can't
+        # slip in between and lose its revision
+        changed = db.session.execute(
+            update(Message)
+            .where(Message.id == message.id, Message.content == message.content, Message.deleted_at.is_(None))
+            .values(content=content, edited_at=edited_at)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not changed:
+            db.session.rollback()
+            return None
+        db.session.add(MessageRevision(message_id=message.id, content=message.content, replaced_at=edited_at))
+        change = {
+            'id': message.id,
+            'room_id': message.room_id,
+            'content': content,
+            'edited_at': edited_at.isoformat()
+        }
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    history_cache.update_message(change['room_id'], change)
+    return change
+
+
+def delete_message(message):
+    """Turn a message into a tombstone and drop its revisions.
+
+    The row keeps its ID, timestamp and seq, so cursors and replay are
+    unaffected; its content is cleared, which also drops it from search.
+    Returns the delta for the room, or None if it was already deleted. The
+    ring entry and the message counters change in one Redis transaction.
+    """
+    deleted_at = datetime.utcnow()
+    try:
+        changed = db.session.execute(
+            update(Message)
+            .where(Message.id == message.id, Message.deleted_at.is_(None))
+            .values(content='', deleted_at=deleted_at)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not changed:
+            db.session.rollback()
+            return None
+        db.session.execute(delete(MessageRevision).where(MessageRevision.message_id == message.id))
+        change = {
+            'id': message.id,
+            'room_id': message.room_id,
+            'deleted_at': deleted_at.isoformat()
+        }
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    room_id = change['room_id']
+    history_cache.update_message(room_id, dict(change, content=''),
+                                 also=lambda pipe: stats_counters.record_deleted(room_id, pipe=pipe))
+    return change
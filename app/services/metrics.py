@@ -0,0 +1,347 @@
+import bisect
+import functools
+import hmac
+import ipaddress
+import threading
+import time
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+FANOUT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, _label_text(self.labels, labels), value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        # Non-cumulative while recording; summed up at scrape time
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return sum(state[0]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        names = self.labels + ('le',)
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                yield self.name + '_bucket', _label_text(names, labels + (bound,)), cumulative
+            yield self.name + '_sum', _label_text(self.labels, labels), total
+            yield self.name + '_count', _label_text(self.labels, labels), cumulative
+
+
+class Gauge:
+    """A value read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self):
+        yield self.name, '', self.read()
+
+
+class _Usage:
+    """Queries and Redis round trips made by the request or event in progress"""
+
+    __slots__ = ('queries', 'query_seconds', 'redis')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.redis = 0
+
+
+def _is_loopback(address):
+    try:
+        return ipaddress.ip_address(address or '').is_loopback
+    except ValueError:
+        return False
+
+
+def _usage():
+    return g.get('metrics_usage') if has_app_context() else None
+
+
+class Metrics:
+    """Prometheus metrics for one worker process, served on ``/metrics``.
+
+    Every route and Socket.IO handler records its latency and how many
+    queries, how much query time and how many Redis round trips it used.
+    Recording is a dict update under a lock, cheap enough to leave on.
+    The figures are per process: scrape each serve.py instance on its own
+    port rather than through the load balancer. If ``METRICS_TOKEN`` is
+    set, scrapes must send it as a bearer token; without one only scrapes
+    from a loopback address are answered.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.server = None
+        self.registry = []
+        self._build()
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def _build(self):
+        self.http_duration = self._add(Histogram(
+            'flashchat_http_request_duration_seconds', 'HTTP request latency by route',
+            ('method', 'route', 'status')))
+        self.event_duration = self._add(Histogram(
+            'flashchat_socketio_event_duration_seconds', 'Socket.IO handler latency by event', ('event',)))
+        self.events = self._add(Counter(
+            'flashchat_socketio_events_total', 'Socket.IO events handled by event', ('event',)))
+        self.request_queries = self._add(Histogram(
+            'flashchat_db_queries_per_request', 'Database queries per request or event',
+            ('handler',), COUNT_BUCKETS))
+        self.request_query_seconds = self._add(Histogram(
+            'flashchat_db_query_seconds_per_request', 'Time spent in queries per request or event',
+            ('handler',)))
+        self.queries = self._add(Counter(
+            'flashchat_db_queries_total', 'Database queries, including background jobs'))
+        self.query_duration = self._add(Histogram(
+            'flashchat_db_query_duration_seconds', 'Latency of single database queries'))
+        self.request_redis = self._add(Histogram(
+            'flashchat_redis_round_trips_per_request', 'Redis round trips per request or event',
+            ('handler',), COUNT_BUCKETS))
+        self.redis = self._add(Counter(
+            'flashchat_redis_round_trips_total', 'Redis round trips, including background jobs'))
+        self.fanout = self._add(Histogram(
+            'flashchat_room_fanout_recipients', 'Local recipients of each room broadcast',
+            buckets=FANOUT_BUCKETS))
+        self.publish_duration = self._add(Histogram(
+            'flashchat_message_queue_publish_seconds', 'Latency of publishing a broadcast to the message queue'))
+        self._add(Gauge(
+            'flashchat_connected_sids', 'Socket.IO clients connected to this worker', self._connected))
+
+    def _add(self, metric):
+        self.registry.append(metric)
+        return metric
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_TOKEN', None)
+        self.app = app
+        self.registry = []
+        self._build()
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        self._instrument_redis(redis_client)
+
+        from app import socketio
+        self.server = socketio.server
+        self._instrument_manager(socketio.server.manager)
+
+    def scrape(self):
+        """Response for the ``/metrics`` endpoint"""
+        if not self.app.config['METRICS_ENABLED']:
+            return {'error': 'Metrics are disabled'}, 404
+        token = self.app.config['METRICS_TOKEN']
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return {'error': 'Unauthorized'}, 401
+        if not token and not _is_loopback(request.remote_addr):
+            return {'error': 'Metrics need METRICS_TOKEN outside localhost'}, 403
+        return self.render(), 200, {'Content-Type': CONTENT_TYPE}
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        lines = []
+        for metric in self.registry:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def observe_event(self, handler):
+        """Decorator recording a Socket.IO handler's latency and resource use"""
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            if not self.app.config['METRICS_ENABLED']:
+                return handler(*args, **kwargs)
+            name = request.event['message']
+            g.metrics_usage = _Usage()
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self.event_duration.observe(time.perf_counter() - started, name)
+                self.events.inc(name)
+                self._record_usage(f'event {name}')
+        return wrapper
+
+    def _start_request(self):
+        g.metrics_usage = _Usage()
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        # The rule, not the path, so IDs don't become labels
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.http_duration.observe(time.perf_counter() - started, request.method, route, str(response.status_code))
+        self._record_usage(f'{request.method} {route}')
+        return response
+
+    def _record_usage(self, handler):
+        usage = g.pop('metrics_usage', None)
+        if usage is None:
+            return
+        self.request_queries.observe(usage.queries, handler)
+        self.request_query_seconds.observe(usage.query_seconds, handler)
+        self.request_redis.observe(usage.redis, handler)
+
+    def _instrument_redis(self, redis_client):
+        # A command or a whole pipeline takes one connection from the pool
+        # for one round trip
+        pool = redis_client.connection_pool
+        get_connection = pool.get_connection
+
+        @functools.wraps(get_connection)
+        def counted(*args, **kwargs):
+            self.redis.inc()
+            usage = _usage()
+            if usage is not None:
+                usage.redis += 1
+            return get_connection(*args, **kwargs)
+        pool.get_connection = counted
+
+    def _instrument_manager(self, manager):
+        def observe_fanout(namespace, room):
+            participants = manager.rooms.get(namespace or '/', {})
+            # Emits to a single sid aren't broadcasts
+            if room is None or room in participants.get(None, ()):
+                return
+            self.fanout.observe(len(participants.get(room, ())))
+
+        publish = getattr(manager, '_publish', None)
+        if publish is None:
+            emit = manager.emit
+
+            @functools.wraps(emit)
+            def local_emit(event, data, namespace=None, room=None, *args, **kwargs):
+                observe_fanout(namespace, room)
+                return emit(event, data, namespace, room, *args, **kwargs)
+            manager.emit = local_emit
+            return
+
+        # With a message queue every node, the sender included, delivers
+        # broadcasts when they come back from the queue
+        handle_emit = manager._handle_emit
+
+        @functools.wraps(publish)
+        def timed_publish(data):
+            started = time.perf_counter()
+            try:
+                return publish(data)
+            finally:
+                self.publish_duration.observe(time.perf_counter() - started)
+
+        @functools.wraps(handle_emit)
+        def delivered(message):
+            observe_fanout(message.get('namespace'), message.get('room'))
+            return handle_emit(message)
+        manager._publish = timed_publish
+        manager._handle_emit = delivered
+
+    def _connected(self):
+        if self.server is None:
+            return 0
+        return len(self.server.manager.rooms.get('/', {}).get(None, ()))
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['metrics_query_started'].pop()
+    elapsed = time.perf_counter() - started
+    metrics.queries.inc()
+    metrics.query_duration.observe(elapsed)
+    usage = _usage()
+    if usage is not None:
+        usage.queries += 1
+        usage.query_seconds += elapsed
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None:
+        started = context.connection.info.get('metrics_query_started')
+        if started:
+            started.pop()
@@ -0,0 +1,165 @@
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+ALGORITHMS = ('bcrypt', 'pbkdf2:sha256', 'scrypt')
+
+BCRYPT_PATTERN = re.compile(r'^\$2[aby]?\$(\d\d)\$')
+# bcrypt 4.0 panics instead of raising on a truncated hash
+BCRYPT_HASH = re.compile(r'^\$2[aby]?\$\d\d\$[./A-Za-z0-9]{53}$')
+
+
+def _eventlet_patched():
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched('thread')
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class PasswordHasher:
+    """Password hashing off the async hub.
+
+    bcrypt, PBKDF2 and scrypt take tens to hundreds of milliseconds of CPU
+    per call and never yield, so under eventlet or gevent one login would
+    stall every socket on the worker. Hashes are computed in a bounded pool
+    of native threads the hub knows about (eventlet's ``tpool`` or gevent's
+    hub threadpool); all three release the GIL while hashing, so green
+    threads keep running meanwhile. Hashes made with another algorithm or
+    cost still verify and are upgraded on the next successful login.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self.hashed_total = 0
+        self.verified_total = 0
+        self.rehashed_total = 0
+        self.hash_seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_ALGORITHM', 'bcrypt')
+        app.config.setdefault('PASSWORD_BCRYPT_ROUNDS', 12)
+        app.config.setdefault('PASSWORD_PBKDF2_ITERATIONS', 600000)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 4)
+        app.config.setdefault('PASSWORD_HASH_OFFLOAD', True)
+        if app.config['PASSWORD_HASH_ALGORITHM'] not in ALGORITHMS:
+            raise ValueError(f'PASSWORD_HASH_ALGORITHM must be one of {", ".join(ALGORITHMS)}')
+        self.app = app
+        self._executor = None
+        if app.config.get('SOCKETIO_ASYNC_MODE') == 'eventlet':
+            from eventlet import tpool
+            # Only takes effect before tpool's threads are started
+            tpool.set_num_threads(app.config['PASSWORD_HASH_WORKERS'])
+        elif app.config.get('SOCKETIO_ASYNC_MODE') == 'gevent':
+            import gevent
+            gevent.get_hub().threadpool.maxsize = app.config['PASSWORD_HASH_WORKERS']
+        app.extensions['passwords'] = self
+
+    def hash(self, password):
+        """Hash a password with the configured algorithm and cost"""
+        self.hashed_total += 1
+        return self._offload(self._hash, password)
+
+    def verify(self, password_hash, password):
+        """Check a password against a hash in any supported format"""
+        self.verified_total += 1
+        if not password_hash:
+            return False
+        return self._offload(self._verify, password_hash, password)
+
+    def upgrade(self, password_hash, password):
+        """A new hash for a just-verified password if ``password_hash`` is outdated, else None"""
+        if not self.needs_rehash(password_hash):
+            return None
+        self.rehashed_total += 1
+        return self.hash(password)
+
+    def needs_rehash(self, password_hash):
+        """Whether a hash was made with another algorithm or cost"""
+        algorithm = self.app.config['PASSWORD_HASH_ALGORITHM']
+        match = BCRYPT_PATTERN.match(password_hash)
+        if algorithm == 'bcrypt':
+            return match is None or int(match.group(1)) != self.app.config['PASSWORD_BCRYPT_ROUNDS']
+        if match is not None:
+            return True
+        method = password_hash.split('$', 1)[0]
+        if algorithm == 'pbkdf2:sha256':
+            return method != f"pbkdf2:sha256:{self.app.config['PASSWORD_PBKDF2_ITERATIONS']}"
+        return not method.startswith('scrypt:')
+
+    def stats(self):
+        return {
+            'algorithm': self.app.config['PASSWORD_HASH_ALGORITHM'],
+            'hashed_total': self.hashed_total,
+            'verified_total': self.verified_total,
+            'rehashed_total': self.rehashed_total,
+            'hash_seconds': round(self.hash_seconds, 3)
+        }
+
+    def _hash(self, password):
+        algorithm = self.app.config['PASSWORD_HASH_ALGORITHM']
+        if algorithm == 'bcrypt':
+            salt = bcrypt.gensalt(rounds=self.app.config['PASSWORD_BCRYPT_ROUNDS'])
+            return bcrypt.hashpw(password.encode(), salt).decode()
+        if algorithm == 'pbkdf2:sha256':
+            return generate_password_hash(
+                password, method=f"pbkdf2:sha256:{self.app.config['PASSWORD_PBKDF2_ITERATIONS']}")
+        return generate_password_hash(password, method='scrypt')
+
+    def _verify(self, password_hash, password):
+        if BCRYPT_PATTERN.match(password_hash):
+            if not BCRYPT_HASH.match(password_hash):
+                return False
+            try:
+                return bcrypt.checkpw(password.encode(), password_hash.encode())
+            except ValueError:
+                return False
+        try:
+            return check_password_hash(password_hash, password)
+        except ValueError:
+            return False
+
+    def _offload(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            if not self.app.config['PASSWORD_HASH_OFFLOAD']:
+                return fn(*args)
+            async_mode = self.app.config.get('SOCKETIO_ASYNC_MODE')
+            # The hub's pools only help, and only work, once the process has
+            # been monkey patched; before that (CLI, tests) green threads
+            # aren't in use and waiting on the hub would run unrelated ones
+            if async_mode == 'eventlet' and _eventlet_patched():
+                from eventlet import tpool
+                return tpool.execute(fn, *args)
+            if async_mode == 'gevent' and _gevent_patched():
+                import gevent
+                return gevent.get_hub().threadpool.apply(fn, args)
+            # Real threads already run concurrently; the executor only caps
+            # how many hashes run at once
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config['PASSWORD_HASH_WORKERS'],
+                    thread_name_prefix='password-hash'
+                )
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self.hash_seconds += time.perf_counter() - started
+
+
+passwords = PasswordHasher()
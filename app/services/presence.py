@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+import redis
+from sqlalchemy import update
+from app import db
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+CONNECTIONS_KEY = 'presence:connections'
+LAST_SEEN_KEY = 'presence:last_seen'
+DIRTY_KEY = 'presence:dirty'
+NODES_KEY = 'presence:nodes'
+NODE_KEY = 'presence:node:{node}'
+
+# KEYS: global connections, node connections; ARGV: user_id, delta
+CHANGE_SCRIPT = """
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if count <= 0 then redis.call('HDEL', KEYS[1], ARGV[1]) end
+local local_count = redis.call('HINCRBY', KEYS[2], ARGV[1], ARGV[2])
+if local_count <= 0 then redis.call('HDEL', KEYS[2], ARGV[1]) end
+return count
+"""
+
+# KEYS: global connections, dead node connections, nodes zset, dirty set,
+# last seen hash; ARGV: node id, now
+REAP_SCRIPT = """
+local entries = redis.call('HGETALL', KEYS[2])
+for i = 1, #entries, 2 do
+    local count = redis.call('HINCRBY', KEYS[1], entries[i], -tonumber(entries[i + 1]))
+    if count <= 0 then
+        redis.call('HDEL', KEYS[1], entries[i])
+        redis.call('HSET', KEYS[5], entries[i], ARGV[2])
+        redis.call('SADD', KEYS[4], entries[i])
+    end
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[3], ARGV[1])
+return #entries / 2
+"""
+
+
+class PresenceService:
+    """Tracks who is online in Redis instead of on the ``user`` table.
+
+    Every connected sid adds one to the user's count in a shared hash (and in
+    this node's own hash, so the counts of a crashed node can be reaped by
+    the survivors). ``last_seen`` is kept in Redis and written back to SQL in
+    periodic batches together with ``is_online``.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self.node_id = uuid.uuid4().hex
+        self._running = False
+        self._flush_lock = threading.Lock()
+        self._change = None
+        self._reap = None
+        self.flushed_total = 0
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('PRESENCE_FLUSH_INTERVAL', 30)
+        app.config.setdefault('PRESENCE_NODE_TIMEOUT', 90)
+        self.app = app
+        self.redis = redis_client
+        self._change = redis_client.register_script(CHANGE_SCRIPT)
+        self._reap = redis_client.register_script(REAP_SCRIPT)
+        app.extensions['presence'] = self
+
+    @property
+    def _node_key(self):
+        return NODE_KEY.format(node=self.node_id)
+
+    def connect(self, user_id):
+        """Count a new connection for a user; returns their open connections"""
+        count = self._change(keys=[CONNECTIONS_KEY, self._node_key], args=[int(user_id), 1])
+        self.touch(user_id)
+        self._ensure_background()
+        return int(count)
+
+    def disconnect(self, user_id):
+        """Drop one connection for a user; returns their open connections"""
+        count = self._change(keys=[CONNECTIONS_KEY, self._node_key], args=[int(user_id), -1])
+        self.touch(user_id)
+        return max(int(count), 0)
+
+    def touch(self, user_id):
+        """Record activity; the SQL row is updated by the next batch flush"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(LAST_SEEN_KEY, int(user_id), time.time())
+        pipe.sadd(DIRTY_KEY, int(user_id))
+        pipe.execute()
+        self._ensure_background()
+
+    def is_online(self, user_id):
+        return self.redis.hexists(CONNECTIONS_KEY, int(user_id))
+
+    def online_count(self):
+        return self.redis.hlen(CONNECTIONS_KEY)
+
+    def lookup(self, user_ids):
+        """Return ``{user_id: {'is_online', 'last_seen'}}`` in one round trip"""
+        user_ids = [int(user_id) for user_id in user_ids]
+        if not user_ids:
+            return {}
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hmget(CONNECTIONS_KEY, user_ids)
+        pipe.hmget(LAST_SEEN_KEY, user_ids)
+        counts, seen = pipe.execute()
+        return {
+            user_id: {
+                'is_online': bool(count and int(count) > 0),
+                'last_seen': datetime.utcfromtimestamp(float(last)).isoformat() if last else None
+            }
+            for user_id, count, last in zip(user_ids, counts, seen)
+        }
+
+    def flush(self, batch_size=500):
+        """Write pending ``last_seen``/``is_online`` changes with bulk UPDATEs"""
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                user_ids = self.redis.spop(DIRTY_KEY, batch_size)
+                if not user_ids:
+                    break
+                state = self.lookup(user_ids)
+                rows = [{
+                    'id': user_id,
+                    'is_online': values['is_online'],
+                    'last_seen': datetime.fromisoformat(values['last_seen'])
+                } for user_id, values in state.items() if values['last_seen']]
+                if not rows:
+                    continue
+                with self.app.app_context():
+                    try:
+                        db.session.execute(update(User), rows)
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        # Keep the users dirty so the next flush retries them
+                        self.redis.sadd(DIRTY_KEY, *user_ids)
+                        logger.exception('Presence flush error: %s', e)
+                        break
+                    finally:
+                        db.session.remove()
+                flushed += len(rows)
+        self.flushed_total += flushed
+        return flushed
+
+    def heartbeat(self):
+        """Mark this node alive and reap the connections of dead nodes"""
+        now = time.time()
+        self.redis.zadd(NODES_KEY, {self.node_id: now})
+        timeout = self.app.config['PRESENCE_NODE_TIMEOUT']
+        for node in self.redis.zrangebyscore(NODES_KEY, 0, now - timeout):
+            node = node.decode() if isinstance(node, bytes) else node
+            self._reap(
+                keys=[CONNECTIONS_KEY, NODE_KEY.format(node=node), NODES_KEY, DIRTY_KEY, LAST_SEEN_KEY],
+                args=[node, now]
+            )
+
+    def stop(self):
+        """Release this node's connections and flush pending presence changes"""
+        self._running = False
+        if self.app is not None:
+            self._reap(
+                keys=[CONNECTIONS_KEY, self._node_key, NODES_KEY, DIRTY_KEY, LAST_SEEN_KEY],
+                args=[self.node_id, time.time()]
+            )
+            self.flush()
+
+    def stats(self):
+        return {
+            'online_users': self.online_count(),
+            'pending_flush': self.redis.scard(DIRTY_KEY),
+            'flushed_total': self.flushed_total
+        }
+
+    def _ensure_background(self):
+        if self._running:
+            return
+        from app import socketio
+        self._running = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        from app import socketio
+        while self._running:
+            try:
+                self.heartbeat()
+            except redis.RedisError as e:
+                logger.warning('Presence heartbeat error: %s', e)
+            socketio.sleep(self.app.config['PRESENCE_FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except redis.RedisError as e:
+                logger.exception('Presence flush error: %s', e)
+
+
+presence = PresenceService()
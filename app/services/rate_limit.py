@@ -0,0 +1,238 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+import redis
+from flask import jsonify, request
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY = 'rate:{name}:{key}'
+HITS_KEY = 'rate:hits'
+
+# KEYS: bucket hash, hit counters; ARGV: rate (tokens/s), burst, tokens
+# wanted, ttl, tokens needed, limit name. Takes up to ARGV[3] tokens, but
+# only if at least ARGV[5] are available, else counts a hit. Returns
+# {granted, ms until ARGV[5] tokens are}. Uses the Redis clock so nodes
+# with skewed clocks share one timeline.
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local needed = tonumber(ARGV[5])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local granted = 0
+if tokens >= needed then
+    granted = math.min(wanted, math.floor(tokens))
+    tokens = tokens - granted
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+local wait = 0
+if granted == 0 then
+    redis.call('HINCRBY', KEYS[2], ARGV[6], 1)
+end
+if tokens < needed then
+    wait = math.ceil((needed - tokens) / rate * 1000)
+end
+return {granted, wait}
+"""
+
+
+class _Lease:
+    """Tokens this process took from a shared bucket ahead of use"""
+
+    __slots__ = ('tokens', 'expires', 'blocked_until')
+
+    def __init__(self):
+        self.tokens = 0
+        self.expires = 0.0
+        self.blocked_until = 0.0
+
+
+class RateLimiter:
+    """Token buckets shared through Redis, with an in-process fast path.
+
+    Every limit is a bucket per key (user, room or client address) in a
+    Redis hash, refilled at ``rate`` tokens per second up to ``burst``.
+    Instead of one round trip per call, a node takes a small lease of
+    tokens at a time and spends it locally; a node that was refused
+    remembers until when and refuses locally too. A lease is at most a
+    tenth of the burst and expires after a second, so nodes can't hoard
+    a bucket. Limits are configured in ``RATE_LIMITS`` as
+    ``{name: {'rate': tokens_per_sec, 'burst': size}}``. Leases are kept
+    in an LRU of ``RATE_LIMIT_MAX_LEASES`` buckets; an evicted lease only
+    costs a round trip. If Redis is down, calls are allowed.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self._take = None
+        self._leases = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = {}
+        self.rejected = {}
+        self.round_trips = 0
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('RATE_LIMITS', {})
+        app.config.setdefault('RATE_LIMIT_LEASE_SECONDS', 1.0)
+        app.config.setdefault('RATE_LIMIT_MAX_LEASES', 10000)
+        self.app = app
+        self.redis = redis_client
+        self._take = redis_client.register_script(TAKE_SCRIPT)
+        self._leases = OrderedDict()
+        self.allowed = {}
+        self.rejected = {}
+        self.round_trips = 0
+        app.extensions['rate_limit'] = self
+
+    def hit(self, name, key, cost=1):
+        """Spend ``cost`` tokens of ``name`` for ``key``.
+
+        Returns ``(allowed, retry_after_seconds)``. A cost above the burst
+        can never be paid and is refused outright.
+        """
+        limit = self.app.config['RATE_LIMITS'].get(name)
+        if not self.app.config['RATE_LIMIT_ENABLED'] or not limit:
+            return True, 0
+        bucket = BUCKET_KEY.format(name=name, key=key)
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.get(bucket)
+            if lease is None:
+                lease = self._leases[bucket] = _Lease()
+                while len(self._leases) > self.app.config['RATE_LIMIT_MAX_LEASES']:
+                    self._leases.popitem(last=False)
+            else:
+                self._leases.move_to_end(bucket)
+            if lease.blocked_until > now:
+                return self._reject(name, lease.blocked_until - now)
+            if lease.tokens >= cost and lease.expires > now:
+                lease.tokens -= cost
+                self.allowed[name] = self.allowed.get(name, 0) + 1
+                return True, 0
+
+        rate, burst = float(limit['rate']), int(limit['burst'])
+        if cost > burst:
+            return self._reject(name, burst / rate)
+        wanted = max(cost, burst // 10)
+        try:
+            granted, wait_ms = self._take(
+                keys=[bucket, HITS_KEY],
+                args=[rate, burst, wanted, max(1, math.ceil(burst / rate)), cost, name]
+            )
+            self.round_trips += 1
+        except redis.RedisError as e:
+            logger.warning('Rate limit check failed, allowing: %s', e)
+            return True, 0
+
+        now = time.monotonic()
+        with self._lock:
+            if not granted:
+                lease.blocked_until = now + int(wait_ms) / 1000
+                retry_after = int(wait_ms) / 1000
+            else:
+                # Tokens left in an expired lease are lost, which only
+                # ever errs on the strict side
+                lease.tokens = int(granted) - cost
+                lease.expires = now + self.app.config['RATE_LIMIT_LEASE_SECONDS']
+                self.allowed[name] = self.allowed.get(name, 0) + 1
+                return True, 0
+        return self._reject(name, retry_after)
+
+    def reset(self):
+        """Forget local leases, e.g. after changing limits"""
+        with self._lock:
+            self._leases.clear()
+
+    def stats(self):
+        try:
+            shared = {k.decode() if isinstance(k, bytes) else k: int(v)
+                      for k, v in self.redis.hgetall(HITS_KEY).items()}
+        except redis.RedisError:
+            shared = None
+        return {
+            'enabled': bool(self.app.config['RATE_LIMIT_ENABLED']),
+            'allowed': dict(self.allowed),
+            'rejected': dict(self.rejected),
+            'rejected_all_nodes': shared,
+            'round_trips': self.round_trips,
+            'leases': len(self._leases)
+        }
+
+    def _reject(self, name, retry_after):
+        # Redis only counts refusals that reached it, so a blocked client
+        # spamming the local fast path costs no round trips
+        self.rejected[name] = self.rejected.get(name, 0) + 1
+        return False, max(retry_after, 0.001)
+
+
+rate_limiter = RateLimiter()
+
+
+def _remote_addr():
+    # Behind a proxy, ProxyFix sets this from X-Forwarded-For; see
+    # PROXY_FIX_X_FOR
+    return request.remote_addr or 'unknown'
+
+
+def rate_limit(name, key=None):
+    """Limit a Flask view; ``key`` computes the bucket key from the view kwargs.
+
+    Defaults to the client address. Rejected requests get a 429 with
+    ``Retry-After``.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            bucket_key = key(*args, **kwargs) if key else _remote_addr()
+            allowed, retry_after = rate_limiter.hit(name, bucket_key)
+            if not allowed:
+                response = jsonify({'error': 'Rate limit exceeded', 'retry_after': round(retry_after, 3)})
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response, 429
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def rate_limit_event(name, key, cost=None):
+    """Limit a Socket.IO handler; ``key(data)`` computes the bucket key.
+
+    ``cost(data)`` optionally prices an event in tokens, e.g. one per
+    message of a batch. A key of None skips the check. A rejected event
+    gets an ``error`` event and, for events sent with an ack,
+    ``{'error', 'retry_after'}`` as the ack.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(data=None, *args):
+            from flask_socketio import emit
+            try:
+                bucket_key = key(data)
+                tokens = cost(data) if cost else 1
+            except (KeyError, TypeError, ValueError):
+                # Malformed input is the handler's to report
+                return handler(data, *args)
+            if bucket_key is None:
+                return handler(data, *args)
+            allowed, retry_after = rate_limiter.hit(name, bucket_key, tokens)
+            if not allowed:
+                error = {'message': 'Rate limit exceeded', 'retry_after': round(retry_after, 3)}
+                emit('error', error)
+                return {'error': error['message'], 'retry_after': error['retry_after']}
+            return handler(data, *args)
+        return wrapper
+    return decorator
@@ -0,0 +1,223 @@
+import logging
+import threading
+import redis
+from sqlalchemy import bindparam
+from app import db
+from app.models.message import RoomMember
+from app.services.sequences import room_sequences, SEQUENCE_KEY
+
+logger = logging.getLogger(__name__)
+
+MARKERS_KEY = 'read_markers:{user_id}'
+DIRTY_KEY = 'read_markers:dirty'
+WARM = 'warm'
+
+# KEYS: user's markers hash, dirty set; ARGV: room_id, seq, message_id, dirty member
+# Markers only move forward, so late or repeated mark_read events are no-ops
+MARK_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current and tonumber(string.match(current, '^(-?%d+)')) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2] .. ':' .. ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[4])
+return 1
+"""
+
+# KEYS: user's markers hash; ARGV: room sequence key prefix
+# Returns nil while the hash isn't loaded, else [room_id, unread, ...] with
+# -1 for rooms whose sequence counter isn't in Redis. Sequence keys are
+# derived in the script, so this needs a non-clustered Redis.
+UNREAD_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'warm') == 0 then
+    return false
+end
+local entries = redis.call('HGETALL', KEYS[1])
+local result = {}
+for i = 1, #entries, 2 do
+    if entries[i] ~= 'warm' then
+        local read = tonumber(string.match(entries[i + 1], '^(-?%d+)'))
+        local last = redis.call('GET', ARGV[1] .. entries[i])
+        table.insert(result, entries[i])
+        if last then
+            table.insert(result, math.max(0, tonumber(last) - read))
+        else
+            table.insert(result, -1)
+        end
+    end
+end
+return result
+"""
+
+
+class ReadMarkers:
+    """Last read position per user per room, with unread counts from Redis.
+
+    A marker is the ``seq`` and ID of the last message a user has read in a
+    room, kept in one hash per user. The room sequence counters advance as
+    messages are sent, so a room's unread count is its current ``seq``
+    minus the marker: no per-recipient writes on send and no COUNT queries
+    on read. Markers are written back to ``RoomMember`` in periodic batches,
+    which also debounces clients that send ``mark_read`` while scrolling.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self._running = False
+        self._flush_lock = threading.Lock()
+        self._mark = None
+        self._unread = None
+        self.flushed_total = 0
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('READ_MARKER_FLUSH_INTERVAL', 5)
+        app.config.setdefault('READ_MARKER_TTL', 7 * 24 * 3600)
+        self.app = app
+        self.redis = redis_client
+        self._mark = redis_client.register_script(MARK_SCRIPT)
+        self._unread = redis_client.register_script(UNREAD_SCRIPT)
+        app.extensions['read_markers'] = self
+
+    def mark_read(self, user_id, room_id, seq, message_id=None):
+        """Move a user's marker forward; returns False if it was already past ``seq``"""
+        user_id, room_id = int(user_id), int(room_id)
+        key = MARKERS_KEY.format(user_id=user_id)
+        try:
+            advanced = self._mark(
+                keys=[key, DIRTY_KEY],
+                args=[room_id, int(seq), message_id or 0, f'{user_id}:{room_id}']
+            )
+            self.redis.expire(key, self.app.config['READ_MARKER_TTL'])
+        except redis.RedisError as e:
+            logger.warning('Read marker write error: %s', e)
+            return False
+        self._ensure_flusher()
+        return bool(advanced)
+
+    def forget(self, user_id, room_id):
+        """Drop a marker after the user left the room"""
+        try:
+            self.redis.hdel(MARKERS_KEY.format(user_id=int(user_id)), int(room_id))
+        except redis.RedisError as e:
+            logger.warning('Read marker delete error: %s', e)
+
+    def unread_counts(self, user_id):
+        """``{room_id: unread}`` for every room of a user, in one round trip when warm"""
+        key = MARKERS_KEY.format(user_id=int(user_id))
+        prefix = SEQUENCE_KEY.format(room_id='')
+        result = self._unread(keys=[key], args=[prefix])
+        if result is None:
+            self._load(user_id)
+            result = self._unread(keys=[key], args=[prefix])
+        counts = {int(result[i]): int(result[i + 1]) for i in range(0, len(result or []), 2)}
+
+        # Rooms whose counter was evicted are answered from SQL
+        cold = [room_id for room_id, count in counts.items() if count < 0]
+        if cold:
+            markers = self._markers(user_id, cold)
+            current = room_sequences.current_many(cold)
+            counts.update((room_id, max(0, current[room_id] - markers[room_id])) for room_id in cold)
+        return counts
+
+    def flush(self, batch_size=500):
+        """Write pending markers to ``RoomMember`` with one executemany UPDATE"""
+        table = RoomMember.__table__
+        statement = table.update()\
+            .where(table.c.user_id == bindparam('b_user_id'), table.c.room_id == bindparam('b_room_id'))\
+            .values(last_read_seq=bindparam('b_seq'), last_read_message_id=bindparam('b_message_id'))
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                members = self.redis.spop(DIRTY_KEY, batch_size)
+                if not members:
+                    break
+                pairs = [tuple(int(part) for part in (m.decode() if isinstance(m, bytes) else m).split(':'))
+                         for m in members]
+                pipe = self.redis.pipeline(transaction=False)
+                for user_id, room_id in pairs:
+                    pipe.hget(MARKERS_KEY.format(user_id=user_id), room_id)
+                rows = []
+                for (user_id, room_id), value in zip(pairs, pipe.execute()):
+                    if value is None:
+                        continue
+                    seq, message_id = (int(part) for part in value.decode().split(':'))
+                    rows.append({
+                        'b_user_id': user_id,
+                        'b_room_id': room_id,
+                        'b_seq': seq,
+                        'b_message_id': message_id or None
+                    })
+                if not rows:
+                    continue
+                with self.app.app_context():
+                    try:
+                        db.session.execute(statement, rows)
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        # Keep the markers dirty so the next flush retries them
+                        self.redis.sadd(DIRTY_KEY, *members)
+                        logger.exception('Read marker flush error: %s', e)
+                        break
+                    finally:
+                        db.session.remove()
+                flushed += len(rows)
+        self.flushed_total += flushed
+        return flushed
+
+    def stop(self):
+        """Stop the background flusher and write pending markers"""
+        self._running = False
+        if self.app is not None:
+            self.flush()
+
+    def stats(self):
+        return {
+            'pending_flush': self.redis.scard(DIRTY_KEY),
+            'flushed_total': self.flushed_total
+        }
+
+    def _markers(self, user_id, room_ids):
+        values = self.redis.hmget(MARKERS_KEY.format(user_id=int(user_id)), room_ids)
+        return {room_id: int(value.decode().split(':')[0]) if value else 0
+                for room_id, value in zip(room_ids, values)}
+
+    def _load(self, user_id):
+        # Merge SQL with markers already in Redis; the newer one wins, since
+        # Redis may hold marks that haven't been flushed yet
+        key = MARKERS_KEY.format(user_id=int(user_id))
+        rows = db.session.query(RoomMember.room_id, RoomMember.last_read_seq, RoomMember.last_read_message_id)\
+            .filter(RoomMember.user_id == int(user_id)).all()
+        cached = {k.decode(): v.decode() for k, v in self.redis.hgetall(key).items()}
+        mapping = {WARM: 1}
+        for room_id, seq, message_id in rows:
+            value = cached.get(str(room_id))
+            if value is None or int(value.split(':')[0]) < (seq or 0):
+                value = f'{seq or 0}:{message_id or 0}'
+            mapping[room_id] = value
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, self.app.config['READ_MARKER_TTL'])
+        pipe.execute()
+
+    def _ensure_flusher(self):
+        if self._running:
+            return
+        from app import socketio
+        self._running = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        from app import socketio
+        while self._running:
+            socketio.sleep(self.app.config['READ_MARKER_FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except redis.RedisError as e:
+                logger.exception('Read marker flush error: %s', e)
+
+
+read_markers = ReadMarkers()
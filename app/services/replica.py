@@ -0,0 +1,68 @@
+import logging
+from flask.globals import app_ctx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from app import db
+from app.utils.db import MeteredQueuePool, pool_stats
+
+logger = logging.getLogger(__name__)
+
+
+def _app_ctx_id():
+    # Same scope as Flask-SQLAlchemy's session: one per app context, which
+    # Flask-SocketIO pushes per event, so each green thread gets its own
+    return id(app_ctx._get_current_object())
+
+
+class ReadReplica:
+    """Optional read-only engine for reads that tolerate replication lag.
+
+    With ``SQLALCHEMY_REPLICA_URI`` set, ``session()`` is a scoped session
+    on the replica, removed at the end of every app context like
+    ``db.session``. Without it, ``session()`` is ``db.session``, so callers
+    don't need to know whether a replica exists. Only reads that can be a
+    few seconds behind should use it: older history pages and counts, not
+    anything a client reads right after writing.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.engine = None
+        self._session = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URI', None)
+        self.app = app
+        self.engine = None
+        self._session = None
+        url = app.config['SQLALCHEMY_REPLICA_URI']
+        if url:
+            # Same pool settings as the primary; the replica gets its own pool
+            options = {'poolclass': MeteredQueuePool, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+            self.engine = create_engine(url, **options)
+            self._session = scoped_session(
+                sessionmaker(bind=self.engine, query_cls=db.Query),
+                scopefunc=_app_ctx_id
+            )
+            app.teardown_appcontext(self._teardown)
+            logger.info('Read replica enabled')
+        app.extensions['replica'] = self
+
+    @property
+    def enabled(self):
+        return self._session is not None
+
+    def session(self):
+        """The session to read lag-tolerant data with"""
+        return self._session if self._session is not None else db.session
+
+    def stats(self):
+        return pool_stats(self.engine) if self.engine is not None else None
+
+    def _teardown(self, exc):
+        self._session.remove()
+
+
+replica = ReadReplica()
@@ -0,0 +1,153 @@
+import logging
+import re
+from sqlalchemy import event, func, inspect, literal_column, select, table, text
+from app import db
+from app.models.message import Message
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'message_fts'
+GIN_INDEX = 'ix_message_search_vector'
+
+# External-content FTS5 table over message.content. The triggers run inside
+# the transaction of every insert, edit and delete, so the direct and the
+# write-behind send paths keep the index current without extra calls.
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"content, content='message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON message BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON message BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF content ON message BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+)
+
+# A generated tsvector column is recomputed by Postgres on every write
+POSTGRES_DDL = (
+    "ALTER TABLE message ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('{language}', coalesce(content, ''))) STORED",
+    f"CREATE INDEX IF NOT EXISTS {GIN_INDEX} ON message USING GIN (search_vector)",
+)
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+class MessageSearch:
+    """Full-text search over message content.
+
+    Uses an FTS5 table on SQLite and a ``tsvector`` column with a GIN index
+    on Postgres. The index objects are created with the ``message`` table,
+    or on first use for databases created before search existed; ``flask
+    search reindex`` rebuilds them from existing rows.
+
+    Only the hot ``message`` table is indexed: moving a message to the
+    archive deletes it from ``message``, which drops it from the index, so
+    search covers each room's messages newer than ``Room.archived_until``.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._ready = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_LANGUAGE', 'simple')
+        app.config.setdefault('SEARCH_MAX_QUERY_LENGTH', 200)
+        self.app = app
+        self._ready = False
+        app.extensions['search'] = self
+
+    @property
+    def dialect(self):
+        return db.engine.dialect.name
+
+    def search(self, query, room_id):
+        """Message query for a room restricted to rows matching ``query``.
+
+        Terms are matched as words and all of them must appear. Returns
+        None when the query holds no searchable words.
+        """
+        terms = WORD.findall(query)
+        if not terms:
+            return None
+        self.ensure_index()
+        scoped = Message.query.filter(Message.room_id == int(room_id))
+
+        if self.dialect == 'postgresql':
+            vector = literal_column('message.search_vector')
+            tsquery = func.plainto_tsquery(self.app.config['SEARCH_LANGUAGE'], ' '.join(terms))
+            return scoped.filter(vector.op('@@')(tsquery))
+        if self.dialect != 'sqlite':
+            # No index for other databases; match every term with a scan
+            return scoped.filter(*[Message.content.ilike(f'%{term}%') for term in terms])
+
+        # Quote every term so user input can't use FTS5 query syntax
+        match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        matching = select(literal_column('rowid')).select_from(table(FTS_TABLE))\
+            .where(text(f'{FTS_TABLE} MATCH :match').bindparams(match=match))
+        return scoped.filter(Message.id.in_(matching))
+
+    def ensure_index(self):
+        """Create the index if this database predates it; returns True if created"""
+        if self._ready:
+            return False
+        created = False
+        if not self._exists():
+            logger.warning('Search index missing, building it from existing messages')
+            self.reindex()
+            created = True
+        self._ready = True
+        return created
+
+    def reindex(self):
+        """Create the index if needed and rebuild it from the message table.
+
+        Returns the number of messages indexed.
+        """
+        with db.engine.begin() as connection:
+            create_index(connection, self.app.config['SEARCH_LANGUAGE'])
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text(f'REINDEX INDEX {GIN_INDEX}'))
+            elif connection.dialect.name == 'sqlite':
+                connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        self._ready = True
+        return db.session.query(func.count(Message.id)).scalar()
+
+    def _exists(self):
+        inspector = inspect(db.engine)
+        if self.dialect == 'postgresql':
+            return any(index['name'] == GIN_INDEX for index in inspector.get_indexes('message'))
+        if self.dialect == 'sqlite':
+            return inspector.has_table(FTS_TABLE)
+        return True
+
+
+def create_index(connection, language='simple'):
+    """Run the search DDL for the connection's dialect"""
+    if connection.dialect.name == 'postgresql':
+        statements = [statement.format(language=language) for statement in POSTGRES_DDL]
+    elif connection.dialect.name == 'sqlite':
+        statements = SQLITE_DDL
+    else:
+        logger.warning('Full-text search is not supported on %s', connection.dialect.name)
+        return
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+@event.listens_for(Message.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    language = search.app.config['SEARCH_LANGUAGE'] if search.app is not None else 'simple'
+    create_index(connection, language)
+
+
+@event.listens_for(Message.__table__, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f'DROP TABLE IF EXISTS {FTS_TABLE}'))
+
+
+search = MessageSearch()
@@ -0,0 +1,87 @@
+import logging
+import redis
+from sqlalchemy import func
+from app import db
+from app.models.message import ArchivedMessage, Message
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_KEY = 'room_seq:{room_id}'
+
+
+class RoomSequences:
+    """Monotonic per-room message sequence numbers kept in Redis.
+
+    Every message gets the next ``seq`` of its room when it is sent, so a
+    client can say "I have seen up to N" and ask for the rest. A room's
+    counter is seeded from the highest ``seq`` of its messages, hot or
+    archived, the first time it is used.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        self.app = app
+        self.redis = redis_client
+        app.extensions['sequences'] = self
+
+    def reserve(self, room_id, count=1):
+        """Reserve ``count`` consecutive sequence numbers, return the first"""
+        key = SEQUENCE_KEY.format(room_id=int(room_id))
+        try:
+            if not self.redis.exists(key):
+                # SET NX so racing workers seed the counter only once
+                self.redis.set(key, self._max_seq(room_id), nx=True)
+            return int(self.redis.incrby(key, count)) - count + 1
+        except redis.RedisError as e:
+            # Without Redis fall back to the table; concurrent senders may
+            # then share a number, which replay tolerates by also ordering on id
+            logger.warning('Room sequence error: %s', e)
+            return self._max_seq(room_id) + 1
+
+    def current(self, room_id):
+        """The last sequence number handed out for a room"""
+        try:
+            value = self.redis.get(SEQUENCE_KEY.format(room_id=int(room_id)))
+        except redis.RedisError as e:
+            logger.warning('Room sequence read error: %s', e)
+            value = None
+        return int(value) if value is not None else self._max_seq(room_id)
+
+    def current_many(self, room_ids):
+        """``{room_id: last seq}`` for many rooms with one MGET.
+
+        Rooms whose counter isn't in Redis are answered with one grouped
+        query.
+        """
+        room_ids = [int(room_id) for room_id in room_ids]
+        if not room_ids:
+            return {}
+        try:
+            values = self.redis.mget([SEQUENCE_KEY.format(room_id=room_id) for room_id in room_ids])
+        except redis.RedisError as e:
+            logger.warning('Room sequence read error: %s', e)
+            values = [None] * len(room_ids)
+        current = {room_id: int(value) for room_id, value in zip(room_ids, values) if value is not None}
+        missing = [room_id for room_id in room_ids if room_id not in current]
+        if missing:
+            found = {}
+            for model in (Message, ArchivedMessage):
+                for room_id, seq in db.session.query(model.room_id, func.max(model.seq))\
+                        .filter(model.room_id.in_(missing))\
+                        .group_by(model.room_id):
+                    found[room_id] = max(found.get(room_id, 0), seq or 0)
+            current.update((room_id, found.get(room_id, 0)) for room_id in missing)
+        return current
+
+    def _max_seq(self, room_id):
+        # A room whose hot window is empty may still have archived messages
+        return max(db.session.query(func.max(model.seq)).filter(model.room_id == int(room_id)).scalar() or 0
+                   for model in (Message, ArchivedMessage))
+
+
+room_sequences = RoomSequences()
@@ -0,0 +1,158 @@
+import logging
+import json
+import uuid
+import redis
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'user_session:{sid}'
+SYNC_CHANNEL = 'user_session_updates'
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class UserSession:
+    """Decoded Socket.IO session data for one connected sid"""
+
+    __slots__ = ('sid', 'user_id', 'username', 'display_name', 'wire_format')
+
+    def __init__(self, sid, user_id, username, display_name, wire_format='json'):
+        self.sid = sid
+        self.user_id = user_id
+        self.username = username
+        self.display_name = display_name
+        self.wire_format = wire_format
+
+    @classmethod
+    def from_redis(cls, sid, data):
+        data = {_decode(key): _decode(value) for key, value in data.items()}
+        return cls(sid, int(data['user_id']), data['username'], data['display_name'],
+                   data.get('wire_format', 'json'))
+
+    def to_mapping(self):
+        return {
+            'user_id': self.user_id,
+            'username': self.username,
+            'display_name': self.display_name,
+            'wire_format': self.wire_format
+        }
+
+
+class SessionStore:
+    """Worker-local cache of Socket.IO sessions keyed by sid.
+
+    Sessions are written through to ``user_session:<sid>`` hashes in Redis so
+    other nodes can see them, but the event handlers only read the local
+    copy. Profile changes are published on a channel so every node updates
+    the sessions it holds for that user.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self._sessions = {}
+        self._by_user = {}
+        self._listening = False
+        self.node_id = uuid.uuid4().hex
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        self.app = app
+        self.redis = redis_client
+        self._sessions = {}
+        self._by_user = {}
+        app.extensions['user_sessions'] = self
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def sids(self):
+        """The sids connected to this process"""
+        return list(self._sessions)
+
+    def create(self, sid, user_id, username, display_name, wire_format='json'):
+        """Register a freshly connected sid"""
+        session = UserSession(sid, int(user_id), username, display_name, wire_format)
+        self._add(session)
+        self.redis.hset(SESSION_KEY.format(sid=sid), mapping=session.to_mapping())
+        self._ensure_listener()
+        return session
+
+    def get(self, sid):
+        """Return the session for a sid, or None if it is not connected"""
+        session = self._sessions.get(sid)
+        if session is None:
+            # Only reached if the local copy was lost, e.g. after a reload
+            data = self.redis.hgetall(SESSION_KEY.format(sid=sid))
+            if not data:
+                return None
+            session = UserSession.from_redis(sid, data)
+            self._add(session)
+        return session
+
+    def remove(self, sid):
+        """Forget a disconnected sid and return its session, if any"""
+        session = self._sessions.pop(sid, None)
+        if session is not None:
+            sids = self._by_user.get(session.user_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._by_user[session.user_id]
+        self.redis.delete(SESSION_KEY.format(sid=sid))
+        return session
+
+    def update_user(self, user_id, **fields):
+        """Apply profile changes to every session of a user on every node"""
+        self._apply_update(int(user_id), fields)
+        try:
+            self.redis.publish(SYNC_CHANNEL, json.dumps({
+                'node': self.node_id,
+                'user_id': int(user_id),
+                'fields': fields
+            }))
+        except redis.RedisError as e:
+            logger.warning('Session sync publish error: %s', e)
+
+    def _add(self, session):
+        self._sessions[session.sid] = session
+        self._by_user.setdefault(session.user_id, set()).add(session.sid)
+
+    def _apply_update(self, user_id, fields):
+        for sid in list(self._by_user.get(user_id, ())):
+            session = self._sessions.get(sid)
+            if session is None:
+                continue
+            for name, value in fields.items():
+                if name in ('username', 'display_name'):
+                    setattr(session, name, value)
+            self.redis.hset(SESSION_KEY.format(sid=sid), mapping=session.to_mapping())
+
+    def _ensure_listener(self):
+        if self._listening:
+            return
+        from app import socketio
+        self._listening = True
+        socketio.start_background_task(self._listen)
+
+    def _listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(SYNC_CHANNEL)
+        try:
+            for message in pubsub.listen():
+                try:
+                    update = json.loads(message['data'])
+                    if update.get('node') == self.node_id:
+                        continue
+                    self._apply_update(update['user_id'], update['fields'])
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning('Session sync error: %s', e)
+        except redis.RedisError as e:
+            logger.warning('Session sync listener stopped: %s', e)
+            self._listening = False
+
+
+user_sessions = SessionStore()
@@ -0,0 +1,198 @@
+import logging
+import time
+import redis
+from sqlalchemy import func
+from app.models.user import User
+from app.models.message import ArchivedMessage, Message, Room
+from app.services.replica import replica
+
+logger = logging.getLogger(__name__)
+
+TOTALS_KEY = 'stats:totals'
+ROOM_MESSAGES_KEY = 'stats:room_messages'
+RATE_KEY = 'stats:rate:{bucket}'
+RECONCILE_LOCK_KEY = 'stats:reconcile_lock'
+
+
+class StatsCounters:
+    """Application counters maintained in Redis as events happen.
+
+    Totals for users, rooms and messages live in one hash and per-room
+    message counts in another, so ``/api/stats`` never runs COUNT queries.
+    Message rates are kept in per-minute buckets. A periodic job resets the
+    counters from SQL to correct any drift.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self._running = False
+        self.reconciled_at = None
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('STATS_RECONCILE_INTERVAL', 300)
+        app.config.setdefault('STATS_RATE_BUCKET', 60)
+        app.config.setdefault('STATS_RATE_WINDOW', 60)
+        self.app = app
+        self.redis = redis_client
+        app.extensions['stats'] = self
+
+    def record_user(self):
+        self._incr(lambda pipe: pipe.hincrby(TOTALS_KEY, 'users', 1))
+
+    def record_room(self):
+        self._incr(lambda pipe: pipe.hincrby(TOTALS_KEY, 'rooms', 1))
+
+    def record_messages(self, room_id, count=1):
+        """Count new messages for a room and its current rate bucket"""
+        bucket_size = self.app.config['STATS_RATE_BUCKET']
+        bucket = int(time.time() // bucket_size)
+        rate_key = RATE_KEY.format(bucket=bucket)
+        ttl = bucket_size * (self.app.config['STATS_RATE_WINDOW'] + 1)
+
+        def incr(pipe):
+            pipe.hincrby(TOTALS_KEY, 'messages', count)
+            pipe.hincrby(ROOM_MESSAGES_KEY, int(room_id), count)
+            pipe.hincrby(rate_key, 'all', count)
+            pipe.hincrby(rate_key, int(room_id), count)
+            pipe.expire(rate_key, ttl)
+        self._incr(incr)
+
+    def record_deleted(self, room_id, count=1, pipe=None):
+        """Uncount deleted or purged messages of a room.
+
+        With ``pipe`` the decrements are queued there, to run in the
+        caller's transaction.
+        """
+        def decr(pipe):
+            pipe.hincrby(TOTALS_KEY, 'messages', -count)
+            pipe.hincrby(ROOM_MESSAGES_KEY, int(room_id), -count)
+        if pipe is not None:
+            decr(pipe)
+        else:
+            self._incr(decr)
+
+    def totals(self):
+        """Return ``{'users', 'rooms', 'messages'}``.
+
+        Increments against a missing hash leave it partial. Until a
+        reconciliation has filled every field the partial (or zero) values
+        are returned and one is started in the background, so a cold
+        ``/api/stats`` never waits on COUNT queries.
+        """
+        values = self.redis.hgetall(TOTALS_KEY)
+        if b'reconciled_at' not in values and 'reconciled_at' not in values:
+            self._reconcile_soon()
+        values = {key.decode() if isinstance(key, bytes) else key: int(value) for key, value in values.items()}
+        return {name: values.get(name, 0) for name in ('users', 'rooms', 'messages')}
+
+    def room_messages(self, room_ids=None):
+        """Message counts per room, for the given rooms or all of them"""
+        if room_ids is not None:
+            room_ids = [int(room_id) for room_id in room_ids]
+            if not room_ids:
+                return {}
+            counts = self.redis.hmget(ROOM_MESSAGES_KEY, room_ids)
+            return {room_id: int(count or 0) for room_id, count in zip(room_ids, counts)}
+        return {int(room_id): int(count) for room_id, count in self.redis.hgetall(ROOM_MESSAGES_KEY).items()}
+
+    def message_rate(self, window=5, room_id=None):
+        """Messages per bucket for the most recent ``window`` buckets, oldest first"""
+        bucket_size = self.app.config['STATS_RATE_BUCKET']
+        window = max(1, min(window, self.app.config['STATS_RATE_WINDOW']))
+        current = int(time.time() // bucket_size)
+        buckets = list(range(current - window + 1, current + 1))
+        field = 'all' if room_id is None else int(room_id)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hget(RATE_KEY.format(bucket=bucket), field)
+        counts = pipe.execute()
+        return [{
+            'bucket_start': bucket * bucket_size,
+            'messages': int(count or 0)
+        } for bucket, count in zip(buckets, counts)]
+
+    def reconcile(self):
+        """Reset every counter from the database"""
+        with self.app.app_context():
+            # These are approximate anyway; with a replica they may trail
+            # the primary by its lag until the next reconciliation
+            session = replica.session()
+            users = session.query(func.count(User.id)).scalar()
+            rooms = session.query(func.count(Room.id)).scalar()
+            per_room = {}
+            # Archived messages still count towards a room's total,
+            # tombstones of deleted ones don't
+            for model in (Message, ArchivedMessage):
+                for room_id, count in session.query(model.room_id, func.count(model.id))\
+                        .filter(model.deleted_at.is_(None))\
+                        .group_by(model.room_id):
+                    per_room[room_id] = per_room.get(room_id, 0) + count
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(TOTALS_KEY, ROOM_MESSAGES_KEY)
+        pipe.hset(TOTALS_KEY, mapping={
+            'users': users,
+            'rooms': rooms,
+            'messages': sum(per_room.values()),
+            'reconciled_at': int(time.time())
+        })
+        if per_room:
+            pipe.hset(ROOM_MESSAGES_KEY, mapping=per_room)
+        pipe.execute()
+        self.reconciled_at = time.time()
+
+    def _incr(self, commands):
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            commands(pipe)
+            pipe.execute()
+        except redis.RedisError as e:
+            # The next reconciliation repairs the missed increment
+            logger.warning('Stats counter error: %s', e)
+        self._ensure_reconciler()
+
+    def _reconcile_soon(self):
+        """Start a reconciliation in the background unless one is running"""
+        interval = self.app.config['STATS_RECONCILE_INTERVAL']
+        try:
+            # The periodic job's lock, so nodes seeing a cold hash at once
+            # start one reconciliation between them
+            if not self.redis.set(RECONCILE_LOCK_KEY, 1, nx=True, ex=int(interval)):
+                return
+        except redis.RedisError as e:
+            logger.warning('Stats reconcile lock error: %s', e)
+            return
+        from app import socketio
+        socketio.start_background_task(self._reconcile_logged)
+
+    def _reconcile_logged(self):
+        try:
+            self.reconcile()
+        except Exception as e:
+            logger.exception('Stats reconcile error: %s', e)
+
+    def _ensure_reconciler(self):
+        if self._running:
+            return
+        from app import socketio
+        self._running = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        from app import socketio
+        interval = self.app.config['STATS_RECONCILE_INTERVAL']
+        while self._running:
+            socketio.sleep(interval)
+            try:
+                # Only one node reconciles per interval
+                if self.redis.set(RECONCILE_LOCK_KEY, 1, nx=True, ex=int(interval)):
+                    self.reconcile()
+            except Exception as e:
+                logger.exception('Stats reconcile error: %s', e)
+
+
+stats_counters = StatsCounters()
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TypingAggregator:
+    """Coalesces typing indicators into one broadcast per room per tick.
+
+    Each ``typing`` event only updates worker-local state. Every
+    ``TYPING_BROADCAST_INTERVAL`` seconds the rooms whose state changed get a
+    single ``typing_update`` event listing who started and who stopped
+    typing since the last broadcast. Deltas compose across nodes, and a
+    user who stops sending ``typing`` events is reported as stopped after
+    ``TYPING_TIMEOUT`` seconds.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._typing = {}
+        self._announced = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self.events_total = 0
+        self.broadcasts_total = 0
+        self.suppressed_total = 0
+        self.expired_total = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TYPING_BROADCAST_INTERVAL', 0.5)
+        app.config.setdefault('TYPING_TIMEOUT', 5)
+        self.app = app
+        app.extensions['typing'] = self
+
+    def update(self, room_id, username, is_typing):
+        """Record a typing state change without broadcasting it"""
+        room_id = str(room_id)
+        with self._lock:
+            self.events_total += 1
+            state = self._typing.setdefault(room_id, {})
+            if is_typing:
+                state[username] = time.monotonic() + self.app.config['TYPING_TIMEOUT']
+            else:
+                state.pop(username, None)
+            self._pending[room_id] = self._pending.get(room_id, 0) + 1
+        self._ensure_ticker()
+
+    def typing_in(self, room_id):
+        """Usernames currently typing in a room on this worker"""
+        return sorted(self._typing.get(str(room_id), {}))
+
+    def tick(self):
+        """Expire stale states and broadcast one delta per changed room"""
+        from app import socketio
+        now = time.monotonic()
+        updates = []
+        with self._lock:
+            for room_id, state in list(self._typing.items()):
+                stale = [name for name, expires in state.items() if expires <= now]
+                for name in stale:
+                    del state[name]
+                if stale:
+                    self.expired_total += len(stale)
+                    self._pending.setdefault(room_id, 0)
+                if not state:
+                    del self._typing[room_id]
+
+            for room_id, events in self._pending.items():
+                current = set(self._typing.get(room_id, ()))
+                announced = self._announced.get(room_id, set())
+                started, stopped = current - announced, announced - current
+                if started or stopped:
+                    updates.append((room_id, sorted(started), sorted(stopped)))
+                    self.suppressed_total += max(events - 1, 0)
+                else:
+                    self.suppressed_total += events
+                if current:
+                    self._announced[room_id] = current
+                else:
+                    self._announced.pop(room_id, None)
+            self._pending = {}
+
+        for room_id, started, stopped in updates:
+            socketio.emit('typing_update', {
+                'room_id': room_id,
+                'started': started,
+                'stopped': stopped
+            }, to=room_id)
+        self.broadcasts_total += len(updates)
+        return len(updates)
+
+    def stats(self):
+        return {
+            'events_total': self.events_total,
+            'broadcasts_total': self.broadcasts_total,
+            'suppressed_total': self.suppressed_total,
+            'expired_total': self.expired_total,
+            'rooms_with_typists': len(self._typing)
+        }
+
+    def _ensure_ticker(self):
+        if self._running:
+            return
+        from app import socketio
+        self._running = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        from app import socketio
+        while self._running:
+            socketio.sleep(self.app.config['TYPING_BROADCAST_INTERVAL'])
+            try:
+                self.tick()
+            except Exception as e:
+                logger.exception('Typing broadcast error: %s', e)
+
+
+typing_aggregator = TypingAggregator()
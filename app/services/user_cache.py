@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import redis
+from app import db
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = 'user_cache_invalidate'
+
+
+class CachedUser:
+    """The subset of a user the request and socket handlers need"""
+
+    __slots__ = ('id', 'username', 'display_name')
+
+    def __init__(self, id, username, display_name):
+        self.id = id
+        self.username = username
+        self.display_name = display_name
+
+
+class UserCache:
+    """Worker-local LRU cache of users with a TTL.
+
+    Lets an authenticated request resolve its user without SQL. Entries are
+    dropped when a profile changes, on every worker when
+    ``USER_CACHE_PUBSUB`` is enabled.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listening = False
+        self.node_id = uuid.uuid4().hex
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('USER_CACHE_SIZE', 10000)
+        app.config.setdefault('USER_CACHE_TTL', 300)
+        app.config.setdefault('USER_CACHE_PUBSUB', True)
+        self.app = app
+        self.redis = redis_client
+        self.clear()
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        """Return a CachedUser, loading it from the database on a miss"""
+        user_id = int(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+
+        self.misses += 1
+        row = db.session.query(User.id, User.username, User.display_name)\
+            .filter(User.id == user_id).first()
+        if row is None:
+            return None
+        user = CachedUser(row.id, row.username, row.display_name)
+        self._store(user, now)
+        self._ensure_listener()
+        return user
+
+    def invalidate(self, user_id):
+        """Drop a user here and, if enabled, on every other worker"""
+        self._drop(int(user_id))
+        if self.app.config['USER_CACHE_PUBSUB']:
+            try:
+                self.redis.publish(INVALIDATE_CHANNEL, f'{self.node_id}:{int(user_id)}')
+            except redis.RedisError as e:
+                logger.warning('User cache invalidate publish error: %s', e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def _store(self, user, now):
+        with self._lock:
+            self._entries[user.id] = (now + self.app.config['USER_CACHE_TTL'], user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.app.config['USER_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+
+    def _drop(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def _ensure_listener(self):
+        if self._listening or not self.app.config['USER_CACHE_PUBSUB']:
+            return
+        from app import socketio
+        self._listening = True
+        socketio.start_background_task(self._listen)
+
+    def _listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(INVALIDATE_CHANNEL)
+        try:
+            for message in pubsub.listen():
+                data = message['data']
+                node, _, user_id = (data.decode() if isinstance(data, bytes) else data).partition(':')
+                if node != self.node_id and user_id.isdigit():
+                    self._drop(int(user_id))
+        except redis.RedisError as e:
+            logger.warning('User cache listener stopped: %s', e)
+            self._listening = False
+
+
+user_cache = UserCache()
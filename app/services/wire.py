@@ -0,0 +1,163 @@
+import json
+import logging
+from datetime import datetime, timezone
+import msgpack
+import redis
+
+logger = logging.getLogger(__name__)
+
+JSON = 'json'
+COMPACT = 'compact'
+WIRE_FORMATS = (JSON, COMPACT)
+
+ROOM_USERS_KEY = 'room_users:{room_id}'
+
+
+def format_room(room_id, wire_format):
+    """Socket.IO room that receives broadcasts for one wire format"""
+    return f'{room_id}:{wire_format}'
+
+
+def epoch_ms(value):
+    """Convert a naive UTC datetime or ISO string to integer epoch milliseconds"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def compact_fields(payload):
+    """Short-key form of a ``Message.to_dict()`` payload, without names.
+
+    ``i`` id, ``c`` content, ``u`` user id, ``r`` room id, ``t`` epoch ms,
+    ``s`` room sequence number;
+    ``m`` message type, ``e`` edit time and ``d`` deletion time are only
+    sent when set. Names are
+    resolved by the client from the room's user dictionary.
+    """
+    packed = {
+        'i': payload['id'],
+        'c': payload['content'],
+        'u': payload['user_id'],
+        'r': payload['room_id'],
+        't': epoch_ms(payload['timestamp']),
+        's': payload.get('seq')
+    }
+    if payload.get('message_type', 'text') != 'text':
+        packed['m'] = payload['message_type']
+    if payload.get('edited_at'):
+        packed['e'] = epoch_ms(payload['edited_at'])
+    if payload.get('deleted_at'):
+        packed['d'] = epoch_ms(payload['deleted_at'])
+    return packed
+
+
+def compact_change(change):
+    """Short-key form of an edit or delete delta, with the same keys as messages"""
+    packed = {'i': change['id'], 'r': change['room_id']}
+    if 'content' in change:
+        packed['c'] = change['content']
+    if change.get('edited_at'):
+        packed['e'] = epoch_ms(change['edited_at'])
+    if change.get('deleted_at'):
+        packed['d'] = epoch_ms(change['deleted_at'])
+    return packed
+
+
+def encode_compact(payload):
+    """Pack one message for compact clients"""
+    return msgpack.packb(compact_fields(payload))
+
+
+class WireBroadcaster:
+    """Broadcasts messages once per wire format.
+
+    Clients pick a format at ``connect`` and join one format sub-room per
+    chat room. Each broadcast is encoded once per format and emitted once
+    per sub-room. Compact clients get display names through a per-room user
+    dictionary (``room_users`` on join, ``room_user`` when it changes) instead
+    of on every message.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self._announced = {}
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('COMPACT_WIRE_ENABLED', True)
+        self.app = app
+        self.redis = redis_client
+        self._announced = {}
+        app.extensions['wire'] = self
+
+    def negotiate(self, requested):
+        """Pick the wire format for a connecting client"""
+        if requested == COMPACT and self.app.config['COMPACT_WIRE_ENABLED']:
+            return COMPACT
+        return JSON
+
+    def room_users(self, room_id):
+        """The user dictionary a compact client needs when joining a room"""
+        try:
+            entries = self.redis.hgetall(ROOM_USERS_KEY.format(room_id=room_id))
+        except redis.RedisError as e:
+            logger.warning('Room users read error: %s', e)
+            return {}
+        return {int(user_id): json.loads(entry) for user_id, entry in entries.items()}
+
+    def broadcast_message(self, payload, emit):
+        """Send a message payload to every format sub-room of its room"""
+        room_id = payload['room_id']
+        emit('message', payload, room=format_room(room_id, JSON))
+        if not self.app.config['COMPACT_WIRE_ENABLED']:
+            return
+        self._announce(room_id, payload['user_id'], payload['username'], payload['display_name'], emit)
+        emit('message', encode_compact(payload), room=format_room(room_id, COMPACT))
+
+    def encode_batch(self, payloads, wire_format):
+        """Encode a list of messages for one client format"""
+        if wire_format == COMPACT:
+            return msgpack.packb([compact_fields(payload) for payload in payloads])
+        return payloads
+
+    def broadcast_messages(self, room_id, payloads, emit):
+        """Send several messages of one room as a single ``messages`` event.
+
+        JSON clients get ``{'room_id', 'messages'}``; compact clients get a
+        msgpack list of short-key messages.
+        """
+        emit('messages', {'room_id': int(room_id), 'messages': payloads}, room=format_room(room_id, JSON))
+        if not self.app.config['COMPACT_WIRE_ENABLED']:
+            return
+        for payload in payloads:
+            self._announce(room_id, payload['user_id'], payload['username'], payload['display_name'], emit)
+        emit('messages', self.encode_batch(payloads, COMPACT), room=format_room(room_id, COMPACT))
+
+    def broadcast_change(self, event, change, emit):
+        """Send an edit or delete delta (the message ID plus changed fields)"""
+        room_id = change['room_id']
+        emit(event, change, room=format_room(room_id, JSON))
+        if not self.app.config['COMPACT_WIRE_ENABLED']:
+            return
+        emit(event, msgpack.packb(compact_change(change)), room=format_room(room_id, COMPACT))
+
+    def _announce(self, room_id, user_id, username, display_name, emit):
+        # Only touch Redis when this worker hasn't announced the same name yet
+        key = (int(room_id), int(user_id))
+        if self._announced.get(key) == display_name:
+            return
+        entry = [username, display_name]
+        try:
+            self.redis.hset(ROOM_USERS_KEY.format(room_id=room_id), int(user_id), json.dumps(entry))
+        except redis.RedisError as e:
+            logger.warning('Room users write error: %s', e)
+        emit('room_user', {'r': int(room_id), 'u': int(user_id), 'n': username, 'd': display_name},
+             room=format_room(room_id, COMPACT))
+        self._announced[key] = display_name
+
+
+wire = WireBroadcaster()
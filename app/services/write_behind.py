@@ -0,0 +1,277 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from sqlalchemy import func, insert, text
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.message import ArchivedMessage, Message
+from app.services.sequences import room_sequences
+
+logger = logging.getLogger(__name__)
+
+ID_SEQUENCE_KEY = 'message:id_seq'
+DEAD_LETTER_KEY = 'write_behind:dead_letter'
+
+
+class MessageWriteBehind:
+    """Write-behind pipeline that persists chat messages in bulk.
+
+    Messages are assigned an ID from a Redis sequence and handed back to the
+    caller immediately so they can be broadcast, while a background task
+    writes the pending rows with a single bulk INSERT once either the batch
+    size or the flush interval is reached.
+
+    A batch the database rejects outright (a duplicate ID, a missing room)
+    is retried row by row; rows that still fail are pushed to a Redis
+    dead-letter list instead of blocking every later message. Other errors
+    put the batch back to be retried whole.
+    """
+
+    def __init__(self, app=None, redis_client=None):
+        self.app = None
+        self.redis = None
+        self._queue = deque()
+        self._flushing = ()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._running = False
+        self._last_flush = time.monotonic()
+        self.flushed_total = 0
+        self.batches_total = 0
+        self.failures_total = 0
+        self.dead_lettered_total = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        if app is not None:
+            self.init_app(app, redis_client)
+
+    def init_app(self, app, redis_client):
+        app.config.setdefault('WRITE_BEHIND_ENABLED', False)
+        app.config.setdefault('WRITE_BEHIND_BATCH_SIZE', 200)
+        app.config.setdefault('WRITE_BEHIND_FLUSH_INTERVAL', 0.25)
+        self.app = app
+        self.redis = redis_client
+        app.extensions['write_behind'] = self
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config['WRITE_BEHIND_ENABLED']
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def has_pending(self, room_id):
+        """Whether messages of a room are queued or in a flush that hasn't committed"""
+        room_id = int(room_id)
+        with self._lock:
+            return any(row['room_id'] == room_id for rows in (self._queue, self._flushing) for row in rows)
+
+    def enqueue(self, content, user_id, room_id, username, display_name,
+                message_type='text'):
+        """Assign an ID to a new message and queue it for persistence.
+
+        Returns the message in the same shape as ``Message.to_dict()``.
+        """
+        return self.enqueue_many([content], user_id, room_id, username, display_name, message_type)[0]
+
+    def enqueue_many(self, contents, user_id, room_id, username, display_name,
+                     message_type='text'):
+        """Queue several messages from one user so they land in the same flush.
+
+        IDs and room sequence numbers are reserved with a single INCRBY each
+        and keep the order of ``contents``.
+        """
+        first_id = self._next_ids(len(contents))
+        first_seq = room_sequences.reserve(room_id, len(contents))
+        timestamp = datetime.utcnow()
+        rows = [{
+            'id': first_id + offset,
+            'content': content,
+            'user_id': user_id,
+            'room_id': int(room_id),
+            'timestamp': timestamp,
+            'message_type': message_type,
+            'seq': first_seq + offset,
+        } for offset, content in enumerate(contents)]
+        with self._lock:
+            self._queue.extend(rows)
+        self._ensure_flusher()
+
+        return [{
+            'id': row['id'],
+            'content': row['content'],
+            'user_id': user_id,
+            'username': username,
+            'display_name': display_name,
+            'room_id': row['room_id'],
+            'timestamp': timestamp.isoformat(),
+            'message_type': message_type,
+            'edited_at': None,
+            'seq': row['seq'],
+            'deleted_at': None
+        } for row in rows]
+
+    def flush(self):
+        """Write every pending message in one bulk insert"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._queue:
+                    self._last_flush = time.monotonic()
+                    return 0
+                batch = list(self._queue)
+                self._queue.clear()
+                self._flushing = batch
+
+            started = time.monotonic()
+            pending, dead = list(batch), []
+            with self.app.app_context():
+                try:
+                    try:
+                        db.session.execute(insert(Message), batch)
+                        self._sync_serial()
+                        db.session.commit()
+                    except IntegrityError as e:
+                        db.session.rollback()
+                        logger.warning('Write-behind batch rejected, retrying row by row: %s', e.orig)
+                        self._insert_rows(pending, dead)
+                except Exception as e:
+                    db.session.rollback()
+                    self.failures_total += 1
+                    # Put what isn't stored back in front so it is retried first
+                    with self._lock:
+                        self._queue.extendleft(reversed(pending))
+                        self._flushing = ()
+                    if dead:
+                        self._dead_letter(dead)
+                    logger.exception('Write-behind flush error: %s', e)
+                    return 0
+                finally:
+                    db.session.remove()
+            with self._lock:
+                self._flushing = ()
+            if dead:
+                self._dead_letter(dead)
+
+            self._last_flush = time.monotonic()
+            self.last_flush_latency = self._last_flush - started
+            self.max_flush_latency = max(self.max_flush_latency, self.last_flush_latency)
+            self.flushed_total += len(batch) - len(dead)
+            self.batches_total += 1
+            return len(batch) - len(dead)
+
+    def stop(self):
+        """Stop the background flusher and drain the queue"""
+        self._running = False
+        if self.app is not None:
+            self.flush()
+
+    def stats(self):
+        return {
+            'enabled': bool(self.enabled),
+            'queue_depth': self.queue_depth,
+            'flushed_total': self.flushed_total,
+            'batches_total': self.batches_total,
+            'failures_total': self.failures_total,
+            'dead_lettered_total': self.dead_lettered_total,
+            'last_flush_latency_ms': round(self.last_flush_latency * 1000, 3),
+            'max_flush_latency_ms': round(self.max_flush_latency * 1000, 3)
+        }
+
+    def _insert_rows(self, pending, dead):
+        """Insert a rejected batch one row at a time.
+
+        Rows leave ``pending`` as they are stored, or move to ``dead`` when
+        the database rejects them; on any other error the rest stay pending.
+        """
+        while pending:
+            row = pending[0]
+            try:
+                db.session.execute(insert(Message), [row])
+                db.session.commit()
+            except IntegrityError as e:
+                db.session.rollback()
+                logger.error('Write-behind dropped message %s of room %s: %s', row['id'], row['room_id'], e.orig)
+                dead.append(row)
+            pending.pop(0)
+        self._sync_serial()
+        db.session.commit()
+        if dead:
+            # A duplicate ID means the sequence fell behind the table
+            self._advance_sequence()
+
+    def _sync_serial(self):
+        if db.engine.dialect.name == 'postgresql':
+            # Explicit IDs do not advance the serial sequence
+            db.session.execute(text(
+                "SELECT setval(pg_get_serial_sequence('message', 'id'), "
+                "GREATEST((SELECT MAX(id) FROM message), 1))"
+            ))
+
+    def _dead_letter(self, rows):
+        self.dead_lettered_total += len(rows)
+        try:
+            self.redis.rpush(DEAD_LETTER_KEY, *[json.dumps(row, default=str) for row in rows])
+        except Exception as e:
+            logger.error('Write-behind dead letter error: %s', e)
+
+    def _next_ids(self, count):
+        """Reserve ``count`` consecutive IDs and return the first one"""
+        if not self.redis.exists(ID_SEQUENCE_KEY):
+            # Missing on first use and after a Redis restart, eviction or
+            # flush; SET NX so racing workers seed it only once
+            self.redis.set(ID_SEQUENCE_KEY, self._max_id(), nx=True)
+        return int(self.redis.incrby(ID_SEQUENCE_KEY, count)) - count + 1
+
+    def _advance_sequence(self):
+        """Move the sequence past every known ID"""
+        max_id = self._max_id()
+        # INCR/INCRBY results are unique, so racing workers are safe
+        current = int(self.redis.incr(ID_SEQUENCE_KEY))
+        if current <= max_id:
+            self.redis.incrby(ID_SEQUENCE_KEY, max_id - current + 1)
+
+    def _max_id(self):
+        """The highest message ID stored, archived or still queued here"""
+        with self.app.app_context():
+            stored = max(db.session.query(func.max(model.id)).scalar() or 0
+                         for model in (Message, ArchivedMessage))
+        with self._lock:
+            queued = max((row['id'] for rows in (self._queue, self._flushing) for row in rows), default=0)
+        return max(stored, queued)
+
+    def _ensure_flusher(self):
+        if self._running:
+            if len(self._queue) >= self.app.config['WRITE_BEHIND_BATCH_SIZE']:
+                self._wake()
+            return
+        from app import socketio
+        self._running = True
+        socketio.start_background_task(self._run)
+
+    def _wake(self):
+        # Pull the next flush forward instead of waiting for the interval
+        self._last_flush = 0
+
+    def _run(self):
+        from app import socketio
+        interval = self.app.config['WRITE_BEHIND_FLUSH_INTERVAL']
+        tick = min(interval, 0.05)
+        while self._running:
+            socketio.sleep(tick)
+            due = time.monotonic() - self._last_flush >= interval
+            if due or len(self._queue) >= self.app.config['WRITE_BEHIND_BATCH_SIZE']:
+                self.flush()
+
+
+write_behind = MessageWriteBehind()
+
+
+@atexit.register
+def _flush_on_exit():
+    if write_behind.app is not None and write_behind.queue_depth:
+        write_behind.flush()
@@ -1,18 +1,32 @@
+import logging
 from functools import wraps
 from flask import jsonify
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
 from app.models.user import User
+from app.services.user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+def jwt_required_with_user(f=None, load_model=False):
+    """Verify the JWT and pass the current user as the first argument.
+
+    By default the user comes from the worker's user cache (id, username,
+    display_name only). Use ``@jwt_required_with_user(load_model=True)`` for
+    views that need the full ``User`` row, e.g. to change it.
+    """
+    if f is None:
+        return lambda view: jwt_required_with_user(view, load_model=load_model)
 
-def jwt_required_with_user(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        print("jwt_required_with_user: Verifying JWT")
         verify_jwt_in_request()
         current_user_id = get_jwt_identity()
-        print(f"jwt_required_with_user: Current user id: {current_user_id}")
-        current_user = User.query.get(current_user_id)
+        if load_model:
+            current_user = User.query.get(current_user_id)
+        else:
+            current_user = user_cache.get(current_user_id)
         if not current_user:
-            print("jwt_required_with_user: User not found")
+            logger.info('jwt_required_with_user: user %s not found', current_user_id)
             return jsonify({'error': 'User not found'}), 404
         return f(current_user, *args, **kwargs)
     return decorated_function
@@ -0,0 +1,65 @@
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# Checkouts that wait longer than this count as slow
+SLOW_CHECKOUT = 0.01
+
+
+class MeteredQueuePool(QueuePool):
+    """``QueuePool`` that records how long checkouts wait for a connection.
+
+    The wait includes opening a new connection when the pool grows into
+    its overflow. Under eventlet a handler blocked here holds a client's
+    event, so a rising wait means the pool is too small for the number of
+    green threads using it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._metrics_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                if waited > SLOW_CHECKOUT:
+                    self.slow_checkouts += 1
+
+
+def pool_stats(engine):
+    """Size, usage and checkout wait figures for an engine's pool"""
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'idle': pool.checkedin()
+        })
+    if isinstance(pool, MeteredQueuePool):
+        stats.update({
+            'checkouts': pool.checkouts,
+            'slow_checkouts': pool.slow_checkouts,
+            'timeouts': pool.timeouts,
+            'wait_avg_ms': round(pool.wait_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            'wait_max_ms': round(pool.wait_max * 1000, 3)
+        })
+    return stats
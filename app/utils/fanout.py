@@ -0,0 +1,152 @@
+import logging
+import pickle
+import re
+import threading
+import redis
+import socketio
+
+logger = logging.getLogger(__name__)
+
+# Chat rooms are named after the room ID, optionally with a wire format
+ROOM_NAME = re.compile(r'^(\d+)(?::\w+)?$')
+
+
+def room_shard_key(room):
+    """The room ID a Socket.IO room belongs to, or None for sids and other rooms"""
+    if isinstance(room, int):
+        return room
+    match = ROOM_NAME.match(room) if isinstance(room, str) else None
+    return int(match.group(1)) if match else None
+
+
+class ShardedRedisManager(socketio.RedisManager):
+    """Redis message queue that only sends room broadcasts to nodes in the room.
+
+    The stock manager publishes everything on one channel, so every node
+    receives and unpickles every broadcast, including those for rooms it
+    has no clients in. Here broadcasts to a chat room go to one of
+    ``shards`` channels picked by room ID, and a node subscribes to a
+    shard's channel while at least one local client is in one of its
+    rooms. Everything else (emits to a single sid or to everyone,
+    callbacks, disconnects) stays on the shared channel. All nodes must use
+    the same channel and shard count.
+
+    A node starts receiving a shard once its first client joins one of
+    its rooms; broadcasts published before that subscription lands are not
+    delivered to it, which is no different from a client joining a moment
+    later.
+    """
+
+    name = 'redis-sharded'
+
+    def __init__(self, url='redis://localhost:6379/0', channel='flask-socketio', shards=64,
+                 write_only=False, logger=None, redis_options=None):
+        # Set before the base class connects, which re-subscribes shards
+        self.shards = shards
+        self._shard_rooms = {}
+        self._shard_lock = threading.Lock()
+        self.published = {'shard': 0, 'shared': 0}
+        super().__init__(url, channel=channel, write_only=write_only, logger=logger,
+                         redis_options=redis_options)
+
+    def shard_channel(self, shard):
+        return f'{self.channel}:shard:{shard}'
+
+    def channel_for(self, data):
+        """The channel a queue message is published on"""
+        if data.get('method') != 'emit' or data.get('callback') is not None:
+            return self.channel
+        rooms = data.get('room')
+        rooms = rooms if isinstance(rooms, (list, tuple)) else [rooms]
+        shards = set()
+        for room in rooms:
+            key = room_shard_key(room)
+            if key is None:
+                return self.channel
+            shards.add(key % self.shards)
+        if len(shards) != 1:
+            return self.channel
+        return self.shard_channel(shards.pop())
+
+    def subscribed_shards(self):
+        with self._shard_lock:
+            return sorted(shard for shard, count in self._shard_rooms.items() if count)
+
+    def stats(self):
+        return {
+            'shards': self.shards,
+            'subscribed': len(self.subscribed_shards()),
+            'published': dict(self.published)
+        }
+
+    def enter_room(self, sid, namespace, room, eio_sid=None):
+        created = room not in self.rooms.get(namespace, {})
+        super().enter_room(sid, namespace, room, eio_sid=eio_sid)
+        if created:
+            self._room_added(room)
+
+    def leave_room(self, sid, namespace, room):
+        existed = room in self.rooms.get(namespace, {})
+        super().leave_room(sid, namespace, room)
+        if existed and room not in self.rooms.get(namespace, {}):
+            self._room_removed(room)
+
+    def _room_added(self, room):
+        key = room_shard_key(room)
+        if key is None:
+            return
+        shard = key % self.shards
+        with self._shard_lock:
+            self._shard_rooms[shard] = self._shard_rooms.get(shard, 0) + 1
+            first = self._shard_rooms[shard] == 1
+        if first:
+            self._subscribe(self.pubsub.subscribe, shard)
+
+    def _room_removed(self, room):
+        key = room_shard_key(room)
+        if key is None:
+            return
+        shard = key % self.shards
+        with self._shard_lock:
+            self._shard_rooms[shard] = self._shard_rooms.get(shard, 1) - 1
+            last = self._shard_rooms[shard] == 0
+            if last:
+                del self._shard_rooms[shard]
+        if last:
+            self._subscribe(self.pubsub.unsubscribe, shard)
+
+    def _subscribe(self, method, shard):
+        try:
+            method(self.shard_channel(shard))
+        except redis.RedisError as e:
+            # The listener re-subscribes every shard when it reconnects
+            logger.warning('Could not change subscription to shard %s: %s', shard, e)
+
+    def _redis_connect(self):
+        super()._redis_connect()
+        shards = self.subscribed_shards()
+        if shards:
+            self.pubsub.subscribe(*[self.shard_channel(shard) for shard in shards])
+
+    def _publish(self, data):
+        channel = self.channel_for(data)
+        self.published['shared' if channel == self.channel else 'shard'] += 1
+        retry = True
+        while True:
+            try:
+                if not retry:
+                    self._redis_connect()
+                return self.redis.publish(channel, pickle.dumps(data))
+            except redis.RedisError:
+                if not retry:
+                    logger.error('Cannot publish to redis... giving up')
+                    break
+                logger.error('Cannot publish to redis... retrying')
+                retry = False
+
+    def _listen(self):
+        # Anything arriving was published on a channel this node subscribed to
+        self.pubsub.subscribe(self.channel)
+        for message in self._redis_listen_with_retries():
+            if message['type'] == 'message' and 'data' in message:
+                yield message['data']
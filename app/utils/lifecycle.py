@@ -0,0 +1,43 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def disconnect_clients():
+    """Close this process's Socket.IO connections ahead of a shutdown.
+
+    Only the Engine.IO transport is closed, so clients see a transport
+    error and reconnect (through the load balancer, to another process)
+    and resume from their last ``seq``, instead of treating it as a server
+    kick and staying offline. Returns the number of sids closed.
+    """
+    from app import socketio
+    from app.services.sessions import user_sessions
+    eio = socketio.server.eio
+    sids = user_sessions.sids()
+    for sid in sids:
+        try:
+            eio_sid = socketio.server.manager.eio_sid_from_sid(sid, '/')
+            socket = eio.sockets.pop(eio_sid, None) if eio_sid is not None else None
+            if socket is not None:
+                # eio.disconnect() would wait for each polling client to
+                # collect its close packet; don't hold up the shutdown for it
+                socket.close(wait=False)
+        except Exception as e:
+            logger.warning('Disconnect of %s during shutdown failed: %s', sid, e)
+    return len(sids)
+
+
+def shutdown_services():
+    """Stop background jobs and flush everything buffered in this process"""
+    from app.services.write_behind import write_behind
+    from app.services.read_markers import read_markers
+    from app.services.presence import presence
+    from app.services.archive import archiver
+    archiver.stop()
+    # Messages first: markers and presence may refer to them
+    for service in (write_behind, read_markers, presence):
+        try:
+            service.stop()
+        except Exception as e:
+            logger.exception('%s shutdown error: %s', type(service).__name__, e)
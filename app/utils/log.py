@@ -0,0 +1,123 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from flask import request
+
+logger = logging.getLogger('app')
+
+_listener = None
+
+REDACTED = '[REDACTED]'
+
+SECRET_KEYS = r'(?:password|token|access_token|refresh_token|secret|authorization)'
+
+# Bearer tokens, JWT-looking strings and secret-ish JSON/dict/form fields
+REDACT_PATTERNS = (
+    (re.compile(r'(Bearer\s+)[A-Za-z0-9\-_.=]+'), r'\1' + REDACTED),
+    (re.compile(r'eyJ[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]*'), REDACTED),
+    (re.compile(r'(["\']' + SECRET_KEYS + r'["\']\s*:\s*)(["\'])(?:\\.|(?!\2).)*\2', re.IGNORECASE),
+     r'\1\2' + REDACTED + r'\2'),
+    (re.compile(r'(\b' + SECRET_KEYS + r'=)[^&\s,]+', re.IGNORECASE), r'\1' + REDACTED),
+)
+
+
+def redact(text):
+    """Mask passwords and tokens in a string"""
+    for pattern, replacement in REDACT_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class RedactingFilter(logging.Filter):
+    """Rewrites records so secrets never reach a handler"""
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = redact(message)
+        if redacted != message:
+            record.msg = redacted
+            record.args = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records below WARNING; warnings and errors always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for log shippers"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def configure_logging(app):
+    """Send the ``app`` logger through a queue to a background writer.
+
+    Handlers that do I/O run on the listener's thread, so a log call on a
+    request or socket handler only costs a queue put.
+    """
+    global _listener
+    app.config.setdefault('LOG_LEVEL', 'INFO')
+    app.config.setdefault('LOG_SAMPLE_RATE', 1.0)
+    app.config.setdefault('LOG_JSON', False)
+    app.config.setdefault('LOG_REQUEST_BODY_ROUTES', [])
+
+    if _listener is not None:
+        _listener.stop()
+
+    stream = logging.StreamHandler(sys.stdout)
+    if app.config['LOG_JSON']:
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    # The queue is unbounded so logging never blocks the caller
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(app.config['LOG_SAMPLE_RATE']))
+    queue_handler.addFilter(RedactingFilter())
+
+    logger.handlers = [queue_handler]
+    logger.setLevel(app.config['LOG_LEVEL'])
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+    body_routes = frozenset(app.config['LOG_REQUEST_BODY_ROUTES'])
+    if body_routes:
+        @app.before_request
+        def log_request_body():
+            # Opt-in per endpoint; nothing is decoded unless DEBUG is on
+            if request.endpoint in body_routes and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('%s %s body: %s', request.method, request.path,
+                             request.get_data(as_text=True))
+
+
+@atexit.register
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
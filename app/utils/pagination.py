@@ -0,0 +1,64 @@
+import base64
+from datetime import datetime
+from sqlalchemy import or_
+from app.models.message import Message
+
+def encode_cursor(timestamp, message_id):
+    """Encode a (timestamp, id) position as an opaque cursor string"""
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    raw = f'{timestamp}|{message_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor into (timestamp, id); raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, message_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+def cursors_for(messages):
+    """Build before/after cursors for a page of serialized messages (oldest first)"""
+    if not messages:
+        return {'before': None, 'after': None}
+    oldest, newest = messages[0], messages[-1]
+    return {
+        'before': encode_cursor(oldest['timestamp'], oldest['id']),
+        'after': encode_cursor(newest['timestamp'], newest['id'])
+    }
+
+def keyset_page(query, limit, before=None, after=None, model=Message):
+    """Fetch one page of messages relative to a cursor position.
+
+    ``query`` should already be filtered to a room. With ``before`` the page
+    holds the messages just older than the cursor, with ``after`` the ones
+    just newer, otherwise the newest messages. Returns ``(messages, has_more)``
+    with messages ordered oldest first. The redundant ``<=``/``>=`` bound on
+    the timestamp gives the planner a range scan on the (room_id, timestamp,
+    id) index instead of scanning past an OFFSET. ``model`` is the mapped
+    class the query selects from, e.g. ``ArchivedMessage``.
+    """
+    if after is not None:
+        timestamp, message_id = decode_cursor(after)
+        query = query.filter(
+            model.timestamp >= timestamp,
+            or_(model.timestamp > timestamp, model.id > message_id)
+        ).order_by(model.timestamp.asc(), model.id.asc())
+    else:
+        if before is not None:
+            timestamp, message_id = decode_cursor(before)
+            query = query.filter(
+                model.timestamp <= timestamp,
+                or_(model.timestamp < timestamp, model.id < message_id)
+            )
+        query = query.order_by(model.timestamp.desc(), model.id.desc())
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is None:
+        rows.reverse()
+    return rows, has_more
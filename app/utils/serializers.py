@@ -0,0 +1,89 @@
+from app import db
+from app.models.user import User
+from app.models.message import Message, Room, RoomMember
+from app.services.stats import stats_counters
+
+def _message_columns(model):
+    return (
+        model.id,
+        model.content,
+        model.user_id,
+        User.username,
+        User.display_name,
+        model.room_id,
+        model.timestamp,
+        model.message_type,
+        model.edited_at,
+        model.seq,
+        model.deleted_at
+    )
+
+MESSAGE_COLUMNS = _message_columns(Message)
+
+ROOM_COLUMNS = (
+    Room.id,
+    Room.name,
+    Room.description,
+    Room.is_private,
+    Room.created_by,
+    Room.created_at
+)
+
+def message_columns(query, model=Message):
+    """Turn a Message query into a column-only query joined to the author.
+
+    Keeps the query's filters and ordering but loads plain rows instead of
+    ORM objects, so serializing a page needs no per-message author lookup.
+    Pass ``model=ArchivedMessage`` for queries over the archive.
+    """
+    return query.join(User, model.user_id == User.id).with_entities(*_message_columns(model))
+
+def message_row_to_dict(row):
+    """Serialize a row from ``message_columns`` like ``Message.to_dict()``"""
+    return {
+        'id': row.id,
+        'content': row.content,
+        'user_id': row.user_id,
+        'username': row.username,
+        'display_name': row.display_name,
+        'room_id': row.room_id,
+        'timestamp': row.timestamp.isoformat(),
+        'message_type': row.message_type,
+        'edited_at': row.edited_at.isoformat() if row.edited_at else None,
+        'seq': row.seq,
+        'deleted_at': row.deleted_at.isoformat() if row.deleted_at else None
+    }
+
+def serialize_messages(rows):
+    return [message_row_to_dict(row) for row in rows]
+
+def room_row_to_dict(row, message_count):
+    """Serialize a row with ``ROOM_COLUMNS`` like ``Room.to_dict()``"""
+    return {
+        'id': row.id,
+        'name': row.name,
+        'description': row.description,
+        'is_private': row.is_private,
+        'created_by': row.created_by,
+        'created_at': row.created_at.isoformat(),
+        'message_count': message_count
+    }
+
+def serialize_rooms(query):
+    """Serialize a Room query like ``Room.to_dict()`` in one query.
+
+    Message counts come from the Redis counters, as in "my rooms".
+    """
+    rows = query.with_entities(*ROOM_COLUMNS).all()
+    counts = stats_counters.room_messages([row.id for row in rows])
+    return [room_row_to_dict(row, counts.get(row.id, 0)) for row in rows]
+
+def member_room_rows(user_id, room_ids):
+    """Room columns plus the user's role, in room order"""
+    if not room_ids:
+        return []
+    return db.session.query(*ROOM_COLUMNS, RoomMember.role)\
+        .join(RoomMember, RoomMember.room_id == Room.id)\
+        .filter(RoomMember.user_id == user_id, Room.id.in_(room_ids))\
+        .order_by(Room.id)\
+        .all()
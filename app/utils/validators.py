@@ -1,6 +1,9 @@
+import logging
 import re
 from flask import request, jsonify
 
+logger = logging.getLogger(__name__)
+
 def validate_email(email):
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -22,8 +25,6 @@ def validate_json(*required_fields):
     """Decorator to validate JSON request data"""
     def decorator(f):
         def wrapper(*args, **kwargs):
-            print(f"validate_json: Content-Type: {request.content_type}")
-            print(f"validate_json: JSON data: {request.get_json(silent=True)}")
             if not request.is_json:
                 return jsonify({'error': 'Request must be JSON'}), 400
             
@@ -31,7 +32,7 @@ def validate_json(*required_fields):
             missing_fields = [field for field in required_fields if field not in data]
             
             if missing_fields:
-                print(f"validate_json: Missing fields: {missing_fields}")
+                logger.debug('validate_json: missing fields %s for %s', missing_fields, request.endpoint)
                 return jsonify({
                     'error': f'Missing required fields: {", ".join(missing_fields)}'
                 }), 400
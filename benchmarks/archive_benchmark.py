@@ -0,0 +1,135 @@
+"""Hot-table query latency at different table sizes, before and after archiving.
+
+For each size the message table is seeded with messages spread evenly over
+the last year, then the history reads that grow with the table are timed:
+the first page with its COUNT (the page-number API), a keyset page, and the
+per-room COUNT behind ``Room.to_dict``. The archiver then moves everything
+older than ``--archive-after-days`` out of the hot table and the same reads
+are timed again.
+
+    python benchmarks/archive_benchmark.py
+    python benchmarks/archive_benchmark.py --sizes 100000 1000000 --database-url postgresql://...
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+from sqlalchemy import insert
+from config import config
+
+
+def seed(db, rows, rooms, chunk=50000):
+    from app.models.user import User
+    from app.models.message import Room, Message
+    user = User(username='bench', email='bench@example.com', display_name='Bench')
+    user.set_password('BenchPassword123')
+    db.session.add(user)
+    db.session.flush()
+    room_ids = []
+    for i in range(rooms):
+        room = Room(name=f'bench-{i}', created_by=user.id)
+        db.session.add(room)
+        db.session.flush()
+        room_ids.append(room.id)
+    db.session.commit()
+
+    now = datetime.utcnow()
+    step = timedelta(days=365) / rows
+    for offset in range(0, rows, chunk):
+        batch = [{
+            'content': f'benchmark message {n}',
+            'user_id': user.id,
+            'room_id': room_ids[n % rooms],
+            'timestamp': now - step * (rows - n),
+            'message_type': 'text'
+        } for n in range(offset, min(offset + chunk, rows))]
+        db.session.execute(insert(Message), batch)
+        db.session.commit()
+    return room_ids[0]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def measure(room_id, per_page, repeat):
+    from app.models.message import Message
+    from app.utils.pagination import keyset_page
+
+    def first_page():
+        return Message.query.filter_by(room_id=room_id)\
+            .order_by(Message.timestamp.desc())\
+            .paginate(page=1, per_page=per_page, error_out=False).items
+
+    def keyset():
+        return keyset_page(Message.query.filter_by(room_id=room_id), limit=per_page)
+
+    def room_count():
+        return Message.query.filter_by(room_id=room_id).count()
+
+    return {
+        'page_ms': timed(first_page, repeat),
+        'keyset_ms': timed(keyset, repeat),
+        'count_ms': timed(room_count, repeat)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--rooms', type=int, default=4)
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--archive-after-days', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--database-url', help='defaults to in-memory SQLite')
+    args = parser.parse_args()
+
+    import fakeredis
+    server = fakeredis.FakeServer()
+    redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server)
+    if args.database_url:
+        config['testing'].SQLALCHEMY_DATABASE_URI = args.database_url
+    config['testing'].LOG_LEVEL = 'WARNING'
+
+    from app import create_app, db
+    from app.models.message import Message
+    from app.services.archive import archiver
+    app = create_app('testing')
+    app.config['ARCHIVE_BATCH_SIZE'] = args.batch_size
+    app.config['ARCHIVE_AFTER_DAYS'] = args.archive_after_days
+
+    print(f'{"rows":>9} {"hot rows":>9} {"":>8} {"page ms":>9} {"keyset ms":>10} {"count ms":>9}')
+    with app.app_context():
+        for size in args.sizes:
+            db.drop_all()
+            db.create_all()
+            room_id = seed(db, size, args.rooms)
+
+            before = measure(room_id, args.per_page, args.repeat)
+            started = time.perf_counter()
+            result = archiver.run()
+            archive_sec = time.perf_counter() - started
+            after = measure(room_id, args.per_page, args.repeat)
+            hot = Message.query.count()
+
+            for label, timings in (('before', before), ('archived', after)):
+                print(f'{size:>9} {hot if label == "archived" else size:>9} {label:>8} '
+                      f'{timings["page_ms"]:>9.2f} {timings["keyset_ms"]:>10.2f} {timings["count_ms"]:>9.2f}')
+            print(f'{"":>9} archived {result["archived"]} rows in {archive_sec:.1f}s')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Message queue traffic per node with one shared channel versus sharded room channels.
+
+Starts ``--nodes`` processes, each running a Socket.IO client manager
+against a real Redis and holding fake local clients in a subset of
+``--rooms`` rooms (each room has clients on ``--spread`` nodes). The main
+process then publishes ``--messages`` broadcasts to random rooms, the way
+``handle_message`` does, and every node reports how many queue messages and
+bytes it received and how many of them it had local recipients for. With a
+single channel every node receives every broadcast; with shards a node only
+receives those of shards it has rooms in, so the useful deliveries stay the
+same while the rest disappears. A shard count above the number of rooms
+approaches one channel per room.
+
+Needs a Redis server; fakeredis can't be shared between processes.
+
+    python benchmarks/fanout_benchmark.py --redis-url redis://localhost:6379/15
+    python benchmarks/fanout_benchmark.py --nodes 8 --rooms 1000 --shards 0 64 4096
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+import socketio
+from app.utils.fanout import ShardedRedisManager
+
+
+def build_manager(args, channel, shards, write_only=False):
+    if shards:
+        return ShardedRedisManager(args.redis_url, channel=channel, shards=shards, write_only=write_only)
+    return socketio.RedisManager(args.redis_url, channel=channel, write_only=write_only)
+
+
+def node(args, channel, shards, rooms, ready, stop, results):
+    """One server process with clients in ``rooms``"""
+    logging.disable(logging.WARNING)
+    manager = build_manager(args, channel, shards)
+    counts = {'messages': 0, 'bytes': 0, 'useful': 0}
+    local = {f'{room}:json' for room in rooms}
+
+    listen = manager._listen
+
+    def counted_listen():
+        for data in listen():
+            counts['messages'] += 1
+            counts['bytes'] += len(data)
+            yield data
+    manager._listen = counted_listen
+
+    handle_emit = manager._handle_emit
+
+    def counted_emit(message):
+        if message.get('room') in local:
+            counts['useful'] += 1
+        # Delivery to the fake clients fails quietly; only routing is measured
+        return handle_emit(message)
+    manager._handle_emit = counted_emit
+
+    socketio.Server(client_manager=manager, async_mode='threading')
+    manager.initialize()
+    time.sleep(0.5)
+    for room in rooms:
+        sid = manager.connect(f'eio-{room}', '/')
+        manager.enter_room(sid, '/', f'{room}:json')
+    ready.put(True)
+    stop.wait()
+    results.put(counts)
+
+
+def run(args, shards):
+    channel = f'fanout-bench-{uuid.uuid4().hex[:8]}'
+    rng = random.Random(args.seed)
+    members = {index: [] for index in range(args.nodes)}
+    for room in range(1, args.rooms + 1):
+        for index in rng.sample(range(args.nodes), args.spread):
+            members[index].append(room)
+
+    context = multiprocessing.get_context('spawn')
+    ready, results, stop = context.Queue(), context.Queue(), context.Event()
+    processes = [context.Process(target=node, args=(args, channel, shards, members[index], ready, stop, results))
+                 for index in range(args.nodes)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get(timeout=30)
+
+    publisher = build_manager(args, channel, shards, write_only=True)
+    payload = {'id': 0, 'content': 'x' * args.size, 'user_id': 1, 'username': 'bench',
+               'display_name': 'Bench', 'timestamp': '2026-01-01T00:00:00'}
+    started = time.perf_counter()
+    for n in range(args.messages):
+        room = rng.randint(1, args.rooms)
+        publisher.emit('message', dict(payload, id=n, room_id=room), namespace='/', room=f'{room}:json')
+    elapsed = time.perf_counter() - started
+    time.sleep(args.settle)
+    stop.set()
+    counts = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+
+    received = sum(c['messages'] for c in counts)
+    useful = sum(c['useful'] for c in counts)
+    return {
+        'published': args.messages,
+        'publish_sec': round(elapsed, 3),
+        'received_total': received,
+        'received_per_node': round(received / args.nodes, 1),
+        'bytes_per_node': round(sum(c['bytes'] for c in counts) / args.nodes),
+        'useful_deliveries': useful,
+        'wasted_share': round(1 - useful / received, 3) if received else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--redis-url', default='redis://localhost:6379/15')
+    parser.add_argument('--nodes', type=int, default=4)
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--spread', type=int, default=1, help='nodes with clients in each room')
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--size', type=int, default=200, help='message content length')
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 64, 4096], help='0 is the single channel')
+    parser.add_argument('--settle', type=float, default=2, help='seconds to wait for delivery')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    try:
+        redis.Redis.from_url(args.redis_url).ping()
+    except redis.RedisError as e:
+        parser.error(f'cannot reach Redis at {args.redis_url}: {e}')
+
+    result = {'config': vars(args)}
+    for shards in args.shards:
+        result['single_channel' if shards == 0 else f'shards_{shards}'] = run(args, shards)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Socket broadcast latency during a burst of logins, with and without hash offloading.
+
+Runs under a monkey patched eventlet hub like a production worker. A
+sender green thread broadcasts a message to a room every ``--interval``
+milliseconds and records how long after its due time each broadcast
+completes, while ``--logins`` green threads log in at once. Hashing inline
+blocks the hub for the whole bcrypt verify, so every broadcast queued
+behind a login waits; with ``PASSWORD_HASH_OFFLOAD`` the verify runs in
+eventlet's thread pool and broadcast latency should stay close to the
+idle baseline. The hashing threads still need CPU, so on a single core
+the hub gets a share of it rather than all of it; run with
+``PASSWORD_HASH_WORKERS`` below the core count for a flat line.
+
+    python benchmarks/login_burst.py
+    python benchmarks/login_burst.py --logins 50 --rounds 12 --listeners 20
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+from config import config
+
+PASSWORD = 'BurstPassword123'
+
+
+def percentiles(samples):
+    if not samples:
+        return {'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2)
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'max': round(ordered[-1], 2)}
+
+
+def build_app(args):
+    import fakeredis
+    server = fakeredis.FakeServer()
+    redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server)
+    config['testing'].LOG_LEVEL = 'WARNING'
+    config['testing'].PASSWORD_BCRYPT_ROUNDS = args.rounds
+
+    from app import create_app
+    return create_app('testing')
+
+
+def seed(app, args):
+    """Users that share one precomputed hash, so setup doesn't pay for hashing"""
+    from sqlalchemy import insert
+    from app import db
+    from app.models.user import User
+    from app.services.passwords import passwords
+    password_hash = passwords.hash(PASSWORD)
+    db.session.execute(insert(User), [{
+        'username': f'burst{i}',
+        'email': f'burst{i}@example.com',
+        'display_name': f'Burst {i}',
+        'password_hash': password_hash
+    } for i in range(args.logins + args.listeners + 1)])
+    db.session.commit()
+
+
+def measure(app, args, offload, with_logins):
+    from app import socketio
+    app.config['PASSWORD_HASH_OFFLOAD'] = offload
+    http = app.test_client()
+
+    tokens = [http.post('/api/auth/login', json={'username': f'burst{i}', 'password': PASSWORD})
+              .get_json()['access_token'] for i in range(args.listeners + 1)]
+    headers = {'Authorization': f'Bearer {tokens[0]}'}
+    room_id = http.post('/api/chat/rooms', json={'name': f'burst-{offload}-{with_logins}'},
+                        headers=headers).get_json()['room']['id']
+    sockets = [socketio.test_client(app, auth={'token': token}, flask_test_client=http) for token in tokens]
+    for sio in sockets:
+        sio.emit('join_room', {'room_id': room_id})
+        sio.get_received()
+    sender = sockets[0]
+
+    state = {'running': True}
+    latency = []
+
+    def login(i):
+        client = app.test_client()
+        client.post('/api/auth/login', json={'username': f'burst{args.listeners + 1 + i}', 'password': PASSWORD})
+
+    def broadcast():
+        # Each sample is how long after its due time a broadcast finished:
+        # hub delay before the sender wakes up plus the emit itself
+        interval = args.interval / 1000
+        n = 0
+        while state['running']:
+            due = time.perf_counter() + interval
+            eventlet.sleep(interval)
+            sender.emit('send_message', {'room_id': room_id, 'content': f'tick {n}'})
+            latency.append((time.perf_counter() - due) * 1000)
+            n += 1
+
+    ticker = eventlet.spawn(broadcast)
+    started = time.perf_counter()
+    if with_logins:
+        pool = [eventlet.spawn(login, i) for i in range(args.logins)]
+        for thread in pool:
+            thread.wait()
+    else:
+        eventlet.sleep(args.idle_sec)
+    elapsed = time.perf_counter() - started
+    state['running'] = False
+    ticker.wait()
+    for sio in sockets:
+        sio.disconnect()
+    return {
+        'broadcast_latency_ms': percentiles(latency),
+        'broadcasts': len(latency),
+        'elapsed_sec': round(elapsed, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--listeners', type=int, default=10, help='sockets in the broadcast room')
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt cost')
+    parser.add_argument('--interval', type=int, default=20, help='ms between broadcasts')
+    parser.add_argument('--idle-sec', type=float, default=2, help='length of the no-login baseline')
+    args = parser.parse_args()
+
+    app = build_app(args)
+    from app import db
+    with app.app_context():
+        db.create_all()
+        seed(app, args)
+        result = {
+            'config': dict(vars(args), cpus=os.cpu_count()),
+            'idle': measure(app, args, offload=True, with_logins=False),
+            'inline': measure(app, args, offload=False, with_logins=True),
+            'offloaded': measure(app, args, offload=True, with_logins=True)
+        }
+        db.drop_all()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Compare deep-page latency of OFFSET and keyset pagination.
+
+Seeds the message table (one million rows by default) and times fetching
+pages at increasing depth with ``.paginate()`` (OFFSET + COUNT, as the
+page-number API does) and with ``keyset_page`` (before cursor).
+
+    python benchmarks/pagination_benchmark.py
+    python benchmarks/pagination_benchmark.py --rows 200000 --database-url postgresql://...
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from config import config
+from app import create_app, db
+from app.models.user import User
+from app.models.message import Room, Message
+from app.utils.pagination import keyset_page, encode_cursor
+
+
+def seed(rows, rooms, chunk=50000):
+    user = User(username='bench', email='bench@example.com', display_name='Bench')
+    user.set_password('BenchPassword123')
+    db.session.add(user)
+    db.session.flush()
+    room_ids = []
+    for i in range(rooms):
+        room = Room(name=f'bench-{i}', created_by=user.id)
+        db.session.add(room)
+        db.session.flush()
+        room_ids.append(room.id)
+    db.session.commit()
+
+    start = datetime(2024, 1, 1)
+    for offset in range(0, rows, chunk):
+        batch = [{
+            'content': f'benchmark message {n}',
+            'user_id': user.id,
+            'room_id': room_ids[n % rooms],
+            'timestamp': start + timedelta(milliseconds=n),
+            'message_type': 'text'
+        } for n in range(offset, min(offset + chunk, rows))]
+        db.session.execute(insert(Message), batch)
+        db.session.commit()
+    return room_ids[0]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--rooms', type=int, default=4)
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url', help='defaults to in-memory SQLite')
+    args = parser.parse_args()
+
+    if args.database_url:
+        config['testing'].SQLALCHEMY_DATABASE_URI = args.database_url
+    app = create_app('testing')
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f'Seeding {args.rows} messages across {args.rooms} rooms...')
+        room_id = seed(args.rows, args.rooms)
+        room_rows = Message.query.filter_by(room_id=room_id).count()
+        max_page = room_rows // args.per_page
+
+        print(f'{"page":>8} {"offset ms":>12} {"keyset ms":>12} {"speedup":>9}')
+        page = 1
+        while page <= max_page:
+            def by_offset():
+                result = Message.query.filter_by(room_id=room_id)\
+                    .order_by(Message.timestamp.desc())\
+                    .paginate(page=page, per_page=args.per_page, error_out=False)
+                return result.items
+
+            # The cursor a client would hold after reading the previous page
+            anchor = Message.query.filter_by(room_id=room_id)\
+                .order_by(Message.timestamp.desc(), Message.id.desc())\
+                .offset((page - 1) * args.per_page - 1 if page > 1 else 0).first()
+            cursor = encode_cursor(anchor.timestamp, anchor.id) if page > 1 else None
+
+            def by_keyset():
+                rows, _ = keyset_page(Message.query.filter_by(room_id=room_id),
+                                      limit=args.per_page, before=cursor)
+                return rows
+
+            offset_ms = timed(by_offset, args.repeat)
+            keyset_ms = timed(by_keyset, args.repeat)
+            print(f'{page:>8} {offset_ms:>12.2f} {keyset_ms:>12.2f} {offset_ms / keyset_ms:>8.1f}x')
+            page *= 10
+
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
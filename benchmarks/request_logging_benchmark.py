@@ -0,0 +1,93 @@
+"""Measure per-request overhead of the old print-based request logging.
+
+Runs the same authenticated requests against two apps: one with the
+previous behaviour (a before_request hook printing every header and the
+decoded body, plus the prints in validate_json/jwt_required_with_user)
+and one with the queue-based logging subsystem. Printed output goes to a
+line-buffered file, like a container's stdout.
+
+    python benchmarks/request_logging_benchmark.py --requests 2000 --rounds 3
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis
+import redis
+from flask import request
+from app import create_app, db
+
+redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis()
+
+
+def install_legacy_logging(app):
+    @app.before_request
+    def log_request_info():
+        print(f"Request Headers: {dict(request.headers)}")
+        print(f"Request Data: {request.get_data(as_text=True)}")
+        if request.is_json:
+            # What validate_json and jwt_required_with_user used to print
+            print(f"validate_json: Content-Type: {request.content_type}")
+            print(f"validate_json: JSON data: {request.get_json(silent=True)}")
+        print("jwt_required_with_user: Verifying JWT")
+
+
+def run(app, count):
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        token = client.post('/api/auth/register', json={
+            'username': 'bench',
+            'email': 'bench@example.com',
+            'password': 'BenchPassword123',
+            'display_name': 'Bench'
+        }).get_json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        client.post('/api/chat/rooms', json={'name': 'bench'}, headers=headers)
+        # A JSON body of a realistic size that is rejected without a write
+        body = {'name': 'bench', 'description': 'x' * 2048}
+
+        samples = []
+        for i in range(count):
+            started = time.perf_counter()
+            if i % 2:
+                client.get('/api/auth/profile', headers=headers)
+            else:
+                client.post('/api/chat/rooms', json=body, headers=headers)
+            samples.append((time.perf_counter() - started) * 1e6)
+        db.drop_all()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    results = {'legacy': [], 'current': []}
+    with tempfile.NamedTemporaryFile('w', buffering=1, suffix='.log') as sink:
+        # Alternate the modes so warm-up effects hit both equally
+        for _ in range(args.rounds):
+            for mode in results:
+                app = create_app('testing')
+                if mode == 'legacy':
+                    install_legacy_logging(app)
+                with contextlib.redirect_stdout(sink):
+                    results[mode].extend(run(app, args.requests))
+
+    print(f'{"mode":>8} {"mean us":>10} {"p50 us":>10} {"p95 us":>10}')
+    for mode, samples in results.items():
+        samples.sort()
+        print(f'{mode:>8} {statistics.mean(samples):>10.1f} '
+              f'{samples[len(samples) // 2]:>10.1f} {samples[int(len(samples) * 0.95)]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
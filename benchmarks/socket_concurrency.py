@@ -0,0 +1,198 @@
+"""Socket.IO load test with concurrent clients over real connections.
+
+``socket_load.py`` drives the handlers through the test client one call at
+a time, so it measures per-message cost but never has two sends in flight.
+Here every client is a python-socketio ``Client`` with its own websocket
+and green thread: all of them connect, join a room and then send
+``--messages`` messages each at once, every ``--interval`` milliseconds.
+The send time of each message is noted and every room member records when
+it arrives, so the latencies are end-to-end fan-out latencies under
+contention, including the ones queued behind other clients' sends.
+
+Without ``--url`` the app is served in this process with eventlet on a
+loopback port (fakeredis, in-memory SQLite unless ``--database-url``), so
+clients and server share one hub and one core; point ``--url`` at a
+``serve.py`` deployment to keep them apart. Rate limits of that server
+apply to the clients. Needs the client extras: ``requests`` and
+``websocket-client``.
+
+    python benchmarks/socket_concurrency.py --clients 100 --rooms 10 --messages 20
+    python benchmarks/socket_concurrency.py --url http://localhost:5000 --clients 500
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+import requests
+import socketio
+from eventlet import wsgi
+from eventlet.event import Event
+from config import config
+from socket_load import percentiles
+
+
+def serve(args):
+    """Serve the app on a loopback port in this process, return its URL"""
+    import fakeredis
+    server = fakeredis.FakeServer()
+    redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server)
+    if args.database_url:
+        config['testing'].SQLALCHEMY_DATABASE_URI = args.database_url
+    config['testing'].LOG_LEVEL = 'WARNING'
+
+    from app import create_app, db
+    app = create_app('testing')
+    app.config['WRITE_BEHIND_ENABLED'] = args.write_behind
+    with app.app_context():
+        db.create_all()
+    listener = eventlet.listen(('127.0.0.1', 0))
+    eventlet.spawn(wsgi.server, listener, app, log_output=False, max_size=args.clients * 2)
+    return f'http://127.0.0.1:{listener.getsockname()[1]}'
+
+
+def register(url, run_id, count, rooms):
+    """Users and rooms over REST; returns the tokens and room IDs"""
+    http = requests.Session()
+    tokens = []
+    for i in range(count):
+        response = http.post(f'{url}/api/auth/register', json={
+            'username': f'conc{run_id}{i}',
+            'email': f'conc{run_id}{i}@example.com',
+            'password': 'LoadPassword123',
+            'display_name': f'Conc {i}'
+        })
+        response.raise_for_status()
+        tokens.append(response.json()['access_token'])
+    headers = {'Authorization': f'Bearer {tokens[0]}'}
+    room_ids = []
+    for i in range(rooms):
+        response = http.post(f'{url}/api/chat/rooms', json={'name': f'conc-{run_id}-{i}'}, headers=headers)
+        response.raise_for_status()
+        room_ids.append(response.json()['room']['id'])
+    return tokens, room_ids
+
+
+class LoadClient:
+    """One connected user sending into a room and timing what it receives"""
+
+    def __init__(self, index, token, room_id, sent_at):
+        self.index = index
+        self.token = token
+        self.room_id = room_id
+        self.sent_at = sent_at
+        self.latencies = []
+        self.errors = []
+        self.joined = Event()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('room_joined', lambda data: self.joined.send(True))
+        self.sio.on('message', self.on_message)
+        self.sio.on('error', lambda data: self.errors.append(data.get('message')))
+
+    def on_message(self, data):
+        sent = self.sent_at.get(data.get('content'))
+        if sent is not None:
+            self.latencies.append((time.perf_counter() - sent) * 1000)
+
+    def connect(self, url, timeout):
+        self.sio.connect(url, auth={'token': self.token}, transports=['websocket'], wait_timeout=timeout)
+        self.sio.emit('join_room', {'room_id': self.room_id})
+        self.joined.wait(timeout)
+
+    def send(self, count, interval, start):
+        start.wait()
+        for n in range(count):
+            content = f'conc {self.index} {n}'
+            self.sent_at[content] = time.perf_counter()
+            self.sio.emit('send_message', {'room_id': self.room_id, 'content': content})
+            eventlet.sleep(interval)
+
+
+def run(args):
+    url = args.url or serve(args)
+    run_id = uuid.uuid4().hex[:6]
+    tokens, room_ids = register(url, run_id, args.clients, args.rooms)
+
+    sent_at = {}
+    clients = [LoadClient(i, token, room_ids[i % len(room_ids)], sent_at) for i, token in enumerate(tokens)]
+    t0 = time.perf_counter()
+    pool = eventlet.GreenPool(args.clients)
+    for client in clients:
+        pool.spawn(client.connect, url, args.timeout)
+    pool.waitall()
+    connect_sec = time.perf_counter() - t0
+
+    start = Event()
+    for client in clients:
+        pool.spawn(client.send, args.messages, args.interval / 1000, start)
+    t0 = time.perf_counter()
+    start.send(True)
+    pool.waitall()
+    send_sec = time.perf_counter() - t0
+
+    # Wait until every broadcast arrived or the settle time is up
+    members = {room_id: sum(1 for c in clients if c.room_id == room_id) for room_id in room_ids}
+    expected = sum(members[c.room_id] for c in clients) * args.messages
+    deadline = time.perf_counter() + args.settle
+    while sum(len(c.latencies) for c in clients) < expected and time.perf_counter() < deadline:
+        eventlet.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    for client in clients:
+        client.sio.disconnect()
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    messages = len(sent_at)
+    return {
+        'config': {
+            'clients': args.clients,
+            'rooms': args.rooms,
+            'messages_per_client': args.messages,
+            'interval_ms': args.interval,
+            'server': args.url or 'in-process',
+            'write_behind': args.write_behind,
+            'python': platform.python_version()
+        },
+        'messages': messages,
+        'deliveries_expected': expected,
+        'delivered': len(latencies),
+        'errors': sorted({error for client in clients for error in client.errors}),
+        'connect_sec': round(connect_sec, 3),
+        'send_sec': round(send_sec, 3),
+        'messages_per_sec': round(messages / send_sec, 1) if send_sec else None,
+        'deliveries_per_sec': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'broadcast_latency_ms': percentiles(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='server to load instead of serving the app in-process')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--rooms', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=20, help='messages per client')
+    parser.add_argument('--interval', type=float, default=50, help='milliseconds between sends of a client')
+    parser.add_argument('--settle', type=float, default=10, help='seconds to wait for the last deliveries')
+    parser.add_argument('--timeout', type=float, default=10, help='seconds to connect and join')
+    parser.add_argument('--write-behind', action='store_true', help='in-process server only')
+    parser.add_argument('--database-url', help='in-process server only')
+    parser.add_argument('--output', help='write the JSON result to this file')
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Socket.IO load test for the chat event handlers.
+
+Simulates N clients against an in-process app: each registers over REST,
+connects with its JWT, joins a room through the ``register_events``
+handlers and then, round by round, sends messages, typing events and
+history requests. Clients are interleaved in one process with Flask-SocketIO's
+test client, where a broadcast is delivered to every recipient before
+``emit`` returns, so the measured send time is the end-to-end broadcast
+latency minus network time. Only one send is ever in flight, so this
+measures per-message cost, not contention between clients; see
+``socket_concurrency.py`` for concurrent clients over real connections.
+
+Redis is fakeredis unless ``--redis-url`` is given; the database is
+in-memory SQLite unless ``--database-url`` is given.
+
+    python benchmarks/socket_load.py --clients 50 --rooms 5 --messages 20 --output run.json
+    python benchmarks/socket_load.py --baseline run.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+from sqlalchemy import event
+from config import config
+
+# Lower is better for these; messages_per_sec is checked the other way
+REGRESSION_KEYS = (
+    ('broadcast_latency_ms', 'p95'),
+    ('broadcast_latency_ms', 'p99'),
+    ('history_latency_ms', 'p95'),
+    ('queries_per_message', None),
+)
+
+
+def percentiles(samples):
+    if not samples:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3)
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1], 3)}
+
+
+def build_app(args):
+    if args.redis_url:
+        config['testing'].REDIS_URL = args.redis_url
+    else:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server)
+    if args.database_url:
+        config['testing'].SQLALCHEMY_DATABASE_URI = args.database_url
+    config['testing'].LOG_LEVEL = 'WARNING'
+
+    from app import create_app
+    app = create_app('testing')
+    app.config['WRITE_BEHIND_ENABLED'] = args.write_behind
+    return app
+
+
+def run(args):
+    app = build_app(args)
+    from app import db, socketio
+    from app.services.write_behind import write_behind
+    from app.services.typing import typing_aggregator
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        http = app.test_client()
+
+        # Users, rooms and socket connections
+        tokens = []
+        for i in range(args.clients):
+            response = http.post('/api/auth/register', json={
+                'username': f'load{i}',
+                'email': f'load{i}@example.com',
+                'password': 'LoadPassword123',
+                'display_name': f'Load {i}'
+            })
+            tokens.append(response.get_json()['access_token'])
+        headers = [{'Authorization': f'Bearer {token}'} for token in tokens]
+
+        room_ids = []
+        for i in range(args.rooms):
+            response = http.post('/api/chat/rooms', json={'name': f'load-room-{i}'}, headers=headers[0])
+            room_ids.append(response.get_json()['room']['id'])
+
+        clients = []
+        members = {room_id: [] for room_id in room_ids}
+        for i, token in enumerate(tokens):
+            sio = socketio.test_client(app, auth={'token': token}, flask_test_client=http)
+            room_id = room_ids[i % len(room_ids)]
+            sio.emit('join_room', {'room_id': room_id})
+            clients.append((sio, room_id))
+            members[room_id].append(i)
+        for sio, _ in clients:
+            sio.get_received()
+
+        # Count statements issued while handling send_message only
+        counting = {'active': False, 'queries': 0}
+
+        def on_execute(*_):
+            if counting['active']:
+                counting['queries'] += 1
+        event.listen(db.engine, 'before_cursor_execute', on_execute)
+
+        send_ms, history_ms, typing_ms = [], [], []
+        delivered = missed = 0
+        started = time.perf_counter()
+        for round_number in range(args.messages):
+            order = list(range(len(clients)))
+            rng.shuffle(order)
+            for i in order:
+                sio, room_id = clients[i]
+
+                if args.typing and round_number % max(1, args.messages // args.typing) == 0:
+                    t0 = time.perf_counter()
+                    sio.emit('typing', {'room_id': room_id, 'is_typing': True})
+                    typing_ms.append((time.perf_counter() - t0) * 1000)
+
+                content = f'load {i} {round_number}'
+                counting['active'] = True
+                t0 = time.perf_counter()
+                sio.emit('send_message', {'room_id': room_id, 'content': content})
+                send_ms.append((time.perf_counter() - t0) * 1000)
+                counting['active'] = False
+
+                # Confirm delivery on another member of the room
+                peers = [peer for peer in members[room_id] if peer != i] or [i]
+                received = clients[rng.choice(peers)][0].get_received()
+                if any(r['name'] == 'message' and r['args'].get('content') == content for r in received):
+                    delivered += 1
+                else:
+                    missed += 1
+
+                if args.history and round_number % max(1, args.messages // args.history) == 0:
+                    t0 = time.perf_counter()
+                    http.get(f'/api/chat/rooms/{room_id}/messages', headers=headers[i])
+                    history_ms.append((time.perf_counter() - t0) * 1000)
+
+            typing_aggregator.tick()
+            if write_behind.enabled:
+                write_behind.flush()
+            for sio, _ in clients:
+                sio.get_received()
+
+        elapsed = time.perf_counter() - started
+        event.remove(db.engine, 'before_cursor_execute', on_execute)
+        for sio, _ in clients:
+            sio.disconnect()
+
+        total_messages = len(send_ms)
+        result = {
+            'config': {
+                'clients': args.clients,
+                'rooms': args.rooms,
+                'messages_per_client': args.messages,
+                'write_behind': args.write_behind,
+                'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+                'redis': 'redis' if args.redis_url else 'fakeredis',
+                'python': platform.python_version()
+            },
+            'messages': total_messages,
+            'delivered': delivered,
+            'missed': missed,
+            'elapsed_sec': round(elapsed, 3),
+            'messages_per_sec': round(total_messages / elapsed, 1) if elapsed else None,
+            'broadcast_latency_ms': percentiles(send_ms),
+            'typing_latency_ms': percentiles(typing_ms),
+            'history_latency_ms': percentiles(history_ms),
+            'queries_per_message': round(counting['queries'] / total_messages, 3) if total_messages else None,
+            'typing': typing_aggregator.stats()
+        }
+        db.drop_all()
+    return result
+
+
+def compare(result, baseline, tolerance):
+    """Return human-readable regressions against a baseline run"""
+    regressions = []
+    for key, field in REGRESSION_KEYS:
+        new = result[key][field] if field else result[key]
+        old = baseline.get(key, {}).get(field) if field else baseline.get(key)
+        if new is not None and old and new > old * (1 + tolerance):
+            name = f'{key}.{field}' if field else key
+            regressions.append(f'{name}: {old} -> {new}')
+    old_rate = baseline.get('messages_per_sec')
+    if old_rate and result['messages_per_sec'] < old_rate * (1 - tolerance):
+        regressions.append(f"messages_per_sec: {old_rate} -> {result['messages_per_sec']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--rooms', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=20, help='messages per client')
+    parser.add_argument('--typing', type=int, default=5, help='typing events per client')
+    parser.add_argument('--history', type=int, default=2, help='history fetches per client')
+    parser.add_argument('--write-behind', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--redis-url')
+    parser.add_argument('--database-url')
+    parser.add_argument('--output', help='write the JSON result to this file')
+    parser.add_argument('--baseline', help='JSON result of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print('Regressions:\n  ' + '\n  '.join(regressions), file=sys.stderr)
+            sys.exit(1)
+        print('No regressions against baseline', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,158 @@
 import os
 from datetime import timedelta
 
+def engine_options(pool_size, max_overflow):
+    """SQLAlchemy pool settings; every server process has its own pool"""
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', pool_size)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', max_overflow)),
+        # Green threads queue for a connection when the pool is busy; give
+        # up well before the client times out rather than after 30s
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    }
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///flashchat.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(pool_size=10, max_overflow=20)
+    # Older history pages and stats counts are read here when set
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or REDIS_URL
+    # Room broadcasts go on one of this many queue channels, which nodes only
+    # subscribe to while they have clients in one of its rooms. 0 puts
+    # everything on one channel. Must be the same on every node.
+    SOCKETIO_FANOUT_SHARDS = int(os.environ.get('SOCKETIO_FANOUT_SHARDS', 64))
+    # eventlet, gevent or threading; must match the gunicorn worker class
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'eventlet')
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '').split(',')
 
+    # Logging
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+    LOG_JSON = os.environ.get('LOG_JSON', 'false').lower() == 'true'
+    # Endpoints whose request bodies are logged at DEBUG, e.g. "chat.send_message"
+    LOG_REQUEST_BODY_ROUTES = [route for route in os.environ.get('LOG_REQUEST_BODY_ROUTES', '').split(',') if route]
+
+    # Write-behind message persistence
+    WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'false').lower() == 'true'
+    WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 200))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', 0.25))
+
+    # Recent room history cache
+    HISTORY_CACHE_ENABLED = os.environ.get('HISTORY_CACHE_ENABLED', 'true').lower() == 'true'
+    HISTORY_CACHE_SIZE = int(os.environ.get('HISTORY_CACHE_SIZE', 100))
+    HISTORY_CACHE_TTL = int(os.environ.get('HISTORY_CACHE_TTL', 3600))
+
+    # Typing indicator coalescing
+    TYPING_BROADCAST_INTERVAL = float(os.environ.get('TYPING_BROADCAST_INTERVAL', 0.5))
+    TYPING_TIMEOUT = float(os.environ.get('TYPING_TIMEOUT', 5))
+
+    # Presence
+    PRESENCE_FLUSH_INTERVAL = float(os.environ.get('PRESENCE_FLUSH_INTERVAL', 30))
+    PRESENCE_NODE_TIMEOUT = float(os.environ.get('PRESENCE_NODE_TIMEOUT', 90))
+
+    # Stats counters
+    STATS_RECONCILE_INTERVAL = int(os.environ.get('STATS_RECONCILE_INTERVAL', 300))
+    STATS_RATE_BUCKET = 60
+    STATS_RATE_WINDOW = 60
+
+    # Worker-local user cache for authenticated requests
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+    USER_CACHE_PUBSUB = os.environ.get('USER_CACHE_PUBSUB', 'true').lower() == 'true'
+
+    # Opt-in msgpack broadcasts for clients that connect with format=compact
+    COMPACT_WIRE_ENABLED = os.environ.get('COMPACT_WIRE_ENABLED', 'true').lower() == 'true'
+
+    # Batched socket sends; client message keys are remembered for retries
+    MESSAGE_BATCH_MAX_SIZE = int(os.environ.get('MESSAGE_BATCH_MAX_SIZE', 50))
+    MESSAGE_KEY_TTL = int(os.environ.get('MESSAGE_KEY_TTL', 3600))
+
+    # Most messages replayed per room after a reconnect before has_more is set
+    REPLAY_MAX_MESSAGES = int(os.environ.get('REPLAY_MAX_MESSAGES', 500))
+
+    # Full-text search; the language is the Postgres text search configuration
+    SEARCH_LANGUAGE = os.environ.get('SEARCH_LANGUAGE', 'simple')
+    SEARCH_MAX_QUERY_LENGTH = 200
+
+    # Redis copies of room membership used for join/send authorization
+    MEMBERSHIP_CACHE_TTL = int(os.environ.get('MEMBERSHIP_CACHE_TTL', 3600))
+
+    # Read markers live in Redis and are written to room_member in batches
+    READ_MARKER_FLUSH_INTERVAL = float(os.environ.get('READ_MARKER_FLUSH_INTERVAL', 5))
+    READ_MARKER_TTL = 7 * 24 * 3600
+
+    # Password hashing runs in a pool of native threads off the async hub.
+    # Hashes with another algorithm or cost are upgraded on login.
+    PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM', 'bcrypt')
+    PASSWORD_BCRYPT_ROUNDS = int(os.environ.get('PASSWORD_BCRYPT_ROUNDS', 12))
+    PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600000))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+    PASSWORD_HASH_OFFLOAD = os.environ.get('PASSWORD_HASH_OFFLOAD', 'true').lower() == 'true'
+
+    # Archival of old messages out of the hot table; rooms can override the
+    # day counts. No retention means archived messages are kept forever.
+    ARCHIVE_ENABLED = os.environ.get('ARCHIVE_ENABLED', 'false').lower() == 'true'
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    MESSAGE_RETENTION_DAYS = int(os.environ['MESSAGE_RETENTION_DAYS']) if os.environ.get('MESSAGE_RETENTION_DAYS') else None
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+    ARCHIVE_INTERVAL = int(os.environ.get('ARCHIVE_INTERVAL', 3600))
+
+    # Token buckets shared through Redis: rate is tokens per second, burst
+    # the bucket size. send_message and typing are per user, room_send per
+    # room, login and register per client address.
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMITS = {
+        'send_message': {'rate': 5, 'burst': 20},
+        'room_send': {'rate': 50, 'burst': 200},
+        'typing': {'rate': 2, 'burst': 10},
+        'join_room': {'rate': 2, 'burst': 20},
+        'login': {'rate': 0.2, 'burst': 10},
+        'register': {'rate': 0.05, 'burst': 5}
+    }
+
+    # Proxies in front of the app that append to X-Forwarded-For and set
+    # X-Forwarded-Proto. 0 trusts no headers and uses the socket address,
+    # which is right when clients connect directly; behind nginx it is 1.
+    # Per-address rate limits key on the result.
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+
+    # Prometheus metrics on /metrics; set a token to require it as a bearer
+    # token, without one only loopback addresses may scrape
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
 class DevelopmentConfig(Config):
     DEBUG = True
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(pool_size=5, max_overflow=5)
 
 class ProductionConfig(Config):
     DEBUG = False
+    # Per serve.py instance; keep instances * (size + overflow) under the
+    # database's max_connections
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(pool_size=20, max_overflow=10)
 
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # In-memory SQLite shares one connection through a StaticPool
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_REPLICA_URI = None
+    # Cheapest bcrypt cost, so registering test users stays fast
+    PASSWORD_BCRYPT_ROUNDS = 4
+    # No hub to keep responsive; hash inline
+    PASSWORD_HASH_OFFLOAD = False
+    # Single process; broadcasts don't need the Redis message queue
+    SOCKETIO_MESSAGE_QUEUE = None
+    # Tests that need limits turn them on
+    RATE_LIMIT_ENABLED = False
 
 config = {
     'development': DevelopmentConfig,
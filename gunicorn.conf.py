@@ -0,0 +1,66 @@
+"""Gunicorn settings for one FlashChat server process.
+
+    gunicorn -c gunicorn.conf.py run:app
+
+Socket.IO's long-polling transport needs every request of a session to hit
+the process that holds it, and gunicorn balances requests between its
+workers without affinity, so each gunicorn runs exactly one worker.
+Scale out with several gunicorns on consecutive ports behind a sticky
+(``ip_hash``) proxy; ``serve.py`` starts and supervises them.
+"""
+import os
+import signal
+
+# Only stdlib and redis here: the app is imported by the worker after the
+# async library has monkey patched it
+from serve import check_message_queue, message_queue_url, worker_class as _worker_class
+
+async_mode = os.environ.get('SOCKETIO_ASYNC_MODE', 'eventlet')
+
+bind = os.environ.get('GUNICORN_BIND') or f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = 1
+worker_class = _worker_class(async_mode)
+# Concurrent connections per green worker; every websocket holds one
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 2000))
+# Only used by the threading mode
+threads = int(os.environ.get('GUNICORN_THREADS', 100))
+# Time to close sockets and flush buffers after SIGTERM
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = 5
+# Websocket upgrades carry long cookie and auth headers
+limit_request_field_size = 16380
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+
+def on_starting(server):
+    url = message_queue_url()
+    check_message_queue(url)
+    server.log.info('Socket.IO message queue reachable at %s', url)
+
+
+def post_worker_init(worker):
+    # Gunicorn's SIGTERM handler only stops accepting and then waits for
+    # open connections, which websockets never close by themselves. Close
+    # them right away so the worker drains well within graceful_timeout.
+    from app import socketio
+
+    def handle_term(sig, frame):
+        worker.handle_exit(sig, frame)
+        socketio.start_background_task(_drain, worker)
+
+    signal.signal(signal.SIGTERM, handle_term)
+    signal.siginterrupt(signal.SIGTERM, False)
+
+
+def _drain(worker):
+    from app.utils.lifecycle import disconnect_clients
+    closed = disconnect_clients()
+    worker.log.info('Closed %s Socket.IO connections for shutdown', closed)
+
+
+def worker_exit(server, worker):
+    from app.utils.lifecycle import shutdown_services
+    shutdown_services()
@@ -0,0 +1,122 @@
+"""Production launcher: several single-worker gunicorns behind a sticky proxy.
+
+Socket.IO polling requests must reach the process that owns the session,
+so rather than one gunicorn with N workers (no request affinity) this
+starts N gunicorns on consecutive ports, each with one async worker, and
+expects a proxy that pins clients by IP (see ``docker/nginx.conf``).
+Broadcasts between them go through the Redis message queue, which is
+checked before anything starts. SIGTERM/SIGINT are forwarded to every
+instance, which closes its sockets and flushes its buffers before exiting;
+instances that die on their own are restarted.
+
+Instances run ProductionConfig unless ``--config`` names another one.
+
+    python serve.py --instances 4 --base-port 5000
+    python serve.py --instances 2 --config development
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import redis
+
+# Gunicorn worker class for each Socket.IO async mode
+WORKER_CLASSES = {
+    'eventlet': 'eventlet',
+    'gevent': 'gevent',
+    'threading': 'gthread'
+}
+
+
+def worker_class(async_mode):
+    """The gunicorn worker class that matches a Socket.IO async mode"""
+    try:
+        return WORKER_CLASSES[async_mode]
+    except KeyError:
+        raise ValueError(f'Unsupported SOCKETIO_ASYNC_MODE {async_mode!r}, '
+                         f'expected one of {", ".join(WORKER_CLASSES)}') from None
+
+
+def message_queue_url():
+    return os.environ.get('SOCKETIO_MESSAGE_QUEUE') or os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+
+
+def check_message_queue(url, timeout=5):
+    """Fail fast if the Socket.IO Redis message queue can't be reached.
+
+    Without the queue, broadcasts from one process never reach clients
+    connected to the others, which looks like randomly missing messages
+    rather than an error.
+    """
+    if not url:
+        return
+    client = redis.from_url(url, socket_connect_timeout=timeout, socket_timeout=timeout)
+    try:
+        client.ping()
+    except redis.RedisError as e:
+        raise RuntimeError(f'Socket.IO message queue {url} is unreachable: {e}') from e
+
+
+def start_instance(host, port, app_module, config_name):
+    # run.py builds the app from FLASK_ENV
+    env = dict(os.environ, GUNICORN_BIND=f'{host}:{port}', FLASK_ENV=config_name)
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', app_module],
+        env=env,
+        # Own process group, so a terminal's Ctrl+C only arrives via forward()
+        start_new_session=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--instances', type=int, default=int(os.environ.get('WEB_INSTANCES', os.cpu_count() or 1)))
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--base-port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--app', default='run:app', help='WSGI app passed to gunicorn')
+    parser.add_argument('--config', default='production', choices=('production', 'development'),
+                        help='configuration the instances run with, regardless of FLASK_ENV')
+    args = parser.parse_args()
+
+    # Reject a bad async mode here rather than once per instance
+    worker_class(os.environ.get('SOCKETIO_ASYNC_MODE', 'eventlet'))
+    try:
+        check_message_queue(message_queue_url())
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+    ports = [args.base_port + i for i in range(args.instances)]
+    instances = {port: start_instance(args.host, port, args.app, args.config) for port in ports}
+    print(f'Started {len(ports)} {args.config} instances on ports {ports[0]}-{ports[-1]}; '
+          f'put them behind an ip_hash upstream', flush=True)
+
+    stopping = []
+
+    def forward(sig, frame):
+        stopping.append(sig)
+        for process in instances.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    while True:
+        if stopping:
+            # Each gunicorn enforces its own graceful_timeout
+            for process in instances.values():
+                process.wait()
+            return 0
+        for port, process in instances.items():
+            if process.poll() is not None and not stopping:
+                print(f'Instance on port {port} exited with {process.returncode}, restarting', flush=True)
+                instances[port] = start_instance(args.host, port, args.app, args.config)
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,22 @@
 import pytest
 import os
 import tempfile
+import fakeredis
+import redis
+from sqlalchemy import event
 from app import create_app, db
 from app.models.user import User
 from app.models.message import Room, Message
 
 @pytest.fixture
-def app():
+def redis_server(monkeypatch):
+    """Route every Redis client created by the app to an in-memory server"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis, 'from_url', lambda url, **kwargs: fakeredis.FakeRedis(server=server))
+    return server
+
+@pytest.fixture
+def app(redis_server):
     """Create application for testing"""
     db_fd, db_path = tempfile.mkstemp()
     
@@ -47,4 +57,35 @@ def auth_headers(client):
     response = client.post('/api/auth/register', json=user_data)
     token = response.get_json()['access_token']
     
-    return {'Authorization': f'Bearer {token}'}
\ No newline at end of file
+    return {'Authorization': f'Bearer {token}'}
+
+@pytest.fixture
+def room_id(client, auth_headers):
+    """Create a public room owned by the test user and return its ID"""
+    response = client.post('/api/chat/rooms', json={'name': 'Test Room'}, headers=auth_headers)
+    return response.get_json()['room']['id']
+
+class QueryCounter:
+    """Count SQL statements executed against the app's engine"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+    
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+    
+    def __enter__(self):
+        # Start from an empty identity map so cached objects don't hide queries
+        db.session.remove()
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+    
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+@pytest.fixture
+def count_queries(app):
+    """Return a context manager that counts queries run inside it"""
+    return lambda: QueryCounter(db.engine)
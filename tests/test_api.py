@@ -0,0 +1,57 @@
+from app import db, socketio
+from app.models.message import Room
+from app.services.stats import RECONCILE_LOCK_KEY, stats_counters
+
+class TestStats:
+    def test_stats_follow_events(self, client, auth_headers):
+        """Test that counters move with registrations, rooms and messages"""
+        room_id = client.post('/api/chat/rooms', json={'name': 'Stats Room'},
+                              headers=auth_headers).get_json()['room']['id']
+        for _ in range(3):
+            client.post(f'/api/chat/rooms/{room_id}/messages',
+                        json={'content': 'hello'}, headers=auth_headers)
+        
+        response = client.get(f'/api/stats?rooms={room_id}&rate=5')
+        data = response.get_json()
+        assert data['total_users'] == 1
+        assert data['total_rooms'] == 1
+        assert data['total_messages'] == 3
+        assert data['room_messages'] == {str(room_id): 3}
+        assert len(data['message_rate']) == 5
+        assert data['message_rate'][-1]['messages'] == 3
+    
+    def test_stats_do_not_query_the_database(self, client, auth_headers, count_queries):
+        """Test that a warm /api/stats call runs no SQL"""
+        stats_counters.reconcile()
+        
+        with count_queries() as counter:
+            response = client.get('/api/stats')
+        assert response.status_code == 200
+        assert counter.count == 0
+    
+    def test_cold_stats_reconcile_in_background(self, app, client, auth_headers, count_queries, monkeypatch):
+        """Test that a cold hash is answered at once and reconciled by one background task"""
+        tasks = []
+        monkeypatch.setattr(socketio, 'start_background_task', lambda target, *args: tasks.append(target))
+        db.session.add(Room(name='Out of band', created_by=1))
+        db.session.commit()
+        
+        with count_queries() as counter:
+            assert client.get('/api/stats').get_json()['total_rooms'] == 0
+            client.get('/api/stats')
+        assert counter.count == 0
+        assert stats_counters.redis.exists(RECONCILE_LOCK_KEY)
+        assert tasks == [stats_counters._reconcile_logged]
+        
+        tasks[0]()
+        assert client.get('/api/stats').get_json()['total_rooms'] == 1
+    
+    def test_reconcile_repairs_drift(self, app, client, auth_headers):
+        """Test that reconciliation resets counters from SQL"""
+        stats_counters.reconcile()
+        db.session.add(Room(name='Out of band', created_by=1))
+        db.session.commit()
+        assert stats_counters.totals()['rooms'] == 0
+        
+        stats_counters.reconcile()
+        assert client.get('/api/stats').get_json()['total_rooms'] == 1
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from app import db
+from app.models.message import ArchivedMessage, Message, Room
+from app.services.archive import archiver
+
+class TestArchive:
+    @pytest.fixture
+    def room_id(self, room_id):
+        user_id = db.session.get(Room, room_id).created_by
+        
+        # Ten messages a day apart, the oldest 9 days ago
+        now = datetime.utcnow()
+        db.session.execute(insert(Message), [{
+            'content': f'Day {n}',
+            'user_id': user_id,
+            'room_id': room_id,
+            'timestamp': now - timedelta(days=9 - n),
+            'message_type': 'text',
+            'seq': n + 1
+        } for n in range(10)])
+        db.session.commit()
+        return room_id
+    
+    def test_old_messages_move_in_batches(self, app, room_id):
+        """Test that messages past the hot window move to the archive"""
+        app.config['ARCHIVE_AFTER_DAYS'] = 5
+        app.config['ARCHIVE_BATCH_SIZE'] = 2
+        
+        assert archiver.run() == {'archived': 5, 'purged': 0}
+        assert [m.content for m in Message.query.order_by(Message.id)] == [f'Day {n}' for n in range(5, 10)]
+        assert ArchivedMessage.query.count() == 5
+        assert db.session.get(Room, room_id).archived_until is not None
+        
+        # Nothing left to do on a second run
+        assert archiver.run() == {'archived': 0, 'purged': 0}
+    
+    def test_cursor_reads_continue_into_archive(self, app, client, auth_headers, room_id):
+        """Test that cursors walk across the hot window into the archive and back"""
+        app.config['ARCHIVE_AFTER_DAYS'] = 5
+        archiver.run()
+        url = f'/api/chat/rooms/{room_id}/messages'
+        
+        # Page numbers only see the hot table
+        data = client.get(url, headers=auth_headers).get_json()
+        assert data['pagination']['total'] == 5
+        
+        seen = []
+        cursor = data['pagination']['cursors']['before']
+        data = client.get(f'{url}?before={cursor}&per_page=3', headers=auth_headers).get_json()
+        while True:
+            seen = [m['content'] for m in data['messages']] + seen
+            if not data['pagination']['has_more']:
+                break
+            cursor = data['pagination']['cursors']['before']
+            data = client.get(f'{url}?before={cursor}&per_page=3', headers=auth_headers).get_json()
+        assert seen == [f'Day {n}' for n in range(5)]
+        
+        # Walking forward from the archive runs into the hot table
+        data = client.get(f"{url}?after={data['pagination']['cursors']['before']}&per_page=7&include_total=true",
+                          headers=auth_headers).get_json()
+        assert [m['content'] for m in data['messages']] == [f'Day {n}' for n in range(1, 8)]
+        assert data['pagination']['has_more'] is True
+        assert data['pagination']['total'] == 10
+    
+    def test_retention_purges_both_tables(self, app, room_id, runner):
+        """Test per-room retention and the archive commands"""
+        app.config['ARCHIVE_AFTER_DAYS'] = 5
+        archiver.run()
+        
+        result = runner.invoke(args=['archive', 'retention', str(room_id), '--retention-days', '3'])
+        assert 'retention 3 days' in result.output
+        result = runner.invoke(args=['archive', 'run', '--room-id', str(room_id)])
+        assert 'purged 7' in result.output
+        assert ArchivedMessage.query.count() == 0
+        assert [m.content for m in Message.query.order_by(Message.id)] == ['Day 7', 'Day 8', 'Day 9']
+    
+    def test_sequences_continue_after_archive(self, app, client, auth_headers, room_id):
+        """Test that a room archived in full keeps counting from its archived seq"""
+        from app.services.sequences import room_sequences, SEQUENCE_KEY
+        app.config['ARCHIVE_AFTER_DAYS'] = 1
+        archiver.run(now=datetime.utcnow() + timedelta(days=1))
+        assert Message.query.filter_by(room_id=room_id).count() == 0
+        
+        redis_client = app.extensions['sequences'].redis
+        redis_client.delete(SEQUENCE_KEY.format(room_id=room_id))
+        assert room_sequences.current_many([room_id]) == {room_id: 10}
+        assert room_sequences.current(room_id) == 10
+        
+        response = client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'Next'},
+                               headers=auth_headers)
+        assert response.get_json()['data']['seq'] == 11
+    
+    def test_purge_uncounts_messages(self, app, client, auth_headers, room_id):
+        """Test that purged messages leave the room and total message counts"""
+        from app.services.stats import stats_counters
+        app.config['ARCHIVE_AFTER_DAYS'] = 5
+        archiver.run()
+        stats_counters.reconcile()
+        
+        app.config['MESSAGE_RETENTION_DAYS'] = 3
+        assert archiver.run()['purged'] == 7
+        assert stats_counters.room_messages([room_id]) == {room_id: 3}
+        assert stats_counters.totals()['messages'] == 3
+    
+    def test_search_covers_hot_window(self, app, client, auth_headers, room_id):
+        """Test that archived messages drop out of search and the cut-off is reported"""
+        app.config['ARCHIVE_AFTER_DAYS'] = 5
+        archiver.run()
+        
+        data = client.get(f'/api/chat/rooms/{room_id}/search?q=Day', headers=auth_headers).get_json()
+        assert [m['content'] for m in data['messages']] == [f'Day {n}' for n in range(5, 10)]
+        assert data['archived_until'] == db.session.get(Room, room_id).archived_until.isoformat()
@@ -1,6 +1,7 @@
 import pytest
 from app import db
 from app.models.user import User
+from app.services.user_cache import user_cache
 
 class TestAuth:
     def test_register_success(self, client):
@@ -80,4 +81,28 @@ class TestAuth:
         
         data = response.get_json()
         assert 'user' in data
-        assert data['user']['username'] == 'testuser'
\ No newline at end of file
+        assert data['user']['username'] == 'testuser'
+
+class TestUserCache:
+    def test_authenticated_request_skips_user_query(self, client, auth_headers, count_queries):
+        """Test that a cached user is resolved without SQL"""
+        client.post('/api/chat/rooms', json={'name': 'Cached'}, headers=auth_headers)
+        client.get('/api/chat/rooms', headers=auth_headers)
+        
+        with count_queries() as counter:
+            response = client.get('/api/chat/rooms', headers=auth_headers)
+        assert response.status_code == 200
+        # Only the room list; message counts come from Redis
+        assert counter.count == 1
+        assert user_cache.stats()['hits'] >= 1
+    
+    def test_profile_update_invalidates(self, client, auth_headers):
+        """Test that a changed display name is picked up by cached requests"""
+        room_id = client.post('/api/chat/rooms', json={'name': 'Names'},
+                              headers=auth_headers).get_json()['room']['id']
+        
+        client.put('/api/auth/profile', json={'display_name': 'Renamed'}, headers=auth_headers)
+        
+        response = client.post(f'/api/chat/rooms/{room_id}/messages',
+                               json={'content': 'hi'}, headers=auth_headers)
+        assert response.get_json()['data']['display_name'] == 'Renamed'
@@ -1,6 +1,10 @@
 import pytest
-from app import db
+from sqlalchemy import event
+from app import db, socketio
 from app.models.message import Room, Message
+from app.services.history_cache import history_cache
+from app.services.messages import replay_messages
+from app.utils.pagination import encode_cursor
 
 class TestChat:
     def test_create_room(self, client, auth_headers):
@@ -66,4 +70,478 @@ class TestChat:
         data = response.get_json()
         assert 'messages' in data
         assert len(data['messages']) == 1
-        assert data['messages'][0]['content'] == 'Test message'
\ No newline at end of file
+        assert data['messages'][0]['content'] == 'Test message'
+
+class TestRoomHistoryCache:
+    def _create_room(self, client, auth_headers, name):
+        response = client.post('/api/chat/rooms', json={'name': name}, headers=auth_headers)
+        return response.get_json()['room']['id']
+    
+    def test_first_page_served_from_cache(self, client, auth_headers):
+        """Test that a warm ring answers page 1 without the database"""
+        room_id = self._create_room(client, auth_headers, 'Cached Room')
+        for i in range(3):
+            client.post(f'/api/chat/rooms/{room_id}/messages',
+                        json={'content': f'Message {i}'}, headers=auth_headers)
+        
+        # First read misses and warms the cache
+        response = client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        assert len(response.get_json()['messages']) == 3
+        
+        # Rows removed behind the cache's back are still served from Redis
+        Message.query.filter_by(room_id=room_id).delete()
+        db.session.commit()
+        
+        response = client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        data = response.get_json()
+        assert [m['content'] for m in data['messages']] == ['Message 0', 'Message 1', 'Message 2']
+        assert data['pagination']['total'] == 3
+    
+    def test_cache_filled_on_write(self, client, auth_headers):
+        """Test that new messages extend a warm ring"""
+        room_id = self._create_room(client, auth_headers, 'Write Room')
+        client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        
+        client.post(f'/api/chat/rooms/{room_id}/messages',
+                    json={'content': 'Fresh'}, headers=auth_headers)
+        history_cache.hits = 0
+        
+        response = client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        assert [m['content'] for m in response.get_json()['messages']] == ['Fresh']
+        assert history_cache.hits == 1
+    
+    def test_cold_write_does_not_look_complete(self, client, auth_headers):
+        """Test that writes to a cold room fall back to the database"""
+        room_id = self._create_room(client, auth_headers, 'Cold Room')
+        for i in range(2):
+            client.post(f'/api/chat/rooms/{room_id}/messages',
+                        json={'content': f'Message {i}'}, headers=auth_headers)
+        
+        assert history_cache.get_page(room_id, 50) is None
+        
+        response = client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        assert len(response.get_json()['messages']) == 2
+    
+    def test_not_warmed_while_write_behind_pending(self, app, client, auth_headers):
+        """Test that a ring isn't marked complete without messages still queued"""
+        from app.services.write_behind import write_behind
+        room_id = self._create_room(client, auth_headers, 'Queued Room')
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        client.post(f'/api/chat/rooms/{room_id}/messages',
+                    json={'content': 'Queued'}, headers=auth_headers)
+        
+        client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        assert history_cache.get_page(room_id, 50) is None
+        
+        write_behind.flush()
+        response = client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        data = response.get_json()
+        assert [m['content'] for m in data['messages']] == ['Queued']
+        assert data['pagination']['total'] == 1
+        messages, total = history_cache.get_page(room_id, 50)
+        assert [m['content'] for m in messages] == ['Queued']
+        assert total == 1
+    
+    def test_warm_racing_a_send_is_skipped(self, client, auth_headers, monkeypatch):
+        """Test that a send landing during a warm keeps the ring cold"""
+        import app.services.history_cache as module
+        room_id = self._create_room(client, auth_headers, 'Racing Room')
+        client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'm1'}, headers=auth_headers)
+        sent = client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'm2'},
+                           headers=auth_headers).get_json()['data']
+        
+        # m2 is committed before the warm's read but pushed after it
+        message_columns = module.message_columns
+        
+        def read_then_send(query, **kwargs):
+            history_cache.push(room_id, sent)
+            return message_columns(query, **kwargs)
+        monkeypatch.setattr(module, 'message_columns', read_then_send)
+        client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        assert history_cache.get_page(room_id, 50) is None
+        
+        monkeypatch.setattr(module, 'message_columns', message_columns)
+        client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        messages, total = history_cache.get_page(room_id, 50)
+        assert [m['content'] for m in messages] == ['m1', 'm2']
+        assert total == 2
+    
+    def test_replay_fills_gaps_in_the_ring(self, client, auth_headers):
+        """Test that a ring missing a sequence number isn't trusted for replay"""
+        room_id = self._create_room(client, auth_headers, 'Gap Room')
+        for content in ('m1', 'm2', 'm3'):
+            client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': content}, headers=auth_headers)
+        client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        
+        # The state a lost push leaves behind: m2 missing, and a total to match
+        ring = f'room_history:{room_id}'
+        history_cache.redis.lrem(ring, 1, history_cache.redis.lindex(ring, 1))
+        history_cache.redis.hset(f'room_history_meta:{room_id}', 'total', 2)
+        assert history_cache.since(room_id, 0)[1] is False
+        assert history_cache.since(room_id, 2)[1] is True
+        
+        messages, has_more = replay_messages(room_id, 0, 10)
+        assert [m['content'] for m in messages] == ['m1', 'm2', 'm3']
+    
+    def test_edit_and_delete_invalidation(self, client, auth_headers):
+        """Test updating and invalidating cached messages"""
+        room_id = self._create_room(client, auth_headers, 'Edit Room')
+        response = client.post(f'/api/chat/rooms/{room_id}/messages',
+                               json={'content': 'Original'}, headers=auth_headers)
+        payload = response.get_json()['data']
+        client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        
+        payload['content'] = 'Edited'
+        history_cache.update_message(room_id, payload)
+        messages, total = history_cache.get_page(room_id, 50)
+        assert messages[0]['content'] == 'Edited'
+        
+        history_cache.invalidate(room_id)
+        assert history_cache.get_page(room_id, 50) is None
+
+class TestCursorPagination:
+    def test_walk_history_with_before_cursor(self, client, auth_headers):
+        """Test scrolling back through a room with before cursors"""
+        response = client.post('/api/chat/rooms', json={'name': 'Cursor Room'}, headers=auth_headers)
+        room_id = response.get_json()['room']['id']
+        for i in range(7):
+            client.post(f'/api/chat/rooms/{room_id}/messages',
+                        json={'content': f'Message {i}'}, headers=auth_headers)
+        
+        response = client.get(f'/api/chat/rooms/{room_id}/messages?per_page=3', headers=auth_headers)
+        data = response.get_json()
+        seen = [m['content'] for m in data['messages']]
+        cursor = data['pagination']['cursors']['before']
+        
+        while cursor:
+            response = client.get(f'/api/chat/rooms/{room_id}/messages?per_page=3&before={cursor}',
+                                  headers=auth_headers)
+            data = response.get_json()
+            assert 'total' not in data['pagination']
+            seen = [m['content'] for m in data['messages']] + seen
+            cursor = data['pagination']['cursors']['before'] if data['pagination']['has_more'] else None
+        
+        assert seen == [f'Message {i}' for i in range(7)]
+    
+    def test_after_cursor_and_total(self, client, auth_headers):
+        """Test fetching newer messages with an after cursor"""
+        response = client.post('/api/chat/rooms', json={'name': 'After Room'}, headers=auth_headers)
+        room_id = response.get_json()['room']['id']
+        first = client.post(f'/api/chat/rooms/{room_id}/messages',
+                            json={'content': 'First'}, headers=auth_headers).get_json()['data']
+        client.post(f'/api/chat/rooms/{room_id}/messages',
+                    json={'content': 'Second'}, headers=auth_headers)
+        
+        cursor = encode_cursor(first['timestamp'], first['id'])
+        response = client.get(f'/api/chat/rooms/{room_id}/messages?after={cursor}&include_total=true',
+                              headers=auth_headers)
+        data = response.get_json()
+        assert [m['content'] for m in data['messages']] == ['Second']
+        assert data['pagination']['has_more'] is False
+        assert data['pagination']['total'] == 2
+    
+    def test_invalid_cursor(self, client, auth_headers):
+        """Test that a malformed cursor is rejected"""
+        response = client.post('/api/chat/rooms', json={'name': 'Bad Cursor Room'}, headers=auth_headers)
+        room_id = response.get_json()['room']['id']
+        
+        response = client.get(f'/api/chat/rooms/{room_id}/messages?before=not-a-cursor',
+                              headers=auth_headers)
+        assert response.status_code == 400
+
+class TestQueryCounts:
+    def _register(self, client, name):
+        response = client.post('/api/auth/register', json={
+            'username': name,
+            'email': f'{name}@example.com',
+            'password': 'Password123',
+            'display_name': name.title()
+        })
+        return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    
+    def _rooms_query_count(self, client, auth_headers, count_queries):
+        with count_queries() as counter:
+            response = client.get('/api/chat/rooms', headers=auth_headers)
+        assert response.status_code == 200
+        return counter.count, response.get_json()['rooms']
+    
+    def test_room_list_queries_do_not_grow(self, client, auth_headers, count_queries):
+        """Test that listing rooms costs the same number of queries for any size"""
+        for i in range(2):
+            room_id = client.post('/api/chat/rooms', json={'name': f'Room {i}'},
+                                  headers=auth_headers).get_json()['room']['id']
+            client.post(f'/api/chat/rooms/{room_id}/messages',
+                        json={'content': 'hi'}, headers=auth_headers)
+        small, rooms = self._rooms_query_count(client, auth_headers, count_queries)
+        assert [room['message_count'] for room in rooms] == [1, 1]
+        
+        for i in range(2, 12):
+            client.post('/api/chat/rooms', json={'name': f'Room {i}'}, headers=auth_headers)
+        large, rooms = self._rooms_query_count(client, auth_headers, count_queries)
+        
+        assert len(rooms) == 12
+        assert large == small
+    
+    def test_send_does_not_reload_the_message(self, app, client, auth_headers):
+        """Test that the sent payload is built before the commit, not by reloading the row"""
+        room_id = client.post('/api/chat/rooms', json={'name': 'Sent'},
+                              headers=auth_headers).get_json()['room']['id']
+        token = auth_headers['Authorization'].split()[1]
+        sio = socketio.test_client(app, auth={'token': token}, flask_test_client=client)
+        sio.emit('join_room', {'room_id': room_id})
+        sio.get_received()
+        
+        statements = []
+        
+        def on_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', on_execute)
+        try:
+            response = client.post(f'/api/chat/rooms/{room_id}/messages',
+                                   json={'content': 'Over REST'}, headers=auth_headers)
+            sio.emit('send_message', {'room_id': room_id, 'content': 'Over socket'})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', on_execute)
+        
+        assert response.get_json()['data']['username'] == 'testuser'
+        broadcast = [r['args'] for r in sio.get_received() if r['name'] == 'message']
+        assert broadcast[-1]['content'] == 'Over socket'
+        assert broadcast[-1]['display_name'] == 'Test User'
+        inserts = [i for i, statement in enumerate(statements) if statement.startswith('INSERT INTO message ')]
+        assert len(inserts) == 2
+        # Nothing is read back between an insert and the next send
+        for start, end in zip(inserts, inserts[1:] + [len(statements)]):
+            assert not [statement for statement in statements[start:end] if statement.startswith('SELECT')]
+        sio.disconnect()
+    
+    def test_message_list_queries_do_not_grow(self, app, client, auth_headers, count_queries):
+        """Test that message pages load authors without a query per message"""
+        app.config['HISTORY_CACHE_ENABLED'] = False
+        room_id = client.post('/api/chat/rooms', json={'name': 'Busy'},
+                              headers=auth_headers).get_json()['room']['id']
+        authors = [auth_headers] + [self._register(client, f'user{i}') for i in range(5)]
+        
+        def page_query_count(url):
+            with count_queries() as counter:
+                response = client.get(url, headers=auth_headers)
+            return counter.count, response.get_json()['messages']
+        
+        client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'first'}, headers=authors[1])
+        small, _ = page_query_count(f'/api/chat/rooms/{room_id}/messages')
+        
+        for headers in authors:
+            client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'more'}, headers=headers)
+        large, messages = page_query_count(f'/api/chat/rooms/{room_id}/messages')
+        assert len(messages) == 7
+        assert len({m['username'] for m in messages}) == 6
+        assert large == small
+        
+        cursor = messages[-1]
+        small_cursor, _ = page_query_count(f'/api/chat/rooms/{room_id}/messages?per_page=1&before='
+                                           + encode_cursor(cursor['timestamp'], cursor['id']))
+        large_cursor, _ = page_query_count(f'/api/chat/rooms/{room_id}/messages?per_page=6&before='
+                                           + encode_cursor(cursor['timestamp'], cursor['id']))
+        assert large_cursor == small_cursor
+
+class TestMessageSearch:
+    def _room(self, client, auth_headers, name, **extra):
+        response = client.post('/api/chat/rooms', json={'name': name, **extra}, headers=auth_headers)
+        return response.get_json()['room']['id']
+    
+    def _send(self, client, auth_headers, room_id, content):
+        client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': content}, headers=auth_headers)
+    
+    def test_search_matches_words_in_room(self, client, auth_headers):
+        """Test that search matches all words and stays inside the room"""
+        room_id = self._room(client, auth_headers, 'Search Room')
+        other_id = self._room(client, auth_headers, 'Other Room')
+        self._send(client, auth_headers, room_id, 'Deploy finished on staging')
+        self._send(client, auth_headers, room_id, 'Lunch at noon?')
+        self._send(client, auth_headers, room_id, 'deploy failed on production')
+        self._send(client, auth_headers, other_id, 'Deploy the other service')
+        
+        response = client.get(f'/api/chat/rooms/{room_id}/search?q=deploy', headers=auth_headers)
+        assert response.status_code == 200
+        contents = [m['content'] for m in response.get_json()['messages']]
+        assert contents == ['Deploy finished on staging', 'deploy failed on production']
+        
+        response = client.get(f'/api/chat/rooms/{room_id}/search?q=deploy+production', headers=auth_headers)
+        assert [m['content'] for m in response.get_json()['messages']] == ['deploy failed on production']
+        
+        # FTS syntax in user input is treated as plain words
+        response = client.get(f'/api/chat/rooms/{room_id}/search?q="lunch" OR (', headers=auth_headers)
+        assert response.status_code == 200
+        assert response.get_json()['messages'] == []
+    
+    def test_search_pages_with_before_cursor(self, client, auth_headers):
+        """Test walking search results with keyset cursors"""
+        room_id = self._room(client, auth_headers, 'Paged Search Room')
+        for i in range(5):
+            self._send(client, auth_headers, room_id, f'ticket {i}')
+            self._send(client, auth_headers, room_id, f'noise {i}')
+        
+        seen = []
+        url = f'/api/chat/rooms/{room_id}/search?q=ticket&per_page=2'
+        while True:
+            data = client.get(url, headers=auth_headers).get_json()
+            seen = [m['content'] for m in data['messages']] + seen
+            if not data['pagination']['has_more']:
+                break
+            url = f"/api/chat/rooms/{room_id}/search?q=ticket&per_page=2&before={data['pagination']['cursors']['before']}"
+        assert seen == [f'ticket {i}' for i in range(5)]
+    
+    def test_search_access_and_validation(self, app, client, auth_headers):
+        """Test that private rooms and bad queries are rejected"""
+        private_id = self._room(client, auth_headers, 'Private Search Room', is_private=True)
+        response = client.post('/api/auth/register', json={
+            'username': 'outsider',
+            'email': 'outsider@example.com',
+            'password': 'TestPassword123',
+            'display_name': 'Outsider'
+        })
+        outsider = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+        
+        assert client.get(f'/api/chat/rooms/{private_id}/search?q=x', headers=auth_headers).status_code == 200
+        assert client.get(f'/api/chat/rooms/{private_id}/search?q=x', headers=outsider).status_code == 403
+        assert client.get(f'/api/chat/rooms/{private_id}/search', headers=auth_headers).status_code == 400
+        assert client.get(f'/api/chat/rooms/{private_id}/search?q=!!', headers=auth_headers).status_code == 400
+    
+    def test_reindex_command_and_write_behind(self, app, client, auth_headers, runner):
+        """Test that existing rows are indexed by the reindex command"""
+        room_id = self._room(client, auth_headers, 'Reindex Room')
+        self._send(client, auth_headers, room_id, 'before the index existed')
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE message_fts')
+        
+        result = runner.invoke(args=['search', 'reindex'])
+        assert 'Indexed 1 messages' in result.output
+        
+        # Rows written in bulk by write-behind are indexed as well
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        self._send(client, auth_headers, room_id, 'queued index entry')
+        from app.services.write_behind import write_behind
+        write_behind.flush()
+        
+        response = client.get(f'/api/chat/rooms/{room_id}/search?q=index', headers=auth_headers)
+        assert [m['content'] for m in response.get_json()['messages']] == [
+            'before the index existed', 'queued index entry'
+        ]
+
+class TestRoomMembership:
+    def _user(self, client, username):
+        response = client.post('/api/auth/register', json={
+            'username': username,
+            'email': f'{username}@example.com',
+            'password': 'TestPassword123',
+            'display_name': username.title()
+        })
+        data = response.get_json()
+        return data['user']['id'], {'Authorization': f"Bearer {data['access_token']}"}
+    
+    def test_my_rooms_with_unread_counts(self, client, auth_headers):
+        """Test the paged "my rooms" listing and its unread counts"""
+        room_ids = []
+        for i in range(3):
+            response = client.post('/api/chat/rooms', json={'name': f'Mine {i}'}, headers=auth_headers)
+            room_ids.append(response.get_json()['room']['id'])
+        _, other = self._user(client, 'poster')
+        for _ in range(2):
+            client.post(f'/api/chat/rooms/{room_ids[0]}/messages', json={'content': 'Hi'}, headers=other)
+        
+        data = client.get('/api/chat/rooms/mine?per_page=2', headers=auth_headers).get_json()
+        assert [room['id'] for room in data['rooms']] == room_ids[:2]
+        assert data['rooms'][0]['role'] == 'owner'
+        assert data['rooms'][0]['unread_count'] == 2
+        assert data['rooms'][0]['message_count'] == 2
+        assert data['rooms'][1]['unread_count'] == 0
+        # The public listing counts from the same source
+        public = client.get('/api/chat/rooms', headers=auth_headers).get_json()['rooms']
+        assert {room['id']: room['message_count'] for room in public}[room_ids[0]] == 2
+        assert data['pagination']['has_more'] is True
+        
+        after = data['pagination']['next_after']
+        data = client.get(f'/api/chat/rooms/mine?per_page=2&after={after}', headers=auth_headers).get_json()
+        assert [room['id'] for room in data['rooms']] == room_ids[2:]
+        assert data['pagination']['has_more'] is False
+        
+        # The poster joined the public room by sending
+        data = client.get('/api/chat/rooms/mine', headers=other).get_json()
+        assert [(room['id'], room['role']) for room in data['rooms']] == [(room_ids[0], 'member')]
+    
+    def test_private_room_access(self, client, auth_headers):
+        """Test that private rooms need an invite from their creator"""
+        response = client.post('/api/chat/rooms', json={'name': 'Secret', 'is_private': True}, headers=auth_headers)
+        room_id = response.get_json()['room']['id']
+        guest_id, guest = self._user(client, 'guest')
+        
+        url = f'/api/chat/rooms/{room_id}/messages'
+        assert client.get(url, headers=guest).status_code == 403
+        assert client.post(url, json={'content': 'Let me in'}, headers=guest).status_code == 403
+        assert client.post(f'/api/chat/rooms/{room_id}/members', json={'user_id': guest_id},
+                           headers=guest).status_code == 403
+        
+        response = client.post(f'/api/chat/rooms/{room_id}/members', json={'user_id': guest_id}, headers=auth_headers)
+        assert response.status_code == 201
+        assert client.post(url, json={'content': 'Thanks'}, headers=guest).status_code == 201
+        
+        # Leaving revokes access again
+        assert client.delete(f'/api/chat/rooms/{room_id}/members/{guest_id}', headers=guest).status_code == 200
+        assert client.get(url, headers=guest).status_code == 403
+    
+    def test_membership_check_is_cached(self, client, auth_headers, count_queries):
+        """Test that membership checks come from Redis once warm"""
+        from app.services.membership import membership
+        response = client.post('/api/chat/rooms', json={'name': 'Cached Members'}, headers=auth_headers)
+        room_id = response.get_json()['room']['id']
+        user_id = response.get_json()['room']['created_by']
+        
+        membership.invalidate(room_id)
+        assert membership.is_member(room_id, user_id)
+        with count_queries() as counter:
+            assert membership.is_member(room_id, user_id)
+            assert not membership.is_member(room_id, user_id + 1)
+        assert counter.count == 0
+    
+    def test_load_racing_a_remove_is_not_cached(self, client, auth_headers, monkeypatch):
+        """Test that a load which read a member before their removal doesn't cache them"""
+        from app.services.membership import membership
+        response = client.post('/api/chat/rooms', json={'name': 'Racy Members'}, headers=auth_headers)
+        room_id = response.get_json()['room']['id']
+        guest_id, _ = self._user(client, 'leaver')
+        membership.add(room_id, guest_id)
+        membership.invalidate(room_id)
+        
+        load = membership._room_rows
+        def load_then_remove(room_id):
+            user_ids = load(room_id)
+            membership.remove(room_id, guest_id)
+            return user_ids
+        monkeypatch.setattr(membership, '_room_rows', load_then_remove)
+        assert membership.is_member(room_id, guest_id)
+        
+        monkeypatch.setattr(membership, '_room_rows', load)
+        assert not membership.is_member(room_id, guest_id)
+    
+    def test_public_room_list_is_paginated(self, client, auth_headers):
+        """Test that the public room list pages by room ID"""
+        for i in range(3):
+            client.post('/api/chat/rooms', json={'name': f'Public {i}'}, headers=auth_headers)
+        client.post('/api/chat/rooms', json={'name': 'Hidden', 'is_private': True}, headers=auth_headers)
+        
+        data = client.get('/api/chat/rooms?per_page=2', headers=auth_headers).get_json()
+        assert [room['name'] for room in data['rooms']] == ['Public 0', 'Public 1']
+        after = data['pagination']['next_after']
+        data = client.get(f'/api/chat/rooms?after={after}', headers=auth_headers).get_json()
+        assert [room['name'] for room in data['rooms']] == ['Public 2']
+        assert data['pagination']['has_more'] is False
+    
+    def test_backfill_members_command(self, app, client, auth_headers, runner):
+        """Test that rooms from before memberships get their owners back"""
+        from app.models.message import RoomMember
+        client.post('/api/chat/rooms', json={'name': 'Old Room'}, headers=auth_headers)
+        RoomMember.query.delete()
+        db.session.commit()
+        
+        result = runner.invoke(args=['rooms', 'backfill-members'])
+        assert 'Added 1 room owners' in result.output
+        assert RoomMember.query.one().role == 'owner'
@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from app import create_app, db, socketio
+from app.services.replica import replica
+from app.utils.db import MeteredQueuePool, pool_stats
+from config import TestingConfig
+
+class TestPoolMetrics:
+    def test_checkout_waits_and_timeouts(self, tmp_path):
+        """Test that the pool counts checkouts and checkouts that timed out"""
+        engine = create_engine(f'sqlite:///{tmp_path}/pool.db', poolclass=MeteredQueuePool,
+                               pool_size=1, max_overflow=0, pool_timeout=0.05)
+        held = engine.connect()
+        held.execute(text('SELECT 1'))
+        with pytest.raises(PoolTimeout):
+            engine.connect()
+
+        stats = pool_stats(engine)
+        assert stats['checked_out'] == 1
+        assert stats['checkouts'] == 2
+        assert stats['timeouts'] == 1
+        assert stats['slow_checkouts'] == 1
+        assert stats['wait_max_ms'] >= 50
+
+        held.close()
+        assert pool_stats(engine)['checked_out'] == 0
+        engine.dispose()
+
+    def test_stats_include_pools(self, client):
+        """Test that /api/stats reports the database pools"""
+        response = client.get('/api/stats')
+        database = response.get_json()['database']
+        assert database['primary']['pool'] == 'StaticPool'
+        assert database['replica'] is None
+
+class TestSessionScoping:
+    def test_socket_handlers_release_session(self, app, client, auth_headers):
+        """Test that a socket event leaves no session checked out"""
+        room_id = client.post('/api/chat/rooms', json={'name': 'Pool Room'},
+                              headers=auth_headers).get_json()['room']['id']
+        token = auth_headers['Authorization'].split()[1]
+        socketio_client = socketio.test_client(app, auth={'token': token}, flask_test_client=client)
+        db.session.remove()
+
+        socketio_client.emit('join_room', {'room_id': room_id})
+        assert 'room_joined' in [event['name'] for event in socketio_client.get_received()]
+        assert not db.session.registry.has()
+        socketio_client.disconnect()
+
+class TestReadReplica:
+    @pytest.fixture
+    def app(self, redis_server, tmp_path, monkeypatch):
+        """An app whose replica is a separate, initially empty database"""
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_REPLICA_URI', f'sqlite:///{tmp_path}/replica.db')
+        app = create_app('testing')
+        with app.app_context():
+            db.create_all()
+            db.metadata.create_all(replica.engine)
+            yield app
+            db.drop_all()
+        replica.engine.dispose()
+
+    def test_older_history_reads_replica(self, client, auth_headers):
+        """Test that only lag-tolerant history reads go to the replica"""
+        room_id = client.post('/api/chat/rooms', json={'name': 'Replica Room'},
+                              headers=auth_headers).get_json()['room']['id']
+        for i in range(3):
+            client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': f'Message {i}'},
+                        headers=auth_headers)
+        url = f'/api/chat/rooms/{room_id}/messages'
+
+        # Page 1 and forward cursors read the primary
+        page = client.get(url, headers=auth_headers).get_json()
+        assert len(page['messages']) == 3
+        first = page['pagination']['cursors']['before']
+        response = client.get(f'{url}?after={first}', headers=auth_headers)
+        assert len(response.get_json()['messages']) == 2
+
+        # The replica hasn't received anything, which shows where these went
+        response = client.get(f'{url}?page=2&per_page=1', headers=auth_headers)
+        assert response.get_json()['pagination']['total'] == 0
+        newest = page['pagination']['cursors']['after']
+        response = client.get(f'{url}?before={newest}&include_total=true', headers=auth_headers)
+        assert response.get_json()['messages'] == []
+        assert response.get_json()['pagination']['total'] == 0
+
+    def test_replica_pool_in_stats(self, client):
+        """Test that the replica pool shows up in /api/stats"""
+        stats = client.get('/api/stats').get_json()['database']['replica']
+        assert stats['pool'] == 'MeteredQueuePool'
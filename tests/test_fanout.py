@@ -0,0 +1,81 @@
+import pickle
+import fakeredis
+import pytest
+import redis
+import socketio
+from app.utils.fanout import ShardedRedisManager, room_shard_key
+
+@pytest.fixture
+def node(redis_server, monkeypatch):
+    """Build managers that share one in-memory Redis, like nodes of a cluster"""
+    monkeypatch.setattr(redis.Redis, 'from_url',
+                        classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=redis_server)))
+
+    def build():
+        manager = ShardedRedisManager('redis://', shards=4)
+        socketio.Server(client_manager=manager, async_mode='threading')
+        manager.pubsub.subscribe(manager.channel)
+        return manager
+    return build
+
+def received(manager):
+    """Queue messages delivered to a node so far"""
+    # Subscribe confirmations also come back as None, so poll a few times
+    messages = []
+    for _ in range(10):
+        message = manager.pubsub.get_message(ignore_subscribe_messages=True, timeout=0.01)
+        if message is not None:
+            messages.append(pickle.loads(message['data']))
+    return messages
+
+class TestShardRouting:
+    def test_room_shard_key(self):
+        """Test that only chat rooms are sharded"""
+        assert room_shard_key('12') == 12
+        assert room_shard_key('12:compact') == 12
+        assert room_shard_key('Xk2nJd0e9dY1AAAB') is None
+        assert room_shard_key(None) is None
+
+    def test_channel_for(self, node):
+        """Test that room broadcasts go to a shard and everything else is shared"""
+        manager = node()
+        assert manager.channel_for({'method': 'emit', 'room': '6:json', 'callback': None}) == 'flask-socketio:shard:2'
+        assert manager.channel_for({'method': 'emit', 'room': ['6', '6:json'], 'callback': None}) == 'flask-socketio:shard:2'
+        assert manager.channel_for({'method': 'emit', 'room': ['6', '7'], 'callback': None}) == 'flask-socketio'
+        assert manager.channel_for({'method': 'emit', 'room': 'Xk2nJd0e9dY1AAAB', 'callback': None}) == 'flask-socketio'
+        assert manager.channel_for({'method': 'emit', 'room': None, 'callback': None}) == 'flask-socketio'
+        assert manager.channel_for({'method': 'emit', 'room': '6', 'callback': ('6', '/', 1)}) == 'flask-socketio'
+        assert manager.channel_for({'method': 'close_room', 'room': '6'}) == 'flask-socketio'
+
+    def test_subscribes_while_rooms_are_occupied(self, node):
+        """Test that a node follows a shard from its first local room to its last"""
+        manager = node()
+        first = manager.connect('eio-1', '/')
+        second = manager.connect('eio-2', '/')
+        manager.enter_room(first, '/', '1')
+        manager.enter_room(second, '/', '1')
+        manager.enter_room(first, '/', '5:json')
+        assert manager.subscribed_shards() == [1]
+        assert b'flask-socketio:shard:1' in manager.pubsub.channels
+
+        manager.leave_room(first, '/', '1')
+        manager.disconnect(first, '/', ignore_queue=True)
+        assert manager.subscribed_shards() == [1]
+        manager.disconnect(second, '/', ignore_queue=True)
+        assert manager.subscribed_shards() == []
+        # Dropped from channels once the listener reads the confirmation
+        assert b'flask-socketio:shard:1' in manager.pubsub.pending_unsubscribe_channels
+
+    def test_broadcast_reaches_only_interested_nodes(self, node):
+        """Test that a room broadcast skips nodes with no clients in the room"""
+        member, bystander, sender = node(), node(), node()
+        sid = member.connect('eio-1', '/')
+        member.enter_room(sid, '/', '3:json')
+        received(member), received(bystander)
+
+        sender.emit('message', {'content': 'hi'}, namespace='/', room='3:json')
+        sender.emit('notice', {}, namespace='/', room=None)
+
+        assert [m['event'] for m in received(member)] == ['message', 'notice']
+        assert [m['event'] for m in received(bystander)] == ['notice']
+        assert sender.stats()['published'] == {'shard': 1, 'shared': 1}
@@ -0,0 +1,45 @@
+import logging
+from config import TestingConfig
+from app import create_app, db
+from app.utils import log
+from app.utils.log import RedactingFilter, SamplingFilter, redact
+
+class TestLogging:
+    def _record(self, msg, *args, level=logging.INFO):
+        return logging.LogRecord('app', level, __file__, 1, msg, args, None)
+    
+    def test_redacts_passwords_and_tokens(self):
+        """Test that secrets are masked before reaching a handler"""
+        record = self._record('login body: %s', '{"username": "bob", "password": "Secret 123"}')
+        assert RedactingFilter().filter(record)
+        assert record.getMessage() == 'login body: {"username": "bob", "password": "[REDACTED]"}'
+        
+        assert redact('Authorization: Bearer abc.def.ghi') == 'Authorization: Bearer [REDACTED]'
+        assert redact("{'access_token': 'eyJa.eyJb.c'}") == "{'access_token': '[REDACTED]'}"
+    
+    def test_sampling_keeps_warnings(self):
+        """Test that sampling only drops records below WARNING"""
+        sampler = SamplingFilter(0.0)
+        assert not sampler.filter(self._record('noise'))
+        assert sampler.filter(self._record('problem', level=logging.WARNING))
+        assert SamplingFilter(1.0).filter(self._record('noise'))
+    
+    def test_request_body_logging_is_opt_in(self, redis_server, monkeypatch):
+        """Test that only configured endpoints have their bodies logged"""
+        monkeypatch.setattr(TestingConfig, 'LOG_LEVEL', 'DEBUG', raising=False)
+        monkeypatch.setattr(TestingConfig, 'LOG_REQUEST_BODY_ROUTES', ['auth.login'], raising=False)
+        app = create_app('testing')
+        
+        logged = []
+        monkeypatch.setattr(log.logger, 'debug', lambda msg, *args: logged.append(msg % args))
+        
+        with app.app_context():
+            db.create_all()
+            client = app.test_client()
+            client.post('/api/auth/register', json={'username': 'x'})
+            assert logged == []
+            
+            client.post('/api/auth/login', json={'username': 'x', 'password': 'y'})
+            assert len(logged) == 1
+            assert '/api/auth/login' in logged[0]
+            db.drop_all()
@@ -0,0 +1,163 @@
+import msgpack
+import pytest
+from app import db, socketio
+from app.models.message import Message, MessageRevision
+from app.services.history_cache import history_cache
+from app.services.stats import stats_counters
+
+@pytest.fixture
+def message_id(client, auth_headers, room_id):
+    response = client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'Original'},
+                           headers=auth_headers)
+    return response.get_json()['data']['id']
+
+def other_user_headers(client):
+    response = client.post('/api/auth/register', json={
+        'username': 'otheruser',
+        'email': 'other@example.com',
+        'password': 'OtherPassword123',
+        'display_name': 'Other User'
+    })
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+class TestEditMessage:
+    def test_edit_keeps_revisions(self, client, auth_headers, room_id, message_id):
+        """Test that an edit returns a delta and logs the old content"""
+        url = f'/api/chat/rooms/{room_id}/messages/{message_id}'
+        response = client.patch(url, json={'content': 'Second'}, headers=auth_headers)
+        assert response.status_code == 200
+        change = response.get_json()['data']
+        assert set(change) == {'id', 'room_id', 'content', 'edited_at'}
+        assert change['content'] == 'Second'
+        client.patch(url, json={'content': 'Third'}, headers=auth_headers)
+
+        response = client.get(f'{url}/revisions', headers=auth_headers)
+        assert [r['content'] for r in response.get_json()['revisions']] == ['Original', 'Second']
+
+        messages = client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers).get_json()['messages']
+        assert messages[0]['content'] == 'Third'
+        assert messages[0]['edited_at'] == response.get_json()['revisions'][1]['replaced_at']
+
+    def test_edit_patches_cached_history(self, client, auth_headers, room_id, message_id):
+        """Test that a warm history ring is updated in place, not dropped"""
+        client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        client.patch(f'/api/chat/rooms/{room_id}/messages/{message_id}', json={'content': 'Cached edit'},
+                     headers=auth_headers)
+
+        messages, total = history_cache.get_page(room_id, 50)
+        assert messages[0]['content'] == 'Cached edit'
+        assert messages[0]['username'] == 'testuser'
+        assert total == 1
+
+    def test_only_author_edits(self, client, auth_headers, room_id, message_id):
+        """Test that other users can't edit a message"""
+        headers = other_user_headers(client)
+        client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'Join'}, headers=headers)
+        response = client.patch(f'/api/chat/rooms/{room_id}/messages/{message_id}',
+                                json={'content': 'Hijacked'}, headers=headers)
+        assert response.status_code == 403
+        assert response.get_json()['error'] == 'Only the author can edit a message'
+
+    def test_edit_missing_or_wrong_room(self, client, auth_headers, room_id, message_id):
+        """Test that messages are only found in their own room"""
+        other_room = client.post('/api/chat/rooms', json={'name': 'Other Room'},
+                                 headers=auth_headers).get_json()['room']['id']
+        response = client.patch(f'/api/chat/rooms/{other_room}/messages/{message_id}',
+                                json={'content': 'Moved'}, headers=auth_headers)
+        assert response.status_code == 404
+        response = client.patch(f'/api/chat/rooms/{room_id}/messages/9999',
+                                json={'content': 'Nothing'}, headers=auth_headers)
+        assert response.status_code == 404
+
+class TestDeleteMessage:
+    def test_delete_leaves_tombstone(self, client, auth_headers, room_id, message_id):
+        """Test that a deleted message keeps its place and seq but loses its content"""
+        client.patch(f'/api/chat/rooms/{room_id}/messages/{message_id}', json={'content': 'Edited'},
+                     headers=auth_headers)
+        response = client.delete(f'/api/chat/rooms/{room_id}/messages/{message_id}', headers=auth_headers)
+        assert response.status_code == 200
+        assert set(response.get_json()['data']) == {'id', 'room_id', 'deleted_at'}
+
+        messages = client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers).get_json()['messages']
+        assert len(messages) == 1
+        assert messages[0]['content'] == ''
+        assert messages[0]['deleted_at'] is not None
+        assert messages[0]['seq'] == 1
+        assert MessageRevision.query.filter_by(message_id=message_id).count() == 0
+
+        # Deleted text is no longer searchable, and can't be deleted again
+        response = client.get(f'/api/chat/rooms/{room_id}/search?q=Edited', headers=auth_headers)
+        assert response.get_json()['messages'] == []
+        response = client.delete(f'/api/chat/rooms/{room_id}/messages/{message_id}', headers=auth_headers)
+        assert response.status_code == 404
+
+    def test_delete_updates_ring_and_counters_together(self, client, auth_headers, room_id, message_id):
+        """Test that the cached tombstone and the message counts change in one step"""
+        client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'Kept'}, headers=auth_headers)
+        stats_counters.reconcile()
+        client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+
+        client.delete(f'/api/chat/rooms/{room_id}/messages/{message_id}', headers=auth_headers)
+        messages, total = history_cache.get_page(room_id, 50)
+        assert [m['content'] for m in messages] == ['', 'Kept']
+        assert total == 2
+        assert stats_counters.room_messages([room_id]) == {room_id: 1}
+        assert stats_counters.totals()['messages'] == 1
+
+        # Reconciling agrees with the decremented counters
+        stats_counters.reconcile()
+        assert stats_counters.room_messages([room_id]) == {room_id: 1}
+
+    def test_room_creator_deletes_others_messages(self, client, auth_headers, room_id):
+        """Test that the room's creator can delete anyone's message, others can't"""
+        headers = other_user_headers(client)
+        other_message = client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'Spam'},
+                                    headers=headers).get_json()['data']['id']
+        own_message = client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'Mine'},
+                                  headers=auth_headers).get_json()['data']['id']
+
+        response = client.delete(f'/api/chat/rooms/{room_id}/messages/{own_message}', headers=headers)
+        assert response.status_code == 403
+        response = client.delete(f'/api/chat/rooms/{room_id}/messages/{other_message}', headers=auth_headers)
+        assert response.status_code == 200
+
+class TestSocketChanges:
+    def test_edit_and_delete_broadcast_deltas(self, app, client, auth_headers, room_id, message_id):
+        """Test that socket edits and deletes reach JSON and compact clients as deltas"""
+        token = auth_headers['Authorization'].split()[1]
+        sender = socketio.test_client(app, auth={'token': token}, flask_test_client=client)
+        compact = socketio.test_client(app, auth={'token': token, 'format': 'compact'}, flask_test_client=client)
+        for sio in (sender, compact):
+            sio.emit('join_room', {'room_id': room_id})
+            sio.get_received()
+
+        ack = sender.emit('edit_message', {'message_id': message_id, 'content': 'Over socket'}, callback=True)
+        assert ack['content'] == 'Over socket'
+        events = [event for event in sender.get_received() if event['name'] == 'message_edited']
+        assert events[0]['args'][0] == ack
+
+        packed = [event for event in compact.get_received() if event['name'] == 'message_edited']
+        delta = msgpack.unpackb(packed[0]['args'][0])
+        assert delta['i'] == message_id and delta['c'] == 'Over socket' and 'e' in delta
+
+        ack = sender.emit('delete_message', {'message_id': message_id}, callback=True)
+        assert ack['deleted_at']
+        packed = [event for event in compact.get_received() if event['name'] == 'message_deleted']
+        assert set(msgpack.unpackb(packed[0]['args'][0])) == {'i', 'r', 'd'}
+
+        ack = sender.emit('edit_message', {'message_id': message_id, 'content': 'Too late'}, callback=True)
+        assert ack == {'error': 'Message not found'}
+        sender.disconnect()
+        compact.disconnect()
+
+    def test_edit_write_behind_message(self, app, client, auth_headers, room_id):
+        """Test that a message still queued for write-behind can be edited"""
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        message_id = client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'Queued'},
+                                 headers=auth_headers).get_json()['data']['id']
+        assert db.session.get(Message, message_id) is None
+
+        response = client.patch(f'/api/chat/rooms/{room_id}/messages/{message_id}', json={'content': 'Stored'},
+                                headers=auth_headers)
+        assert response.status_code == 200
+        assert db.session.get(Message, message_id).content == 'Stored'
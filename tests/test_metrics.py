@@ -0,0 +1,64 @@
+from app import socketio
+from app.services.metrics import metrics
+
+def sample(text, name):
+    """The value of one sample line in a scrape, or None"""
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+class TestMetricsEndpoint:
+    def test_routes_are_measured(self, client, auth_headers):
+        """Test that route latency, queries and Redis round trips are recorded per route"""
+        client.get('/api/chat/rooms', headers=auth_headers)
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain; version=0.0.4')
+
+        text = response.get_data(as_text=True)
+        route = 'method="GET",route="/api/chat/rooms",status="200"'
+        assert sample(text, f'flashchat_http_request_duration_seconds_count{{{route}}}') == 1
+        assert sample(text, f'flashchat_http_request_duration_seconds_bucket{{{route},le="+Inf"}}') == 1
+        handler = 'handler="POST /api/auth/register"'
+        assert sample(text, f'flashchat_db_queries_per_request_count{{{handler}}}') == 1
+        assert sample(text, f'flashchat_db_queries_per_request_sum{{{handler}}}') >= 3
+        assert sample(text, 'flashchat_redis_round_trips_total') > 0
+
+    def test_socket_events_are_measured(self, app, client, auth_headers):
+        """Test that handlers, connected sids and room fan-out are recorded"""
+        room_id = client.post('/api/chat/rooms', json={'name': 'Metrics Room'},
+                              headers=auth_headers).get_json()['room']['id']
+        token = auth_headers['Authorization'].split()[1]
+        sockets = [socketio.test_client(app, auth={'token': token}, flask_test_client=client) for _ in range(3)]
+        for sio in sockets:
+            sio.emit('join_room', {'room_id': room_id})
+        fanout = sample(metrics.render(), 'flashchat_room_fanout_recipients_sum') or 0
+        sockets[0].emit('send_message', {'room_id': room_id, 'content': 'Counted'})
+
+        text = client.get('/metrics').get_data(as_text=True)
+        assert sample(text, 'flashchat_connected_sids') == 3
+        assert sample(text, 'flashchat_socketio_events_total{event="join_room"}') == 3
+        assert sample(text, 'flashchat_socketio_events_total{event="send_message"}') == 1
+        assert sample(text, 'flashchat_socketio_event_duration_seconds_count{event="connect"}') == 3
+        assert sample(text, 'flashchat_db_queries_per_request_count{handler="event send_message"}') == 1
+
+        # The message went to the room of JSON clients, which has all three
+        assert sample(text, 'flashchat_room_fanout_recipients_sum') >= fanout + 3
+        for sio in sockets:
+            sio.disconnect()
+        assert sample(client.get('/metrics').get_data(as_text=True), 'flashchat_connected_sids') == 0
+
+    def test_token_required(self, app, client):
+        """Test that a configured token must be sent as a bearer token"""
+        app.config['METRICS_TOKEN'] = 'scrape-secret'
+        assert client.get('/metrics').status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'},
+                              environ_base={'REMOTE_ADDR': '203.0.113.9'})
+        assert response.status_code == 200
+
+    def test_only_loopback_without_token(self, app, client):
+        """Test that without a token remote scrapes are refused"""
+        assert client.get('/metrics').status_code == 200
+        response = client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.9'})
+        assert response.status_code == 403
@@ -0,0 +1,91 @@
+import pytest
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models.user import User
+from app.services.passwords import passwords
+
+class TestPasswordHasher:
+    @pytest.mark.parametrize('algorithm, prefix', [
+        ('bcrypt', '$2b$04$'),
+        ('pbkdf2:sha256', 'pbkdf2:sha256:1000$'),
+        ('scrypt', 'scrypt:')
+    ])
+    def test_hash_and_verify(self, app, algorithm, prefix):
+        """Test that every algorithm hashes and verifies"""
+        app.config['PASSWORD_HASH_ALGORITHM'] = algorithm
+        app.config['PASSWORD_PBKDF2_ITERATIONS'] = 1000
+
+        password_hash = passwords.hash('Secret123')
+        assert password_hash.startswith(prefix)
+        assert passwords.verify(password_hash, 'Secret123')
+        assert not passwords.verify(password_hash, 'Wrong123')
+        assert not passwords.needs_rehash(password_hash)
+
+    def test_needs_rehash(self, app):
+        """Test that other algorithms and costs are flagged for upgrade"""
+        old_bcrypt = passwords.hash('Secret123')
+        app.config['PASSWORD_BCRYPT_ROUNDS'] = 5
+        assert passwords.needs_rehash(old_bcrypt)
+        assert passwords.needs_rehash(generate_password_hash('Secret123', method='pbkdf2:sha256:1000'))
+
+        app.config['PASSWORD_HASH_ALGORITHM'] = 'pbkdf2:sha256'
+        app.config['PASSWORD_PBKDF2_ITERATIONS'] = 2000
+        assert passwords.needs_rehash(old_bcrypt)
+        assert passwords.needs_rehash(generate_password_hash('Secret123', method='pbkdf2:sha256:1000'))
+        assert not passwords.needs_rehash(generate_password_hash('Secret123', method='pbkdf2:sha256:2000'))
+
+    def test_invalid_hash_does_not_verify(self, app):
+        """Test that a malformed stored hash fails instead of raising"""
+        assert not passwords.verify('$2b$04$broken', 'Secret123')
+        assert not passwords.verify('', 'Secret123')
+
+    def test_offload_to_executor(self, app):
+        """Test that hashing runs in the worker pool when offloading is on"""
+        app.config['PASSWORD_HASH_OFFLOAD'] = True
+        password_hash = passwords.hash('Secret123')
+        assert passwords.verify(password_hash, 'Secret123')
+        assert passwords._executor is not None
+
+class TestUpgradeOnLogin:
+    def test_login_upgrades_old_hash(self, app, client):
+        """Test that a hash with outdated settings is replaced after login"""
+        client.post('/api/auth/register', json={
+            'username': 'olduser',
+            'email': 'old@example.com',
+            'password': 'OldPassword123',
+            'display_name': 'Old User'
+        })
+        user = User.query.filter_by(username='olduser').first()
+        user.password_hash = generate_password_hash('OldPassword123', method='pbkdf2:sha256:1000')
+        db.session.commit()
+        rehashed = passwords.rehashed_total
+
+        response = client.post('/api/auth/login', json={'username': 'olduser', 'password': 'OldPassword123'})
+        assert response.status_code == 200
+
+        db.session.expire_all()
+        user = User.query.filter_by(username='olduser').first()
+        assert user.password_hash.startswith('$2b$04$')
+        assert passwords.rehashed_total == rehashed + 1
+
+        # The upgraded hash still logs in, and isn't upgraded again
+        response = client.post('/api/auth/login', json={'username': 'olduser', 'password': 'OldPassword123'})
+        assert response.status_code == 200
+        assert passwords.rehashed_total == rehashed + 1
+
+    def test_failed_login_keeps_hash(self, app, client):
+        """Test that a wrong password never rewrites the stored hash"""
+        client.post('/api/auth/register', json={
+            'username': 'keepuser',
+            'email': 'keep@example.com',
+            'password': 'KeepPassword123',
+            'display_name': 'Keep User'
+        })
+        user = User.query.filter_by(username='keepuser').first()
+        user.password_hash = generate_password_hash('KeepPassword123', method='pbkdf2:sha256:1000')
+        db.session.commit()
+
+        response = client.post('/api/auth/login', json={'username': 'keepuser', 'password': 'Wrong123'})
+        assert response.status_code == 401
+        db.session.expire_all()
+        assert User.query.filter_by(username='keepuser').first().password_hash.startswith('pbkdf2:')
@@ -0,0 +1,56 @@
+from app import db
+from app.models.user import User
+from app.services.presence import PresenceService, presence
+
+class TestPresence:
+    def test_connections_are_reference_counted(self, client, auth_headers):
+        """Test that a user stays online until their last sid disconnects"""
+        user = User.query.filter_by(username='testuser').first()
+        
+        assert presence.connect(user.id) == 1
+        assert presence.connect(user.id) == 2
+        assert presence.disconnect(user.id) == 1
+        assert presence.is_online(user.id)
+        
+        response = client.get('/api/stats')
+        assert response.get_json()['online_users'] == 1
+        
+        assert presence.disconnect(user.id) == 0
+        assert not presence.is_online(user.id)
+        assert client.get('/api/stats').get_json()['online_users'] == 0
+    
+    def test_bulk_lookup(self, client, auth_headers):
+        """Test looking up presence for several users in one call"""
+        user = User.query.filter_by(username='testuser').first()
+        presence.connect(user.id)
+        
+        assert client.get(f'/api/presence?user_ids={user.id}').status_code == 401
+        
+        response = client.get(f'/api/presence?user_ids={user.id},9999', headers=auth_headers)
+        data = response.get_json()['presence']
+        assert data[str(user.id)]['is_online'] is True
+        assert data[str(user.id)]['last_seen'] is not None
+        assert data['9999'] == {'is_online': False, 'last_seen': None}
+    
+    def test_flush_writes_batched_updates(self, app, client, auth_headers):
+        """Test that presence reaches SQL only when flushed"""
+        user = User.query.filter_by(username='testuser').first()
+        presence.connect(user.id)
+        db.session.expire_all()
+        assert User.query.get(user.id).is_online is False
+        
+        assert presence.flush() == 1
+        db.session.expire_all()
+        assert User.query.get(user.id).is_online is True
+    
+    def test_dead_node_is_reaped(self, app, client, auth_headers):
+        """Test that connections of a node that stopped heartbeating are released"""
+        user = User.query.filter_by(username='testuser').first()
+        dead = PresenceService(app, presence.redis)
+        dead.connect(user.id)
+        dead.heartbeat()
+        assert presence.is_online(user.id)
+        
+        app.config['PRESENCE_NODE_TIMEOUT'] = -1
+        presence.heartbeat()
+        assert not presence.is_online(user.id)
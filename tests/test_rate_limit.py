@@ -0,0 +1,147 @@
+import pytest
+import redis
+from app import socketio
+from app.services.rate_limit import rate_limiter
+
+@pytest.fixture
+def limits(app):
+    """Turn rate limiting on with small limits"""
+    def configure(**limits):
+        app.config['RATE_LIMIT_ENABLED'] = True
+        app.config['RATE_LIMITS'] = limits
+        rate_limiter.reset()
+    return configure
+
+class TestRateLimiter:
+    def test_bucket_refuses_after_burst(self, app, limits):
+        """Test that a bucket allows its burst, then refuses with a retry time"""
+        limits(send_message={'rate': 1, 'burst': 20})
+        results = [rate_limiter.hit('send_message', 1) for _ in range(21)]
+        assert all(allowed for allowed, _ in results[:20])
+        allowed, retry_after = results[20]
+        assert not allowed
+        assert 0 < retry_after <= 1
+
+        # Other keys have their own buckets
+        assert rate_limiter.hit('send_message', 2)[0]
+
+    def test_leases_save_round_trips(self, app, limits):
+        """Test that most checks are answered without Redis"""
+        limits(send_message={'rate': 1, 'burst': 100})
+        for _ in range(50):
+            assert rate_limiter.hit('send_message', 1)[0]
+        assert rate_limiter.round_trips == 5
+
+    def test_buckets_are_shared_between_nodes(self, app, limits, redis_server):
+        """Test that leases taken by another node count against the same bucket"""
+        limits(login={'rate': 0.01, 'burst': 10})
+        for _ in range(10):
+            assert rate_limiter.hit('login', '10.0.0.1')[0]
+
+        # A fresh process sees the same, empty bucket
+        rate_limiter.reset()
+        assert not rate_limiter.hit('login', '10.0.0.1')[0]
+        assert rate_limiter.stats()['rejected_all_nodes'] == {'login': 1}
+
+    def test_cost(self, app, limits):
+        """Test that a cost takes several tokens, and a cost over the burst is refused"""
+        limits(send_message={'rate': 1, 'burst': 10})
+        assert rate_limiter.hit('send_message', 1, cost=8)[0]
+        assert not rate_limiter.hit('send_message', 1, cost=8)[0]
+        assert not rate_limiter.hit('send_message', 2, cost=11)[0]
+
+    def test_unconfigured_or_disabled(self, app, limits):
+        """Test that limits without config, or with limiting off, always allow"""
+        limits()
+        assert all(rate_limiter.hit('send_message', 1)[0] for _ in range(100))
+        app.config['RATE_LIMIT_ENABLED'] = False
+        app.config['RATE_LIMITS'] = {'send_message': {'rate': 1, 'burst': 1}}
+        assert all(rate_limiter.hit('send_message', 1)[0] for _ in range(100))
+
+    def test_fails_open(self, app, limits, monkeypatch):
+        """Test that a Redis outage lets calls through"""
+        limits(send_message={'rate': 1, 'burst': 1})
+
+        def fail(*args, **kwargs):
+            raise redis.ConnectionError('down')
+        monkeypatch.setattr(rate_limiter, '_take', fail)
+        assert all(rate_limiter.hit('send_message', 1)[0] for _ in range(5))
+
+    def test_leases_are_bounded(self, app, limits):
+        """Test that the least recently used leases are dropped past the limit"""
+        limits(login={'rate': 1, 'burst': 10})
+        app.config['RATE_LIMIT_MAX_LEASES'] = 3
+        for address in ['10.0.0.1', '10.0.0.2', '10.0.0.3']:
+            assert rate_limiter.hit('login', address)[0]
+        assert rate_limiter.hit('login', '10.0.0.1')[0]
+        assert rate_limiter.hit('login', '10.0.0.4')[0]
+
+        assert rate_limiter.stats()['leases'] == 3
+        assert 'rate:login:10.0.0.2' not in rate_limiter._leases
+        assert 'rate:login:10.0.0.1' in rate_limiter._leases
+
+class TestRouteLimits:
+    def test_login_returns_429(self, client, auth_headers, limits):
+        """Test that too many logins from one address get a 429 with Retry-After"""
+        limits(login={'rate': 0.01, 'burst': 2})
+        credentials = {'username': 'testuser', 'password': 'TestPassword123'}
+        for _ in range(2):
+            assert client.post('/api/auth/login', json=credentials).status_code == 200
+
+        response = client.post('/api/auth/login', json=credentials)
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        assert response.get_json()['error'] == 'Rate limit exceeded'
+
+        stats = client.get('/api/stats').get_json()['rate_limits']
+        assert stats['allowed']['login'] == 2
+        assert stats['rejected']['login'] == 1
+
+    def test_forwarded_headers_not_trusted(self, client, auth_headers, limits):
+        """Test that a client can't pick its own bucket with proxy headers"""
+        limits(login={'rate': 0.01, 'burst': 1})
+        credentials = {'username': 'testuser', 'password': 'TestPassword123'}
+        assert client.post('/api/auth/login', json=credentials).status_code == 200
+        for spoofed in ['10.0.0.1', '10.0.0.2']:
+            response = client.post('/api/auth/login', json=credentials,
+                                   headers={'X-Real-IP': spoofed, 'X-Forwarded-For': spoofed})
+            assert response.status_code == 429
+
+        # A different socket address is a different client
+        response = client.post('/api/auth/login', json=credentials,
+                               environ_base={'REMOTE_ADDR': '10.0.0.3'})
+        assert response.status_code == 200
+
+    def test_rest_send_limited_per_user(self, client, auth_headers, limits):
+        """Test that REST sends draw on the sender's bucket"""
+        room_id = client.post('/api/chat/rooms', json={'name': 'Limited Room'},
+                              headers=auth_headers).get_json()['room']['id']
+        limits(send_message={'rate': 0.01, 'burst': 1})
+        url = f'/api/chat/rooms/{room_id}/messages'
+        assert client.post(url, json={'content': 'one'}, headers=auth_headers).status_code == 201
+        assert client.post(url, json={'content': 'two'}, headers=auth_headers).status_code == 429
+
+class TestSocketLimits:
+    def test_send_message_limited(self, app, client, auth_headers, limits):
+        """Test that a socket flooding a room is refused with an error"""
+        room_id = client.post('/api/chat/rooms', json={'name': 'Flood Room'},
+                              headers=auth_headers).get_json()['room']['id']
+        token = auth_headers['Authorization'].split()[1]
+        socketio_client = socketio.test_client(app, auth={'token': token}, flask_test_client=client)
+        socketio_client.emit('join_room', {'room_id': room_id})
+        socketio_client.get_received()
+        limits(send_message={'rate': 0.01, 'burst': 2})
+
+        for i in range(3):
+            socketio_client.emit('send_message', {'room_id': room_id, 'content': f'Flood {i}'})
+        received = socketio_client.get_received()
+        assert [event['name'] for event in received].count('message') == 2
+        errors = [event for event in received if event['name'] == 'error']
+        assert len(errors) == 1
+
+        # Batches draw on the same bucket
+        ack = socketio_client.emit('send_messages', {'room_id': room_id, 'messages': [
+            {'client_id': 'a', 'content': 'A'}
+        ]}, callback=True)
+        assert ack['error'] == 'Rate limit exceeded'
+        socketio_client.disconnect()
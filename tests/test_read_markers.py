@@ -0,0 +1,90 @@
+import pytest
+from app import socketio
+from app.models.message import RoomMember
+from app.services.read_markers import read_markers
+
+class TestReadMarkers:
+    @pytest.fixture
+    def reader(self, client):
+        response = client.post('/api/auth/register', json={
+            'username': 'reader',
+            'email': 'reader@example.com',
+            'password': 'TestPassword123',
+            'display_name': 'Reader'
+        })
+        data = response.get_json()
+        return data['user']['id'], data['access_token']
+    
+    @pytest.fixture
+    def room_id(self, client, auth_headers, reader, room_id):
+        client.post(f'/api/chat/rooms/{room_id}/members', json={'user_id': reader[0]}, headers=auth_headers)
+        return room_id
+    
+    def _send(self, client, auth_headers, room_id, count):
+        return [client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': f'News {i}'},
+                            headers=auth_headers).get_json()['data'] for i in range(count)]
+    
+    def test_unread_counts_follow_sends_and_marks(self, app, client, auth_headers, reader, room_id):
+        """Test that unread counts grow with sends and shrink with mark_read"""
+        reader_id, token = reader
+        messages = self._send(client, auth_headers, room_id, 3)
+        reader_headers = {'Authorization': f'Bearer {token}'}
+        
+        data = client.get('/api/chat/unread', headers=reader_headers).get_json()
+        assert data == {'unread': {str(room_id): 3}, 'total': 3}
+        # Senders have read their own messages
+        assert client.get('/api/chat/unread', headers=auth_headers).get_json()['total'] == 0
+        
+        sio = socketio.test_client(app, auth={'token': token}, flask_test_client=client)
+        ack = sio.emit('mark_read', {'room_id': room_id, 'message_id': messages[1]['id']}, callback=True)
+        assert ack == {'room_id': room_id, 'seq': messages[1]['seq'], 'advanced': True}
+        
+        # Going backwards is ignored
+        ack = sio.emit('mark_read', {'room_id': room_id, 'message_id': messages[0]['id'],
+                                     'seq': messages[0]['seq']}, callback=True)
+        assert ack['advanced'] is False
+        
+        # A seq past the last message is capped, so later messages stay unread
+        ack = sio.emit('mark_read', {'room_id': room_id, 'message_id': messages[2]['id'],
+                                     'seq': 10 ** 9}, callback=True)
+        assert ack['seq'] == messages[2]['seq']
+        sio.disconnect()
+        self._send(client, auth_headers, room_id, 1)
+        
+        assert client.get('/api/chat/unread', headers=reader_headers).get_json()['unread'] == {str(room_id): 1}
+        rooms = client.get('/api/chat/rooms/mine', headers=reader_headers).get_json()['rooms']
+        assert rooms[0]['unread_count'] == 1
+    
+    def test_markers_flush_and_reload(self, app, client, auth_headers, reader, room_id, count_queries):
+        """Test that markers reach SQL in a batch and survive losing Redis"""
+        reader_id, _ = reader
+        messages = self._send(client, auth_headers, room_id, 4)
+        read_markers.mark_read(reader_id, room_id, messages[2]['seq'], messages[2]['id'])
+        
+        assert read_markers.flush() >= 1
+        member = RoomMember.query.filter_by(room_id=room_id, user_id=reader_id).one()
+        assert (member.last_read_seq, member.last_read_message_id) == (messages[2]['seq'], messages[2]['id'])
+        
+        # Once loaded, counts need no SQL
+        read_markers.unread_counts(reader_id)
+        with count_queries() as counter:
+            assert read_markers.unread_counts(reader_id) == {room_id: 1}
+        assert counter.count == 0
+        
+        read_markers.redis.delete(f'read_markers:{reader_id}', f'room_seq:{room_id}')
+        assert read_markers.unread_counts(reader_id) == {room_id: 1}
+    
+    def test_mark_read_requires_membership(self, app, client, room_id):
+        """Test that non-members can't move markers"""
+        response = client.post('/api/auth/register', json={
+            'username': 'stranger',
+            'email': 'stranger@example.com',
+            'password': 'TestPassword123',
+            'display_name': 'Stranger'
+        })
+        sio = socketio.test_client(app, auth={'token': response.get_json()['access_token']},
+                                   flask_test_client=client)
+        sio.get_received()
+        sio.emit('mark_read', {'room_id': room_id, 'message_id': 1, 'seq': 1})
+        assert [r['name'] for r in sio.get_received()] == ['error']
+        sio.disconnect()
@@ -0,0 +1,84 @@
+import json
+import pytest
+from engineio.packet import CLOSE
+from engineio.socket import Socket
+from werkzeug.test import EnvironBuilder
+from app import socketio
+from app.models.message import Message
+from app.services.sessions import user_sessions
+from app.services.write_behind import write_behind
+from app.utils.lifecycle import disconnect_clients, shutdown_services
+import serve
+from serve import check_message_queue, worker_class
+
+class TestLauncher:
+    def test_worker_class_follows_async_mode(self):
+        """Test that each async mode maps to its gunicorn worker"""
+        assert worker_class('eventlet') == 'eventlet'
+        assert worker_class('gevent') == 'gevent'
+        assert worker_class('threading') == 'gthread'
+        with pytest.raises(ValueError):
+            worker_class('asyncio')
+
+    def test_message_queue_check(self, redis_server):
+        """Test that an unreachable message queue fails the startup check"""
+        check_message_queue('redis://localhost:6379/0')
+        check_message_queue(None)
+
+        redis_server.connected = False
+        with pytest.raises(RuntimeError, match='unreachable'):
+            check_message_queue('redis://localhost:6379/0')
+
+    def test_instances_run_production_config(self, monkeypatch):
+        """Test that instances get the chosen config rather than the caller's FLASK_ENV"""
+        started = []
+        monkeypatch.setattr(serve.subprocess, 'Popen', lambda command, env, **kwargs: started.append(env))
+        monkeypatch.setenv('FLASK_ENV', 'development')
+
+        serve.start_instance('127.0.0.1', 5001, 'run:app', 'production')
+        assert started[0]['FLASK_ENV'] == 'production'
+        assert started[0]['GUNICORN_BIND'] == '127.0.0.1:5001'
+
+    def test_async_mode_from_config(self, app):
+        """Test that Socket.IO runs in the configured async mode"""
+        assert socketio.async_mode == app.config['SOCKETIO_ASYNC_MODE']
+
+class TestShutdown:
+    def test_shutdown_flushes_queued_messages(self, app, client, auth_headers, room_id):
+        """Test that messages still queued for write-behind are written on shutdown"""
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        for i in range(3):
+            client.post(f'/api/chat/rooms/{room_id}/messages',
+                        json={'content': f'Pending {i}'}, headers=auth_headers)
+        assert Message.query.count() == 0
+
+        shutdown_services()
+        assert write_behind.queue_depth == 0
+        assert Message.query.count() == 3
+
+    def test_disconnect_clients_closes_local_sessions(self, app, auth_headers):
+        """Test that every sid held by this process loses its transport"""
+        # The test client bypasses Engine.IO, so open sockets the way the
+        # server does for a real connection
+        token = auth_headers['Authorization'].split()[1]
+        eio = socketio.server.eio
+        sockets = []
+        for _ in range(2):
+            socket = Socket(eio, eio.generate_id())
+            eio.sockets[socket.sid] = socket
+            environ = EnvironBuilder('/socket.io/').get_environ()
+            environ['flask.app'] = app
+            eio._trigger_event('connect', socket.sid, environ, run_async=False)
+            eio._trigger_event('message', socket.sid, '0' + json.dumps({'token': token}), run_async=False)
+            sockets.append(socket)
+        assert len(user_sessions) == 2
+
+        assert disconnect_clients() == 2
+        for socket in sockets:
+            assert socket.closed
+            assert socket.sid not in eio.sockets
+            # A transport close, not a Socket.IO disconnect, so clients reconnect
+            packets = list(iter(socket.queue.get_nowait, None))
+            assert packets[-1].packet_type == CLOSE
+            assert not any(str(packet.data).startswith('1') for packet in packets)
+        assert len(user_sessions) == 0
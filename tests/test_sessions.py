@@ -0,0 +1,41 @@
+import pytest
+from app.services.sessions import SessionStore, UserSession
+
+class TestSessionStore:
+    @pytest.fixture
+    def store(self, app):
+        import app as app_module
+        return SessionStore(app, app_module.redis_client)
+    
+    def test_get_reads_local_copy(self, store):
+        """Test that handlers read sessions without a Redis round trip"""
+        store.create('sid-1', 7, 'alice', 'Alice')
+        store.redis.delete('user_session:sid-1')
+        
+        session = store.get('sid-1')
+        assert isinstance(session, UserSession)
+        assert (session.user_id, session.username, session.display_name) == (7, 'alice', 'Alice')
+    
+    def test_falls_back_to_redis(self, store):
+        """Test that a session only known to Redis is decoded once and cached"""
+        store.redis.hset('user_session:sid-2', mapping={
+            'user_id': 3, 'username': 'bob', 'display_name': 'Bob'
+        })
+        
+        session = store.get('sid-2')
+        assert session.user_id == 3
+        assert session.username == 'bob'
+        assert len(store) == 1
+    
+    def test_update_user_and_remove(self, store):
+        """Test profile updates reach every sid of a user"""
+        store.create('sid-a', 5, 'carol', 'Carol')
+        store.create('sid-b', 5, 'carol', 'Carol')
+        
+        store.update_user(5, display_name='Caroline')
+        assert store.get('sid-a').display_name == 'Caroline'
+        assert store.redis.hget('user_session:sid-b', 'display_name') == b'Caroline'
+        
+        assert store.remove('sid-a').sid == 'sid-a'
+        assert store.get('sid-a') is None
+        assert store.get('sid-b') is not None
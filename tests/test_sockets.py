@@ -1,40 +1,193 @@
+import msgpack
 import pytest
-from flask_socketio import SocketIOTestClient
-import socketio
+from app import socketio
+from app.models.message import Message
 
-import app
+@pytest.fixture
+def socketio_client(app, client, auth_headers):
+    token = auth_headers['Authorization'].split()[1]
+    socketio_client = socketio.test_client(app, auth={'token': token}, flask_test_client=client)
+    yield socketio_client
+    if socketio_client.is_connected():
+        socketio_client.disconnect()
 
-def test_websocket_connection():
-    socketio_client = SocketIOTestClient(app, socketio)
-    
+def first_arg(event):
+    # The test client delivers single arguments either bare or in a list
+    args = event['args']
+    return args[0] if isinstance(args, list) else args
+
+def test_websocket_connection(socketio_client):
     # Test connection
+    assert socketio_client.is_connected()
     received = socketio_client.get_received()
-    assert len(received) == 0
-    
-def test_join_room_event():
-    socketio_client = SocketIOTestClient(app, socketio)
-    
+    assert [r['name'] for r in received] == ['connected']
+
+def test_connection_requires_token(app, client):
+    socketio_client = socketio.test_client(app, flask_test_client=client)
+    assert not socketio_client.is_connected()
+
+def test_join_room_event(socketio_client, room_id):
+    socketio_client.get_received()
+
     # Emit join_room event
-    socketio_client.emit('join_room', {'room_id': 1, 'token': 'valid_token'})
-    
+    socketio_client.emit('join_room', {'room_id': room_id})
+
     # Check for acknowledgment
     received = socketio_client.get_received()
-    assert len(received) > 0
+    names = [r['name'] for r in received]
+    assert 'user_joined' in names
+    assert 'room_joined' in names
 
-def test_send_message_event():
-    socketio_client = SocketIOTestClient(app, socketio)
-    
+def test_send_message_event(socketio_client, room_id):
     # Join room first
-    socketio_client.emit('join_room', {'room_id': 1, 'token': 'valid_token'})
-    
+    socketio_client.emit('join_room', {'room_id': room_id})
+    socketio_client.get_received()
+
     # Send message
     socketio_client.emit('send_message', {
-        'room_id': 1,
-        'content': 'Hello World',
-        'token': 'valid_token'
+        'room_id': room_id,
+        'content': 'Hello World'
     })
-    
+
     # Verify message was broadcast
     received = socketio_client.get_received()
     message_events = [r for r in received if r['name'] == 'message']
-    assert len(message_events) > 0
\ No newline at end of file
+    assert len(message_events) == 1
+    assert message_events[0]['args']['content'] == 'Hello World'
+
+def test_compact_wire_format(app, client, auth_headers, socketio_client, room_id):
+    token = auth_headers['Authorization'].split()[1]
+    compact_client = socketio.test_client(app, auth={'token': token, 'format': 'compact'},
+                                          flask_test_client=client)
+    assert first_arg(compact_client.get_received()[0])['format'] == 'compact'
+
+    socketio_client.emit('join_room', {'room_id': room_id})
+    compact_client.emit('join_room', {'room_id': room_id})
+    received = compact_client.get_received()
+    assert first_arg([r for r in received if r['name'] == 'room_users'][0])['users'] == {}
+    socketio_client.get_received()
+
+    socketio_client.emit('send_message', {'room_id': room_id, 'content': 'Packed'})
+
+    # JSON clients keep the full dictionary
+    json_events = [r for r in socketio_client.get_received() if r['name'] == 'message']
+    assert first_arg(json_events[0])['display_name'] == 'Test User'
+
+    # Compact clients get the name once, then short keys without names
+    received = compact_client.get_received()
+    assert [r['name'] for r in received] == ['room_user', 'message']
+    assert first_arg(received[0])['d'] == 'Test User'
+    message = msgpack.unpackb(first_arg(received[1]))
+    assert message['c'] == 'Packed'
+    assert message['r'] == room_id
+    assert isinstance(message['t'], int)
+    assert 'm' not in message and 'e' not in message
+
+    socketio_client.emit('send_message', {'room_id': room_id, 'content': 'Again'})
+    assert [r['name'] for r in compact_client.get_received()] == ['message']
+    compact_client.disconnect()
+
+def test_send_messages_batch(socketio_client, room_id, count_queries):
+    socketio_client.emit('join_room', {'room_id': room_id})
+    socketio_client.get_received()
+
+    batch = {'room_id': room_id, 'messages': [
+        {'client_id': 'a1', 'content': 'First'},
+        {'client_id': 'a2', 'content': 'Second'},
+        {'client_id': 'a3', 'content': 'Third'}
+    ]}
+    ack = socketio_client.emit('send_messages', batch, callback=True)
+    assert [a['client_id'] for a in ack['acks']] == ['a1', 'a2', 'a3']
+    assert not any(a['duplicate'] for a in ack['acks'])
+    ids = [a['id'] for a in ack['acks']]
+    assert ids == sorted(ids)
+
+    # One broadcast for the whole batch
+    received = [r for r in socketio_client.get_received() if r['name'] == 'messages']
+    assert len(received) == 1
+    assert [m['content'] for m in first_arg(received[0])['messages']] == ['First', 'Second', 'Third']
+
+    # A retry after a reconnect is acknowledged without another write
+    batch['messages'].append({'client_id': 'a4', 'content': 'Fourth'})
+    with count_queries() as counter:
+        retry = socketio_client.emit('send_messages', batch, callback=True)
+    assert [a['id'] for a in retry['acks']][:3] == ids
+    assert [a['duplicate'] for a in retry['acks']] == [True, True, True, False]
+    # Membership is checked in Redis, so only the new message is written
+    assert counter.count == 1
+    assert Message.query.count() == 4
+    received = [r for r in socketio_client.get_received() if r['name'] == 'messages']
+    assert [m['content'] for m in first_arg(received[0])['messages']] == ['Fourth']
+
+def test_send_messages_rejects_invalid_batch(socketio_client, room_id):
+    ack = socketio_client.emit('send_messages', {'room_id': room_id, 'messages': [
+        {'client_id': 'b1', 'content': 'Fine'},
+        {'client_id': 'b2', 'content': '   '}
+    ]}, callback=True)
+    assert ack == {'error': 'Message cannot be empty'}
+
+    # Nothing from the rejected batch was stored or claimed
+    ack = socketio_client.emit('send_messages', {'room_id': room_id, 'messages': [
+        {'client_id': 'b1', 'content': 'Fine'}
+    ]}, callback=True)
+    assert ack['acks'][0]['duplicate'] is False
+
+def test_messages_get_room_sequence_numbers(client, auth_headers, room_id):
+    seqs = []
+    for i in range(3):
+        response = client.post(f'/api/chat/rooms/{room_id}/messages',
+                               json={'content': f'Seq {i}'}, headers=auth_headers)
+        seqs.append(response.get_json()['data']['seq'])
+    assert seqs == [1, 2, 3]
+
+    other = client.post('/api/chat/rooms', json={'name': 'Other Room'}, headers=auth_headers)
+    response = client.post(f"/api/chat/rooms/{other.get_json()['room']['id']}/messages",
+                           json={'content': 'Elsewhere'}, headers=auth_headers)
+    assert response.get_json()['data']['seq'] == 1
+
+def test_resume_replays_missed_messages(app, client, auth_headers, room_id):
+    token = auth_headers['Authorization'].split()[1]
+    for i in range(5):
+        client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': f'Missed {i}'}, headers=auth_headers)
+
+    def replay_after(last_seq):
+        sio = socketio.test_client(app, auth={'token': token, 'resume': {str(room_id): last_seq}},
+                                   flask_test_client=client)
+        received = sio.get_received()
+        sio.disconnect()
+        replays = [first_arg(r) for r in received if r['name'] == 'replay']
+        assert len(replays) == 1
+        return replays[0]['rooms'][0]
+
+    # Cold history ring: replayed from the database
+    replayed = replay_after(2)
+    assert [m['content'] for m in replayed['messages']] == ['Missed 2', 'Missed 3', 'Missed 4']
+    assert replayed['has_more'] is False
+
+    # Warm ring gives the same answer
+    client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+    assert replay_after(2) == replayed
+
+    # Rejoined, so new messages are delivered to the resumed socket
+    sio = socketio.test_client(app, auth={'token': token, 'resume': {str(room_id): 5}}, flask_test_client=client)
+    sio.get_received()
+    client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': 'Live'}, headers=auth_headers)
+    sio.emit('send_message', {'room_id': room_id, 'content': 'Live socket'})
+    assert [first_arg(r)['seq'] for r in sio.get_received() if r['name'] == 'message'] == [7]
+    sio.disconnect()
+
+def test_join_room_replay_is_capped(app, socketio_client, client, auth_headers, room_id):
+    app.config['REPLAY_MAX_MESSAGES'] = 2
+    for i in range(5):
+        client.post(f'/api/chat/rooms/{room_id}/messages', json={'content': f'Gap {i}'}, headers=auth_headers)
+    socketio_client.get_received()
+
+    socketio_client.emit('join_room', {'room_id': room_id, 'last_seq': 1})
+    replay = [first_arg(r) for r in socketio_client.get_received() if r['name'] == 'replay'][0]['rooms'][0]
+    assert [m['seq'] for m in replay['messages']] == [2, 3]
+    assert replay['has_more'] is True
+
+    socketio_client.emit('resume', {'rooms': {str(room_id): 3}})
+    replay = [first_arg(r) for r in socketio_client.get_received() if r['name'] == 'replay'][0]['rooms'][0]
+    assert [m['seq'] for m in replay['messages']] == [4, 5]
+    assert replay['has_more'] is False
@@ -0,0 +1,51 @@
+import time
+import pytest
+from app import socketio
+from app.services.typing import TypingAggregator
+
+class TestTypingAggregator:
+    @pytest.fixture
+    def emitted(self, monkeypatch):
+        events = []
+        monkeypatch.setattr(socketio, 'emit', lambda event, data, **kwargs: events.append((event, data, kwargs)))
+        return events
+    
+    @pytest.fixture
+    def aggregator(self, app):
+        aggregator = TypingAggregator(app)
+        # Drive ticks by hand instead of from a background task
+        aggregator._running = True
+        return aggregator
+    
+    def test_keystrokes_collapse_into_one_broadcast(self, aggregator, emitted):
+        """Test that many typing events produce one update per room"""
+        for _ in range(20):
+            aggregator.update(1, 'alice', True)
+        aggregator.update(1, 'bob', True)
+        
+        assert aggregator.tick() == 1
+        assert emitted == [('typing_update', {'room_id': '1', 'started': ['alice', 'bob'], 'stopped': []}, {'to': '1'})]
+        assert aggregator.stats()['suppressed_total'] == 20
+        
+        # Still typing: nothing new to announce
+        aggregator.update(1, 'alice', True)
+        assert aggregator.tick() == 0
+    
+    def test_flicker_within_tick_is_dropped(self, aggregator, emitted):
+        """Test that start/stop inside one window sends nothing"""
+        aggregator.update(2, 'carol', True)
+        aggregator.update(2, 'carol', False)
+        
+        assert aggregator.tick() == 0
+        assert emitted == []
+    
+    def test_stale_typing_expires(self, app, aggregator, emitted):
+        """Test that silent typists are reported as stopped"""
+        app.config['TYPING_TIMEOUT'] = 0.01
+        aggregator.update(3, 'dave', True)
+        aggregator.tick()
+        
+        time.sleep(0.02)
+        assert aggregator.tick() == 1
+        assert emitted[-1][1] == {'room_id': '3', 'started': [], 'stopped': ['dave']}
+        assert aggregator.typing_in(3) == []
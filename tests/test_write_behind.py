@@ -0,0 +1,108 @@
+import json
+from datetime import datetime
+from app import db
+from app.models.message import ArchivedMessage, Message
+from app.services.write_behind import DEAD_LETTER_KEY, write_behind
+
+class TestWriteBehind:
+    def test_send_message_is_deferred(self, app, client, auth_headers, room_id):
+        """Test that messages get an ID before they are written"""
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        
+        response = client.post(f'/api/chat/rooms/{room_id}/messages',
+                               json={'content': 'Hello later'}, headers=auth_headers)
+        assert response.status_code == 201
+        
+        data = response.get_json()['data']
+        assert data['id'] is not None
+        assert data['username'] == 'testuser'
+        assert Message.query.count() == 0
+        assert write_behind.queue_depth == 1
+        
+        assert write_behind.flush() == 1
+        message = db.session.get(Message, data['id'])
+        assert message.content == 'Hello later'
+        assert write_behind.queue_depth == 0
+    
+    def test_flush_writes_batch(self, app, client, auth_headers, room_id):
+        """Test that several queued messages are written in one flush"""
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        
+        ids = []
+        for i in range(5):
+            response = client.post(f'/api/chat/rooms/{room_id}/messages',
+                                   json={'content': f'Message {i}'}, headers=auth_headers)
+            ids.append(response.get_json()['data']['id'])
+        
+        assert len(set(ids)) == 5
+        assert write_behind.flush() == 5
+        assert write_behind.stats()['batches_total'] >= 1
+        
+        response = client.get(f'/api/chat/rooms/{room_id}/messages', headers=auth_headers)
+        contents = [m['content'] for m in response.get_json()['messages']]
+        assert contents == [f'Message {i}' for i in range(5)]
+    
+    def test_ids_stay_ahead_of_existing_rows(self, app, client, auth_headers, room_id):
+        """Test that the ID sequence is seeded past existing messages"""
+        for i in range(3):
+            client.post(f'/api/chat/rooms/{room_id}/messages',
+                        json={'content': f'Direct {i}'}, headers=auth_headers)
+        
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        response = client.post(f'/api/chat/rooms/{room_id}/messages',
+                               json={'content': 'Queued'}, headers=auth_headers)
+        assert response.get_json()['data']['id'] > 3
+        assert write_behind.flush() == 1
+        assert Message.query.count() == 4
+    
+    def test_enqueue_many_reserves_consecutive_ids(self, app, room_id):
+        """Test that a batch gets consecutive IDs and lands in one flush"""
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        
+        payloads = write_behind.enqueue_many(['One', 'Two', 'Three'], user_id=1, room_id=room_id,
+                                             username='testuser', display_name='Test User')
+        ids = [payload['id'] for payload in payloads]
+        assert ids == list(range(ids[0], ids[0] + 3))
+        assert write_behind.queue_depth == 3
+        assert write_behind.flush() == 3
+        assert [m.content for m in Message.query.order_by(Message.id)] == ['One', 'Two', 'Three']
+    
+    def test_ids_reseeded_after_redis_loses_the_sequence(self, app, client, auth_headers, room_id):
+        """Test that a lost ID sequence is seeded again from the table and the archive"""
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        for i in range(2):
+            client.post(f'/api/chat/rooms/{room_id}/messages',
+                        json={'content': f'Before {i}'}, headers=auth_headers)
+        assert write_behind.flush() == 2
+        db.session.add(ArchivedMessage(id=50, content='Archived', user_id=1, room_id=room_id,
+                                       timestamp=datetime.utcnow(), seq=50))
+        db.session.commit()
+        
+        write_behind.redis.flushall()
+        response = client.post(f'/api/chat/rooms/{room_id}/messages',
+                               json={'content': 'After'}, headers=auth_headers)
+        assert response.get_json()['data']['id'] == 51
+        assert write_behind.flush() == 1
+    
+    def test_rejected_rows_are_dead_lettered(self, app, room_id):
+        """Test that one bad row doesn't hold back the rest of its batch or later ones"""
+        app.config['WRITE_BEHIND_ENABLED'] = True
+        dead_lettered = write_behind.stats()['dead_lettered_total']
+        payloads = write_behind.enqueue_many(['Taken', 'Free'], user_id=1, room_id=room_id,
+                                             username='testuser', display_name='Test User')
+        # Another writer already stored the first ID
+        db.session.add(Message(id=payloads[0]['id'], content='Other', user_id=1, room_id=room_id, seq=99))
+        db.session.commit()
+        
+        assert write_behind.flush() == 1
+        assert write_behind.queue_depth == 0
+        assert write_behind.stats()['dead_lettered_total'] == dead_lettered + 1
+        dead = [json.loads(row) for row in write_behind.redis.lrange(DEAD_LETTER_KEY, 0, -1)]
+        assert [row['content'] for row in dead] == ['Taken']
+        assert db.session.get(Message, payloads[1]['id']).content == 'Free'
+        
+        # The sequence moved past the collision
+        payload = write_behind.enqueue('Next', user_id=1, room_id=room_id,
+                                       username='testuser', display_name='Test User')
+        assert payload['id'] > payloads[1]['id']
+        assert write_behind.flush() == 1